@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""
+Benchmark of the scheduling loop of the WorkflowRunner : runs thousands of processes that do nothing and measures
+how long it takes, compared to the former loop that was sleeping 100ms when nothing had happened, and to batches of
+processes known to be short from a previous run. The last measure also writes the reports and the journal while the
+workflow runs, as tuttle run does : they are exported in the background.
+
+Usage : python benchmarks/bench_dispatch.py [nb_processes] [nb_workers]
+"""
+
+import logging
+import sys
+from os import chdir, getcwd
+from os.path import abspath, dirname
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time, sleep
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from tuttle.project_parser import ProjectParser
+from tuttle.tuttle_directories import TuttleDirectories
+from tuttle.workflow_runner import WorkflowRunner
+
+
+class NoopProcessor:
+    """ Creates the outputs and nothing else, so the benchmark only measures the cost of scheduling """
+    # This class must remain at module level because it is serialized
+    name = 'noop'
+
+    def static_check(self, process):
+        pass
+
+    def run(self, process, reserved_path, log_stdout, log_stderr):
+        for resource in process.iter_outputs():
+            open(resource._get_path(), 'w').close()
+
+
+class PollingWorkflowRunner(WorkflowRunner):
+    """ Behaves like the former runner : polls every 100ms instead of waiting to be notified """
+
+    def wait_for_completed_processes(self):
+        sleep(0.1)
+        return len(self._completed_processes) > 0
+
+
+def noop_project(nb_processes):
+    sections = ["file://out_{} <- ! noop".format(i) for i in range(nb_processes)]
+    return "\n\n".join(sections)
+
+
+def run_noop_workflow(runner_class, nb_processes, nb_workers, batches, reports):
+    pp = ProjectParser()
+    pp.wb._processors[NoopProcessor.name] = NoopProcessor()
+    pp.set_project(noop_project(nb_processes))
+    workflow = pp.parse_extend_and_check_project()
+    workflow.discover_resources()
+    TuttleDirectories.straighten_out_process_and_logs(workflow)
+    if reports:
+        workflow.export()
+    else:
+        # Writing reports is not part of the scheduling
+        workflow.export = lambda: None
+        workflow.export_progress = lambda processes, reports=True: None
+    runner = runner_class(nb_workers)
+    runner._lt.follow_process = lambda *args: None
+    # Don't flood the console with process headers
+    logging.getLogger('tuttle.workflow_runner').setLevel(logging.WARNING)
+    if batches:
+        durations = {process: 0.001 for process in workflow.iter_processes()}
+    else:
+        durations = None
+    start = time()
+    successes, failures = runner.run_parallel_workflow(workflow, durations=durations)
+    duration = time() - start
+    assert len(successes) == nb_processes and not failures
+    return duration
+
+
+def bench(runner_class, nb_processes, nb_workers, batches, reports):
+    tmp_dir = mkdtemp()
+    cwd = getcwd()
+    chdir(tmp_dir)
+    try:
+        return run_noop_workflow(runner_class, nb_processes, nb_workers, batches, reports)
+    finally:
+        chdir(cwd)
+        rmtree(tmp_dir)
+
+
+def main():
+    nb_processes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    nb_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print("Running {} no-op processes with {} workers".format(nb_processes, nb_workers))
+    for label, runner_class, batches, reports in (("polling every 100ms", PollingWorkflowRunner, False, False),
+                                                  ("waiting for completion", WorkflowRunner, False, False),
+                                                  ("batches", WorkflowRunner, True, False),
+                                                  ("batches with reports", WorkflowRunner, True, True)):
+        duration = bench(runner_class, nb_processes, nb_workers, batches, reports)
+        print("{:<24} : {:8.2f}s - {:6.2f}ms per process".format(label, duration,
+                                                                  1000.0 * duration / nb_processes))
+
+
+if __name__ == '__main__':
+    main()
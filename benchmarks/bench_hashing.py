@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""
+Benchmark of the signatures of big files, as computed during the discovery of the primary resources : one file after
+the other, read by blocks of 32 KB as tuttle did before, compared to compute_signatures(), that hashes the files in
+threads with bigger reads, or mapped in memory. The files are hashed once before the measures, so they come from the
+cache of the system and the benchmark measures the cost of hashing rather than the disk.
+
+Usage : python benchmarks/bench_hashing.py [nb_files] [size_in_MB]
+"""
+
+import sys
+from hashlib import sha1
+from os import chdir, getcwd, urandom
+from os.path import abspath, dirname
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from tuttle.resource import FileResource, compute_signatures
+
+
+def hash_by_32k_blocks(path):
+    checksum = sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(32768), b''):
+            checksum.update(chunk)
+    return "sha1:{}".format(checksum.hexdigest())
+
+
+def write_files(nb_files, size):
+    block = urandom(1024 * 1024)
+    for i in range(nb_files):
+        with open("file_{}".format(i), "wb") as f:
+            for _ in range(size):
+                f.write(block)
+
+
+def main():
+    nb_files = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    former_dir = getcwd()
+    tmp_dir = mkdtemp()
+    chdir(tmp_dir)
+    try:
+        write_files(nb_files, size)
+        # No .tuttle directory : the signatures are not cached
+        resources = [FileResource("file://file_{}".format(i)) for i in range(nb_files)]
+        compute_signatures(resources)
+        start = time()
+        serial = {resource.url: hash_by_32k_blocks(resource.url[len("file://"):]) for resource in resources}
+        serial_duration = time() - start
+        start = time()
+        parallel = compute_signatures(resources)
+        parallel_duration = time() - start
+        assert serial == parallel
+        print("Signatures of {} files of {} MB".format(nb_files, size))
+        print("{:<24} : {:6.2f}s".format("one by one, 32 KB reads", serial_duration))
+        print("{:<24} : {:6.2f}s".format("compute_signatures()", parallel_duration))
+    finally:
+        chdir(former_dir)
+        rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""
+Benchmark of the size of what is sent to a worker process to run a process : the whole process, that references
+the rest of the workflow through its resources, compared to the flat ProcessTask.
+
+Usage : python benchmarks/bench_task_size.py [nb_processes]
+"""
+
+import sys
+from cPickle import dumps, HIGHEST_PROTOCOL
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from tuttle.process import ProcessTask
+from tuttle.project_parser import ProjectParser
+
+
+def chain_project(nb_processes):
+    """ Each process depends on the previous one, so a process references all the processes before it """
+    sections = ["file://out_0 <- file://source\n    echo source > out_0"]
+    for i in range(1, nb_processes):
+        sections.append("file://out_{} <- file://out_{} file://source\n    cat out_{} > out_{}".format(i, i - 1, i - 1, i))
+    return "\n".join(sections)
+
+
+def pickled_sizes(objects):
+    # multiprocessing uses the highest protocol to send arguments to the workers
+    return [len(dumps([obj], HIGHEST_PROTOCOL)) for obj in objects]
+
+
+def main():
+    nb_processes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    # Pickling a process follows the chain of processes recursively
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100 * nb_processes))
+    pp = ProjectParser()
+    pp.set_project(chain_project(nb_processes))
+    workflow = pp.parse_extend_and_check_project()
+    processes = list(workflow.iter_processes())
+    print("Bytes pickled per task for a chain of {} processes".format(nb_processes))
+    for label, sizes in (("process", pickled_sizes(processes)),
+                         ("ProcessTask", pickled_sizes([ProcessTask(process) for process in processes]))):
+        print("{:<12} : mean {:10.0f} - max {:10d} - total {:12d}".format(label, float(sum(sizes)) / len(sizes),
+                                                                         max(sizes), sum(sizes)))
+
+
+if __name__ == '__main__':
+    main()
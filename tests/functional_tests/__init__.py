@@ -14,7 +14,9 @@ except ImportError:
     from io import StringIO
 
 
-def run_tuttle_file(content=None, threshold=-1, nb_workers=-1, keep_going=False, check_integrity=False):
+def run_tuttle_file(content=None, threshold=-1, nb_workers=-1, keep_going=False, check_integrity=False,
+                    targets=None, dry_run=False, fail_fast=False, jobserver=False,
+                    listen=None, shard=None, shard_timeout=None):
     if content is not None:
         with open('tuttlefile', "w") as f:
             f.write(content.encode("utf8"))
@@ -22,7 +24,10 @@ def run_tuttle_file(content=None, threshold=-1, nb_workers=-1, keep_going=False,
     out = StringIO()
     try:
         sys.stdout,sys.stderr = out, out
-        rcode = run('tuttlefile', threshold=threshold, nb_workers=nb_workers, keep_going=keep_going, check_integrity=check_integrity)
+        rcode = run('tuttlefile', threshold=threshold, nb_workers=nb_workers, keep_going=keep_going,
+                    check_integrity=check_integrity, targets=targets, dry_run=dry_run,
+                    fail_fast=fail_fast, jobserver=jobserver, listen=listen, shard=shard,
+                    shard_timeout=shard_timeout)
     finally:
         sys.stdout, sys.stderr = oldout, olderr
     return rcode, out.getvalue()
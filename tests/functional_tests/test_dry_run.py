@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import os
+from os.path import isfile, join
+from time import time
+
+from tests.functional_tests import isolate, run_tuttle_file
+
+
+def snapshot(directory='.'):
+    """ :return: the files of a directory and their size and modification time """
+    result = {}
+    for root, dirs, files in os.walk(directory):
+        for name in dirs + files:
+            path = join(root, name)
+            stat = os.stat(path)
+            result[path] = (stat.st_size, stat.st_mtime)
+    return result
+
+
+class TestDryRun:
+
+    project = """file://B <- file://A
+    echo A produces B > B
+
+file://C <- file://B
+    echo B produces C > C
+"""
+
+    @isolate(['A'])
+    def test_dry_run_does_not_run(self):
+        """ A dry run should show the processes that would run without running them """
+        rcode, output = run_tuttle_file(self.project, dry_run=True)
+        assert rcode == 0, output
+        assert not isfile('B'), output
+        assert output.find("The following 2 process(es) would run") > -1, output
+        assert output.find("has never run, estimated") > -1, output
+        assert output.find("Estimated duration with") > -1, output
+        assert output.find("Critical path") > -1, output
+
+    @isolate(['A'])
+    def test_dry_run_does_not_remove(self):
+        """ A dry run should show the resources that would be invalidated, but keep them """
+        rcode, output = run_tuttle_file(self.project)
+        assert rcode == 0, output
+        project = self.project.replace("echo B produces C > C", "echo B produces another C > C")
+        rcode, output = run_tuttle_file(project, dry_run=True)
+        assert rcode == 0, output
+        assert output.find("file://C") > -1, output
+        assert output.find("The following 1 process(es) would run") > -1, output
+        assert output.find("has never run") == -1, "Process that creates C has run before : duration is known"
+        assert isfile('C')
+        assert open('C').read().strip() == "B produces C"
+
+    @isolate(['A'])
+    def test_nothing_would_run(self):
+        """ A dry run on a workflow that is up to date should say so """
+        rcode, output = run_tuttle_file(self.project)
+        rcode, output = run_tuttle_file(self.project, dry_run=True)
+        assert rcode == 0, output
+        assert output.find("No process would run") > -1, output
+
+    @isolate(['A'])
+    def test_dry_run_touches_nothing(self):
+        """ A dry run should not change anything on disk : no preprocess, no report, no cached signature """
+        project = """|<<
+    echo preprocess >> preprocesses.log
+
+""" + self.project
+        rcode, output = run_tuttle_file(project)
+        assert rcode == 0, output
+        # Old enough for its signature to be cached
+        past = int(time()) - 60
+        os.utime('A', (past, past))
+        open('A', 'a').write("changed")
+        os.utime('A', (past, past))
+        before = snapshot()
+        # The tuttlefile is already written
+        rcode, output = run_tuttle_file(dry_run=True)
+        assert rcode == 0, output
+        assert output.find("The following 2 process(es) would run") > -1, output
+        assert output.find("Preprocesses don't run in a dry run") > -1, output
+        after = snapshot()
+        assert after == before, set(after.items()) ^ set(before.items())
@@ -2,8 +2,8 @@
 
 from subprocess import Popen, PIPE
 from os.path import join, isfile
-from re import search, DOTALL
 from tests.functional_tests import isolate, run_tuttle_file, tuttle_invalidate
+from tests.test_report import report_data
 from tuttle.invalidation import BROTHER_INVALID
 
 
@@ -430,16 +430,14 @@ file://C <- file://B
 
         report_path = join('.tuttle', 'report.html')
         assert isfile(report_path)
-        report = open(report_path).read()
-        title_match_failure = search(r'<h1>.*Failure.*</h1>', report, DOTALL)
-        assert title_match_failure, report
+        data = report_data()
+        assert data['status'] == 'FAILURE', data
 
         rcode, output = tuttle_invalidate()
         assert rcode == 0
 
-        report = open(report_path).read()
-        title_match_failure = search(r'<h1>.*Failure.*</h1>', report, DOTALL)
-        assert not title_match_failure, title_match_failure.group()
+        data = report_data()
+        assert data['status'] != 'FAILURE', data
 
     @isolate(['A', 'B'])
     def test_dont_invalidate_outputless_process(self):
@@ -2,6 +2,7 @@
 from os.path import isfile, join
 
 from tests.functional_tests import isolate, run_tuttle_file
+from tests.test_report import report_data
 
 
 class TestPreprocessors:
@@ -112,11 +113,11 @@ class TestPreprocessors:
         assert rcode == 0, output
         report_path = join('.tuttle', 'report.html')
         assert isfile(report_path)
-        report = open(report_path).read()
-        pos_A = report.find("file%3A//A")
+        graph = report_data()["dot_src"]
+        pos_A = graph.find("file%3A//A")
         assert pos_A > -1, output
-        pos_C = report.find("file%3A//C")
-        assert pos_C > -1, report[pos_A:]
+        pos_C = graph.find("file%3A//C")
+        assert pos_C > -1, graph
 
     @isolate(['A'])
     def test_pre_process_fails(self):
@@ -151,8 +152,8 @@ class TestPreprocessors:
         assert rcode == 0, output
         report_path = join('.tuttle', 'report.html')
         assert isfile(report_path)
-        report = open(report_path).read()
-        pos_A = report.find("file%3A//A")
+        graph = report_data()["dot_src"]
+        pos_A = graph.find("file%3A//A")
         assert pos_A > -1, output
-        pos_C = report.find("file%3A//C")
-        assert pos_C > -1, report[pos_A:]
+        pos_C = graph.find("file%3A//C")
+        assert pos_C > -1, graph
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import logging
+import socket
+import sys
+from multiprocessing.connection import Client
+from os.path import isfile
+from subprocess import Popen, PIPE, STDOUT
+from threading import Condition
+from time import time, sleep
+
+from tests.functional_tests import isolate, run_tuttle_file
+from tuttle.remote import AUTHKEY_VARIABLE, parse_address, RemoteWorkers
+from tuttle.utils import EnvVar
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_agent(port, nb_workers):
+    code = "import sys; from tuttle.commands import worker; " \
+           "sys.exit(worker(('127.0.0.1', {}), {}, None, True))".format(port, nb_workers)
+    return Popen([sys.executable, "-c", code])
+
+
+def wait_for(agents, timeout):
+    end = time() + timeout
+    while time() < end and any(agent.poll() is None for agent in agents):
+        sleep(0.1)
+    for agent in agents:
+        if agent.poll() is None:
+            agent.kill()
+
+
+def connect_agent(address, authkey, nb_workers):
+    """ Connects to the coordinator like a worker agent
+    :return: the connection, and the workspace sent by the coordinator
+    """
+    conn = Client(address, authkey=authkey)
+    conn.send(('register', nb_workers, 'test agent'))
+    _, workspace = conn.recv()
+    return conn, workspace
+
+
+def wait_for_agents(remote, timeout=10):
+    end = time() + timeout
+    while not remote.available() and time() < end:
+        sleep(0.05)
+
+
+class TestRemoteWorkers:
+
+    def test_parse_address(self):
+        """ An address is HOST:PORT, with an optional host """
+        assert parse_address("localhost:7000") == ("localhost", 7000)
+        assert parse_address(":7000") == ("", 7000)
+        for wrong in ("localhost", "localhost:port", "localhost:70000"):
+            try:
+                parse_address(wrong)
+                assert False, wrong
+            except ValueError:
+                pass
+
+    def test_silent_client(self):
+        """ A client that connects but doesn't say anything should not prevent agents from joining """
+        remote = RemoteWorkers(('127.0.0.1', 0), 'key', Condition(), logging.getLogger(__name__))
+        silent = socket.create_connection(remote.address)
+        try:
+            conn, workspace = connect_agent(remote.address, 'key', 2)
+            wait_for_agents(remote)
+            assert remote.available(2)
+            conn.close()
+        finally:
+            silent.close()
+            remote.close()
+
+    def test_task_that_cant_be_sent(self):
+        """ A process that can't be sent to an agent should fail, and its workers should be freed """
+        remote = RemoteWorkers(('127.0.0.1', 0), 'key', Condition(), logging.getLogger(__name__))
+        try:
+            conn, workspace = connect_agent(remote.address, 'key', 1)
+            wait_for_agents(remote)
+            results = []
+            # A lambda can't be pickled
+            remote.run(lambda: None, 1, results.append)
+            [(success, error_msg, signatures)] = results
+            assert success is False
+            assert error_msg.find("test agent") > -1, error_msg
+            assert remote.available(1)
+            assert remote.nb_running() == 0
+            conn.close()
+        finally:
+            remote.close()
+
+    @isolate(['A'])
+    def test_listen_requires_a_key(self):
+        """ Tuttle should not listen for worker agents without a secret key """
+        project = """file://B <- file://A
+    echo A produces B > B
+"""
+        with EnvVar(AUTHKEY_VARIABLE, ''):
+            rcode, output = run_tuttle_file(project, listen=('127.0.0.1', free_port()))
+        assert rcode == 2, output
+        assert output.find(AUTHKEY_VARIABLE) > -1, output
+        assert not isfile('B')
+
+    @isolate(['A'])
+    def test_run_on_agents(self):
+        """ Worker agents should run processes for the coordinator, in the same workspace """
+        sections = ["""file://out_{0} <- file://A ! python
+    import os, psutil, time
+    time.sleep(2)
+    open('out_{0}', 'w').write(str(psutil.Process(os.getppid()).ppid()))
+""".format(i) for i in range(6)]
+        with open('tuttlefile', "w") as f:
+            f.write("\n".join(sections))
+        port = free_port()
+        # The coordinator runs in its own process : at the end of a run, tuttle terminates the sub-processes of its
+        # children, which would include the workers of the agents if they were its children
+        code = "import sys; from tuttle.commands import run; " \
+               "sys.exit(run('tuttlefile', nb_workers=1, listen=('127.0.0.1', {})))".format(port)
+        with EnvVar(AUTHKEY_VARIABLE, 'a secret for tests'):
+            agents = [start_agent(port, 2), start_agent(port, 2)]
+            try:
+                coordinator = Popen([sys.executable, "-c", code], stdout=PIPE, stderr=STDOUT)
+                output = coordinator.communicate()[0]
+                rcode = coordinator.returncode
+            finally:
+                wait_for(agents, 10)
+        assert rcode == 0, output
+        assert output.find("Worker agent") > -1, output
+        runners = {int(open('out_{}'.format(i)).read()) for i in range(6)}
+        agent_pids = {agent.pid for agent in agents}
+        assert runners & agent_pids, (runners, agent_pids)
+        assert all(agent.returncode == 0 for agent in agents), [agent.returncode for agent in agents]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import socket
+import sys
+from httplib import HTTPConnection
+from json import loads
+from subprocess import Popen
+from time import time, sleep
+from urllib2 import urlopen, URLError, HTTPError
+
+from tests.functional_tests import isolate
+from tests.test_report import report_data
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('localhost', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def wait_for_server(url, timeout=20):
+    end = time() + timeout
+    while True:
+        try:
+            return loads(urlopen(url).read())
+        except URLError:
+            if time() > end:
+                raise
+            sleep(0.1)
+
+
+def read_events(port):
+    """ Yields the name and the data of the events of the Server-Sent Events stream of the report server """
+    connection = HTTPConnection('localhost', port)
+    connection.request("GET", "/events")
+    # Not urlopen(), that waits for its buffer to be full
+    stream = connection.getresponse().fp
+    name, data = "message", None
+    for line in iter(stream.readline, ''):
+        line = line.rstrip("\n")
+        if line.startswith("event: "):
+            name = line[len("event: "):]
+        elif line.startswith("data: "):
+            data = line[len("data: "):]
+        elif not line and data is not None:
+            yield name, loads(data)
+            name, data = "message", None
+
+
+class TestReportServer:
+
+    @isolate(['A'])
+    def test_serve(self):
+        """ The report server should push the state of the processes while the workflow runs, without rewriting the
+        report files """
+        project = """file://B <- file://A
+    while [ ! -f go ]; do sleep 0.1; done
+    echo B > B
+"""
+        with open('tuttlefile', "w") as f:
+            f.write(project)
+        port = free_port()
+        code = "import sys; from tuttle.commands import run; " \
+               "sys.exit(run('tuttlefile', serve=('localhost', {})))".format(port)
+        proc = Popen([sys.executable, "-c", code])
+        try:
+            base_url = "http://localhost:{}/".format(port)
+            status = wait_for_server(base_url + "status")
+            assert status['status'] == "NOT_FINISHED", status
+            assert urlopen(base_url + "report.html").read().find("EventSource") > -1
+            for path in ("../tuttlefile", "last_workflow.pickle", "last_workflow.journal", "", "processes/logs/"):
+                try:
+                    urlopen(base_url + path)
+                    assert False, "Only the files of the report should be served, not {}".format(path)
+                except HTTPError as e:
+                    assert e.code == 404
+            events = read_events(port)
+            name, state = next(events)
+            [process] = state['processes'].values()
+            while not process['start']:
+                name, state = next(events)
+                process = state['processes'].values()[0]
+            urlopen(base_url + process['log_stdout']).read()
+            # The report files are not written while the server shows the workflow
+            assert not report_data()['processes'].values()[0]['start']
+            open('go', 'w').close()
+            for name, data in events:
+                if name == "end":
+                    break
+                state = data
+                process = state['processes'].values()[0]
+            assert process['success'] is True, process
+            assert state['status'] == 'SUCCESS', state
+            assert proc.wait() == 0
+        finally:
+            if proc.poll() is None:
+                # Let the process end before killing tuttle
+                open('go', 'w').close()
+                proc.kill()
+        assert report_data()['status'] == 'SUCCESS'
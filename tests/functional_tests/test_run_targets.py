@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from os.path import isfile
+
+from tests.functional_tests import isolate, run_tuttle_file
+from tuttle.workflow import Workflow
+
+
+class TestRunTargets:
+
+    project = """file://B <- file://A
+    echo A produces B > B
+
+file://C <- file://B
+    echo B produces C > C
+
+file://D <- file://A
+    echo A produces D > D
+"""
+
+    @isolate(['A'])
+    def test_run_only_ancestors(self):
+        """ Only the processes needed to build the targets should run """
+        rcode, output = run_tuttle_file(self.project, targets=['file://C'])
+        assert rcode == 0, output
+        assert isfile('B')
+        assert isfile('C')
+        assert not isfile('D'), output
+
+    @isolate(['A'])
+    def test_run_the_rest_afterwards(self):
+        """ After running a target, a full run should only run the processes that have not run yet """
+        rcode, output = run_tuttle_file(self.project, targets=['file://C'])
+        assert rcode == 0, output
+        first_start = Workflow.load().find_process_that_creates('file://C').start
+        rcode, output = run_tuttle_file(self.project)
+        assert rcode == 0, output
+        assert isfile('D')
+        w = Workflow.load()
+        assert w.find_process_that_creates('file://C').start == first_start, "C should not have been computed again"
+        assert w.find_process_that_creates('file://D').success
+
+    @isolate(['A'])
+    def test_unselected_changes_are_left_for_later(self):
+        """ A process that has changed out of the selection should not be invalidated... until it is selected """
+        rcode, output = run_tuttle_file(self.project)
+        assert rcode == 0, output
+        project = self.project.replace("echo A produces D > D", "echo A produces another D > D")
+        rcode, output = run_tuttle_file(project, targets=['file://C'])
+        assert rcode == 0, output
+        assert output.find("file://D") == -1, output
+        assert open('D').read().strip() == "A produces D"
+        rcode, output = run_tuttle_file(project)
+        assert rcode == 0, output
+        assert output.find("file://D") > -1, output
+        assert open('D').read().strip() == "A produces another D"
+
+    @isolate(['A'])
+    def test_descendants_of_a_target_are_invalidated(self):
+        """ Building a target again should invalidate what depends on it out of the selection, so that the next run
+        builds it again """
+        rcode, output = run_tuttle_file(self.project)
+        assert rcode == 0, output
+        open('A', 'w').write('A has changed')
+        rcode, output = run_tuttle_file(self.project, targets=['file://B'])
+        assert rcode == 0, output
+        assert output.find("* file://C - Resource depends on file://B") > -1, output
+        assert not isfile('C'), output
+        rcode, output = run_tuttle_file(self.project)
+        assert rcode == 0, output
+        assert output.find("Nothing to do") == -1, output
+        assert isfile('C')
+        assert Workflow.load().find_process_that_creates('file://C').success
+
+    @isolate(['A'])
+    def test_consumers_of_a_changed_primary_resource_are_invalidated(self):
+        """ A process out of the selection that depends on a primary resource that has changed should be invalidated
+        """
+        rcode, output = run_tuttle_file(self.project)
+        assert rcode == 0, output
+        open('A', 'w').write('A has changed')
+        rcode, output = run_tuttle_file(self.project, targets=['file://C'])
+        assert rcode == 0, output
+        assert output.find("* file://D - Resource depends on primary resource file://A") > -1, output
+        assert not isfile('D'), output
+        rcode, output = run_tuttle_file(self.project)
+        assert rcode == 0, output
+        assert isfile('D')
+
+    @isolate(['A'])
+    def test_unknown_target(self):
+        """ A target must be part of the workflow """
+        rcode, output = run_tuttle_file(self.project, targets=['file://E'])
+        assert rcode == 2, output
+        assert output.find("file://E") > -1, output
+        assert not isfile('B')
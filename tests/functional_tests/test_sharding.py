@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import sys
+from os.path import isfile, isdir, join
+from subprocess import Popen
+
+from tests.functional_tests import isolate, run_tuttle_file
+from tests.test_scheduling import get_workflow
+from tuttle.commands import merge_shards
+from tuttle.scheduling import estimated_durations
+from tuttle.sharding import parse_shard, partition
+from tuttle.workflow import Workflow
+
+
+def start_shard(shard):
+    code = "import sys; from tuttle.commands import run; sys.exit(run('tuttlefile', shard=({}, {})))".format(*shard)
+    return Popen([sys.executable, "-c", code])
+
+
+class TestSharding:
+
+    def test_parse_shard(self):
+        """ A shard is i/N, i being between 1 and N """
+        assert parse_shard("2/3") == (2, 3)
+        for wrong in ("2", "0/3", "4/3", "a/3"):
+            try:
+                parse_shard(wrong)
+                assert False, wrong
+            except ValueError:
+                pass
+
+    def test_partition(self):
+        """ Shards should have the same duration, and a chain of processes should stay in the same shard """
+        workflow = get_workflow("""file://B <- file://A
+
+file://C <- file://B
+
+file://D <- file://A
+
+file://E <- file://D
+""")
+        parts = partition(workflow, estimated_durations(workflow, {}), 2)
+        assert sorted(len(part) for part in parts) == [2, 2], parts
+        for part in parts:
+            creators = {in_res.creator_process for process in part for in_res in process.iter_inputs()}
+            assert len(creators & part) == 1, "Each chain should be in a single shard"
+
+    def test_partition_balances_durations(self):
+        """ A long process should have a shard for itself """
+        workflow = get_workflow("""file://B <- file://A
+
+file://C <- file://A
+
+file://D <- file://A
+""")
+        b, c, d = workflow.iter_processes()
+        parts = partition(workflow, {b: 10, c: 5, d: 5}, 2)
+        assert {b} in parts, parts
+
+    @isolate(['A'])
+    def test_shards(self):
+        """ Shards should wait for the resources created by each other, and merging them should give the same
+        workflow as a single run """
+        project = """file://B <- file://A
+    echo A produces B > B
+
+file://C <- file://B
+    echo B produces C > C
+
+file://D <- file://A
+    echo A produces D > D
+
+file://E <- file://C, file://D
+    echo C and D produce E > E
+"""
+        with open('tuttlefile', "w") as f:
+            f.write(project)
+        shard = start_shard((2, 2))
+        rcode, output = run_tuttle_file(shard=(1, 2))
+        assert rcode == 0, output
+        assert shard.wait() == 0
+        assert not isfile(join('.tuttle', 'last_workflow.pickle'))
+        assert merge_shards() == 0
+        assert isfile('E')
+        assert not isdir(join('.tuttle', 'shards'))
+        workflow = Workflow.load()
+        assert all(process.success for process in workflow.iter_processes())
+        for process in workflow.iter_processes():
+            assert isfile(process.log_stdout), process.log_stdout
+        rcode, output = run_tuttle_file()
+        assert rcode == 0, output
+        assert output.find("Nothing to do") > -1, output
+
+    @isolate(['A'])
+    def test_owner_shard_fails(self):
+        """ A shard should fail the processes whose inputs are created by a process that fails in another shard,
+        instead of waiting forever """
+        project = """file://B <- file://A
+    echo A produces B > B
+
+file://C <- file://B
+    echo B produces C > C
+    exit 1
+
+file://D <- file://A
+    echo A produces D > D
+
+file://E <- file://C, file://D
+    echo C and D produce E > E
+"""
+        with open('tuttlefile', "w") as f:
+            f.write(project)
+        shard = start_shard((1, 2))
+        rcode, output = run_tuttle_file(shard=(2, 2), shard_timeout=60)
+        assert shard.wait() == 2
+        assert rcode == 2, output
+        assert output.find("Input file://C has not been created") > -1, output
+        assert output.find("after waiting") == -1, output
+        assert isfile('D')
+        assert not isfile('E')
+
+    @isolate(['A'])
+    def test_wait_timeout(self):
+        """ An input that exists is not created until the dump of the shard that creates it says so. If that shard
+        doesn't run, the processes that need it should fail after the timeout """
+        project = """file://B <- file://A
+    echo A produces B > B
+
+file://C <- file://B
+    echo B produces C > C
+
+file://D <- file://A
+    echo A produces D > D
+
+file://E <- file://C, file://D
+    echo C and D produce E > E
+"""
+        open('C', 'w').write("Half written")
+        rcode, output = run_tuttle_file(project, shard=(2, 2), shard_timeout=1)
+        assert rcode == 2, output
+        assert output.find("Input file://C has not been created by shard 1/2 after waiting for 1s") > -1, output
+        assert not isfile('E')
+
+    @isolate(['A'])
+    def test_shard_must_be_merged(self):
+        """ A shard should not run again before it has been merged """
+        project = """file://B <- file://A
+    echo A produces B > B
+"""
+        rcode, output = run_tuttle_file(project, shard=(1, 1))
+        assert rcode == 0, output
+        rcode, output = run_tuttle_file(project, shard=(1, 1))
+        assert rcode == 2, output
+        assert output.find("merge-shards") > -1, output
+
+    @isolate(['A'])
+    def test_nothing_to_merge(self):
+        """ Merging should fail when no shard has run """
+        assert merge_shards() == 2
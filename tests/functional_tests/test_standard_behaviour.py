@@ -3,6 +3,7 @@ from os.path import isfile, exists, isdir
 
 from os import path
 from tests.functional_tests import isolate, run_tuttle_file
+from tests.test_report import report_data
 from tuttle.tuttle_directories import TuttleDirectories
 
 
@@ -67,10 +68,12 @@ file://D <- file://C
         rcode, output = run_tuttle_file(second)
         assert rcode == 2
         report = file(path.join('.tuttle', 'report.html')).read()
-        [_, sec1, sec2, sec3] = report.split('<h2')
-        assert sec1.find("<th>Start</th>") >= 0, sec1
-        assert sec2.find("<th>Start</th>") >= 0, sec2
-        assert sec3.find("<th>Start</th>") == -1, sec3
+        assert len(report.split('<h2')) == 4, report
+        processes = report_data()['processes']
+        [b, c, d] = [processes[pid] for pid in sorted(processes, key=lambda pid: int(pid.split('_')[-1]))]
+        assert b['start'], b
+        assert c['start'], c
+        assert not d['start'], d
 
     @isolate(['A'])
     def test_workflow_execution_should_stop_at_first_process_error(self):
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from os.path import isfile
+from time import time
+
+from tests.functional_tests import isolate, run_tuttle_file
+from tuttle.workflow import Workflow
+
+
+class TestTimeout:
+
+    @isolate(['A'])
+    def test_process_stopped_after_timeout(self):
+        """ A process still running after its timeout should be stopped and fail """
+        project = """file://B <- file://A ! shell timeout=1
+    sleep 30
+    echo A produces B > B
+"""
+        rcode, output = run_tuttle_file(project)
+        assert rcode == 2, output
+        assert not isfile('B'), output
+        process = Workflow.load().find_process_that_creates("file://B")
+        assert process.success is False
+        assert process.error_message.find("stopped after the timeout of 1s") > -1, process.error_message
+
+    @isolate(['A'])
+    def test_timeout_not_supported(self):
+        """ A processor that can't stop its processes should not accept a timeout """
+        project = """file://B <- http://localhost/A ! download timeout=1
+"""
+        rcode, output = run_tuttle_file(project)
+        assert rcode == 2, output
+        assert output.find("download processor doesn't support it") > -1, output
+
+    @isolate(['A'])
+    def test_process_ending_before_timeout(self):
+        """ A process that ends before its timeout should succeed """
+        project = """file://B <- file://A ! shell timeout=10
+    echo A produces B > B
+"""
+        rcode, output = run_tuttle_file(project)
+        assert rcode == 0, output
+        assert isfile('B'), output
+
+
+class TestFailFast:
+
+    project = """file://B <- file://A
+    sleep 1
+    error
+
+file://C <- file://A
+    sleep 8
+    echo A produces C > C
+"""
+
+    @isolate(['A'])
+    def test_fail_fast_stops_running_processes(self):
+        """ With fail fast, processes still running should be stopped when a process fails """
+        start = time()
+        rcode, output = run_tuttle_file(self.project, nb_workers=2, fail_fast=True)
+        assert rcode == 2, output
+        assert time() - start < 6, output
+        assert not isfile('C'), output
+        workflow = Workflow.load()
+        process_c = workflow.find_process_that_creates("file://C")
+        assert process_c.success is False
+        assert process_c.error_message.find("cancelled because another process has failed") > -1, \
+            process_c.error_message
+
+    @isolate(['A'])
+    def test_without_fail_fast(self):
+        """ Without fail fast, processes already running should complete when a process fails """
+        rcode, output = run_tuttle_file(self.project, nb_workers=2)
+        assert rcode == 2, output
+        assert isfile('C'), output
@@ -320,6 +320,16 @@ class TestDownloadProcessor:
         except TuttleError as e:
             assert e.message.find("don't know how to handle these outputs") >= 0, e.message
 
+    def test_concurrency_target_is_the_host(self):
+        """ Limits of concurrency can apply to the host to download from """
+        project = "file://a_resource <- http://localhost:8043/a_resource ! download"
+        pp = ProjectParser()
+        pp.set_project(project)
+        pp.read_line()
+        process = pp.parse_dependencies_and_processor()
+        target = process.processor.concurrency_target(process)
+        assert target == "localhost", target
+
     @isolate
     def test_simple_dl(self):
         """ Should download a simple url to a file """
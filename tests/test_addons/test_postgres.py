@@ -294,6 +294,16 @@ class TestPostgresqlProcessor:
         process = pp.parse_dependencies_and_processor()
         assert process._processor.name == "postgresql"
 
+    def test_concurrency_target_is_the_database(self):
+        """ Limits of concurrency can apply to the database the processes connect to """
+        project = "pg://localhost:5432/tuttle_test_db/another_test_table <- pg://localhost:5432/tuttle_test_db/test_table ! postgresql"
+        pp = ProjectParser()
+        pp.set_project(project)
+        pp.read_line()
+        process = pp.parse_dependencies_and_processor()
+        target = process.processor.concurrency_target(process)
+        assert target == "host='localhost' dbname='tuttle_test_db' port=5432", target
+
     @isolate
     def test_postgresql_processor(self):
         """A project with a PostgreSQL processor should run the sql statements"""
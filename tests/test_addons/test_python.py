@@ -71,3 +71,88 @@ class TestPythonProcessor():
         assert rcode == 0, output
         B_contents = open('B').read()
         assert(B_contents == '42')
+
+    def test_warm_options(self):
+        """ Warm mode can be asked with a flag or by modules to preload """
+        project = "file://B <- file://A ! python warm\n" \
+                  "file://C <- file://A ! python preload=pandas,numpy"
+        pp = ProjectParser()
+        pp.set_project(project)
+        pp.read_line()
+        process = pp.parse_dependencies_and_processor()
+        assert process._processor.is_warm(process)
+        pp.read_line()
+        process = pp.parse_dependencies_and_processor()
+        assert process._processor.is_warm(process)
+        assert process.option('preload') == ('pandas', 'numpy'), process.option('preload')
+
+    @isolate(['A'])
+    def test_warm_python_processor(self):
+        """ A python process should run in warm mode, with its outputs in its logs """
+        project = u"""file://B <- file://A ! python warm
+
+        print("A warm python process")
+        open('B', 'w').write('A produces B')
+        """
+        rcode, output = run_tuttle_file(project)
+        assert rcode == 0, output
+        assert output.find("A warm python process") >= 0, output
+        out_log = open(join('.tuttle', 'processes', 'logs', 'tuttlefile_1_stdout.txt')).read()
+        assert out_log.find("A warm python process") >= 0, out_log
+
+    @isolate(['A'])
+    def test_error_in_warm_python_processor(self):
+        """ An exception or a non zero exit should make the process fail, with the traceback in the logs """
+        project = """file://B <- file://A ! python warm
+        a = 0
+        print("should raise an error : {}".format(0 / a))
+
+file://C <- file://A ! python warm
+        import sys
+        sys.exit(3)
+        """
+        rcode, output = run_tuttle_file(project, keep_going=True)
+        assert rcode == 2
+        error_log = open(join('.tuttle', 'processes', 'logs', 'tuttlefile_1_err.txt')).read()
+        assert error_log.find('ZeroDivisionError:') >= 0, error_log
+        assert output.find("error code 3") >= 0, output
+
+    @isolate(['A', 'a_lib.py'])
+    def test_preload(self):
+        """ Preloaded modules should be already imported when the code runs, and every process should be forked from
+        the same worker """
+        project = """file://B <- file://A ! python preload=a_lib
+        import sys, os
+        open('B', 'w').write("{} {}".format('a_lib' in sys.modules, os.getppid()))
+
+file://C <- file://B ! python preload=a_lib
+        import sys, os
+        open('C', 'w').write("{} {}".format('a_lib' in sys.modules, os.getppid()))
+        """
+        rcode, output = run_tuttle_file(project, nb_workers=1)
+        assert rcode == 0, output
+        preloaded_b, parent_b = open('B').read().split()
+        preloaded_c, parent_c = open('C').read().split()
+        assert preloaded_b == preloaded_c == 'True'
+        assert parent_b == parent_c
+
+    @isolate(['A'])
+    def test_missing_preload(self):
+        """ A module that can't be preloaded should make the process fail """
+        project = """file://B <- file://A ! python preload=not_a_module
+        open('B', 'w').write('A produces B')
+        """
+        rcode, output = run_tuttle_file(project)
+        assert rcode == 2, output
+        assert output.find("Can't preload module not_a_module") >= 0, output
+
+    @isolate(['A'])
+    def test_warm_timeout(self):
+        """ A warm process should be stopped after its timeout """
+        project = """file://B <- file://A ! python warm timeout=1
+        import time
+        time.sleep(10)
+        """
+        rcode, output = run_tuttle_file(project)
+        assert rcode == 2, output
+        assert output.find("timeout of 1s") >= 0, output
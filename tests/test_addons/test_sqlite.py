@@ -2,6 +2,8 @@
 from os.path import join, isfile
 from tests.functional_tests import isolate, run_tuttle_file
 from tuttle.addons.sqlite import SQLiteResource, SQLiteTuttleError
+from tuttle.hashing import HASH_VARIABLE
+from tuttle.utils import EnvVar
 from tuttle.project_parser import ProjectParser
 
 
@@ -209,6 +211,16 @@ class TestSQLiteResource():
         expected = "3ee7b386c4daed31a7d57fbb0fd32c482c7be1d1"
         assert sig == expected, sig
 
+    @isolate(['tests.sqlite'])
+    def test_sqlite_table_signature_with_another_algorithm(self):
+        """signature() should be tagged with the hash algorithm if it is not sha1"""
+        url = "sqlite://tests.sqlite/test_table_not_empty"
+        res = SQLiteResource(url)
+        sig = res.signature("md5")
+        assert sig.startswith("md5:"), sig
+        with EnvVar(HASH_VARIABLE, "md5"):
+            assert res.signature() == sig
+
     @isolate(['tests.sqlite'])
     def test_index_exists(self):
         """exists() should return True when the index exists"""
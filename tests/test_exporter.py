@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from time import sleep, time
+
+from tuttle.exporter import BackgroundExporter
+
+
+class RecordingWorkflow:
+    """ Records the exports instead of writing them """
+
+    def __init__(self, nb_failures=0, on_failure=None):
+        """
+        :param nb_failures: number of exports that fail before the next ones succeed
+        :param on_failure: called when an export fails, before raising the error
+        """
+        self.exports = []
+        self.nb_failures = nb_failures
+        self.on_failure = on_failure
+
+    def export_progress(self, processes, reports=True):
+        if self.nb_failures:
+            self.nb_failures -= 1
+            if self.on_failure is not None:
+                self.on_failure()
+            raise IOError("Disk full")
+        self.exports.append(processes)
+
+
+def wait_for(condition, timeout=20):
+    """ Waits until condition() is True, for timeout seconds at most
+    :return: True if condition() has become True
+    """
+    end = time() + timeout
+    while not condition():
+        if time() > end:
+            return False
+        sleep(0.01)
+    return True
+
+
+class TestBackgroundExporter:
+
+    def test_coalesce(self):
+        """ Events coming during the interval should be exported together, and what is left at the end should be
+        exported when the exporter closes """
+        workflow = RecordingWorkflow()
+        exporter = BackgroundExporter(workflow, 60)
+        exporter.notify(['a'])
+        assert wait_for(lambda: workflow.exports), "The first event should be exported at once"
+        exporter.notify(['b', 'c'])
+        exporter.notify(['c', 'd'])
+        exporter.notify([])
+        exporter.close()
+        assert workflow.exports == [['a'], ['b', 'c', 'd']], workflow.exports
+
+    def test_nothing_to_export(self):
+        """ No event, no export """
+        workflow = RecordingWorkflow()
+        exporter = BackgroundExporter(workflow, 0)
+        exporter.close()
+        assert workflow.exports == []
+
+    def test_error(self):
+        """ A failed export should not stop the next ones : its processes should be exported with them """
+        workflow = RecordingWorkflow(nb_failures=1)
+        exporter = BackgroundExporter(workflow, 0)
+        exporter.RETRY_DELAY = 0.1
+        # Comes while the export of a fails
+        workflow.on_failure = lambda: exporter.notify(['b'])
+        exporter.notify(['a'])
+        assert wait_for(lambda: workflow.exports), "The failed export should have been retried"
+        assert workflow.exports == [['a', 'b']], workflow.exports
+        exporter.notify(['c'])
+        exporter.close()
+        assert workflow.exports[-1] == ['c'], workflow.exports
+
+    def test_error_at_the_end(self):
+        """ An error in the last export should be raised when the exporter closes """
+        workflow = RecordingWorkflow(nb_failures=100)
+        exporter = BackgroundExporter(workflow, 0)
+        exporter.notify(['a'])
+        assert wait_for(lambda: workflow.nb_failures < 100), "The export should have been tried in the background"
+        try:
+            exporter.close()
+            assert False, "Should have raised the error of the export"
+        except IOError:
+            pass
@@ -1,5 +1,5 @@
 from tuttle.error import TuttleError
-from tuttle.figures_formating import nice_size, nice_duration, parse_duration
+from tuttle.figures_formating import nice_size, nice_duration, parse_duration, parse_size
 
 
 class TestFileSizeFormating:
@@ -105,3 +105,18 @@ class TestDurationParsing:
         """ A duration can have days """
         d = parse_duration("4d 12s")
         assert d == 4*24*3600 + 12, d
+
+    def test_parse_size(self):
+        """ A size can be in bytes or with a unit """
+        assert parse_size("512") == 512
+        assert parse_size("100K") == 100 * 1024
+        assert parse_size("2 GB") == 2 * 1024 * 1024 * 1024
+        assert parse_size("1.5m") == 1024 * 1024 * 3 / 2
+
+    def test_parse_invalid_size(self):
+        """ A size must be a positive number with an optional unit """
+        try:
+            parse_size("a lot")
+            assert False
+        except ValueError:
+            assert True
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from hashlib import sha1
+
 from tests.functional_tests import isolate
-from tuttle.resource import FileResource
+from tuttle import resource
+from tuttle.resource import FileResource, compute_signatures
 import os
 
 
@@ -37,3 +40,39 @@ class TestFile():
         sig = r.signature()
         # TODO should a directory have a signature resulting of its content ?
         assert sig.startswith("sha1:"), sig
+
+    @isolate
+    def test_big_file_signature(self):
+        """ A file mapped in memory because it is big should have the same signature as if it was read by blocks """
+        content = "".join(str(i) for i in xrange(10000))
+        open('big', 'w').write(content)
+        former_mmap_size = resource.MMAP_SIZE
+        resource.MMAP_SIZE = 1000
+        try:
+            sig = FileResource("file://big").compute_signature()
+        finally:
+            resource.MMAP_SIZE = former_mmap_size
+        assert sig == "sha1:{}".format(sha1(content).hexdigest()), sig
+        assert sig == FileResource("file://big").compute_signature()
+
+    @isolate(['A'])
+    def test_compute_signatures(self):
+        """ Signatures of several resources computed in threads should be indexed by url """
+        open('B', 'w').write('B')
+        resources = [FileResource("file://A"), FileResource("file://B"), FileResource("file://C")]
+        signatures = compute_signatures(resources)
+        assert signatures == {r.url: r.signature() for r in resources}, signatures
+        assert signatures["file://A"] != signatures["file://B"]
+        assert signatures["file://C"] == "sha1:None"
+
+    @isolate
+    def test_compute_signatures_in_threads(self):
+        """ Many signatures should be computed by the same pool of threads, call after call """
+        for i in range(10):
+            open('file_{}'.format(i), 'w').write(str(i))
+        resources = [FileResource("file://file_{}".format(i)) for i in range(10)]
+        signatures = compute_signatures(resources)
+        assert signatures == {r.url: r.compute_signature() for r in resources}, signatures
+        pool = resource.signature_pool()
+        compute_signatures(resources)
+        assert resource.signature_pool() is pool
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from hashlib import sha256
+
+from tests.functional_tests import isolate, run_tuttle_file
+from tuttle.error import TuttleError
+from tuttle.hashing import HASH_VARIABLE, hash_algorithm, new_hash, signature_algorithm, signature_changed
+from tuttle.resource import FileResource
+from tuttle.utils import EnvVar
+from tuttle.workflow import Workflow
+
+
+class TestHashing:
+
+    def test_signature_algorithm(self):
+        """ The algorithm of a signature is its tag. Untagged signatures are sha1 ones """
+        assert signature_algorithm("sha256:0af3") == "sha256"
+        assert signature_algorithm("sha1:0af3") == "sha1"
+        assert signature_algorithm("0af3") == "sha1"
+        assert signature_algorithm("unknown:0af3") == "sha1"
+        assert signature_algorithm("owner : tuttle") == "sha1"
+        assert signature_algorithm(False) == "sha1"
+
+    def test_unknown_algorithm(self):
+        """ An unknown algorithm should raise a TuttleError """
+        with EnvVar(HASH_VARIABLE, "unknown"):
+            try:
+                hash_algorithm()
+                assert False, "unknown should not be a valid algorithm"
+            except TuttleError as e:
+                assert str(e).find("sha256") > -1, str(e)
+
+    def test_optional_algorithm(self):
+        """ Algorithms from modules that are not installed should raise a TuttleError """
+        for algorithm in ("blake2b", "xxh64"):
+            try:
+                checksum = new_hash(algorithm)
+                checksum.update("A")
+                assert checksum.hexdigest()
+            except TuttleError as e:
+                assert str(e).find("not installed") > -1, str(e)
+
+    @isolate(['A'])
+    def test_file_signature_with_another_algorithm(self):
+        """ The signature of a file should be tagged with the algorithm of the environment """
+        with EnvVar(HASH_VARIABLE, "sha256"):
+            sig = FileResource("file://A").signature()
+        assert sig == "sha256:{}".format(sha256(open('A').read()).hexdigest()), sig
+
+    @isolate(['A'])
+    def test_signature_changed(self):
+        """ A signature from another algorithm should be compared by hashing the resource again """
+        resource = FileResource("file://A")
+        former_signature = resource.signature()
+        signature = resource.signature("sha256")
+        assert not signature_changed(resource, former_signature, signature)
+        open('A', 'w').write("changed")
+        assert signature_changed(resource, former_signature, resource.signature("sha256"))
+
+    @isolate(['A'])
+    def test_change_algorithm(self):
+        """ Changing the hash algorithm should not invalidate the workflow, but the new signatures should be kept for
+        the next run """
+        project = """file://B <- file://A
+    echo A produces B
+    echo B > B
+"""
+        rcode, output = run_tuttle_file(project)
+        assert rcode == 0, output
+        with EnvVar(HASH_VARIABLE, "sha256"):
+            rcode, output = run_tuttle_file(project)
+            assert rcode == 0, output
+            assert output.find("A produces B") == -1, output
+            assert Workflow.load().signature("file://A").startswith("sha256:")
+            with open('A', 'w') as f:
+                f.write("A has changed")
+            rcode, output = run_tuttle_file(project)
+            assert rcode == 0, output
+            assert output.find("A produces B") > -1, output
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import os
+
+from nose.plugins.skip import SkipTest
+
+from tests.functional_tests import isolate, run_tuttle_file
+from tuttle.jobserver import JobServer
+
+
+class TestJobServer:
+
+    def setUp(self):
+        if os.name != 'posix':
+            raise SkipTest("The jobserver is only available on posix systems")
+
+    def test_tokens(self):
+        """ A jobserver for 3 jobs should give the implicit token and 2 tokens from the pipe """
+        js = JobServer.create(3)
+        try:
+            assert js.try_acquire()
+            assert js.try_acquire()
+            assert js.try_acquire()
+            assert not js.try_acquire(), "No token should be left"
+            js.release()
+            assert js.try_acquire()
+        finally:
+            js.close()
+
+    def test_makeflags(self):
+        """ The programs should find the pipe of the jobserver in MAKEFLAGS """
+        js = JobServer.create(4)
+        try:
+            assert js.makeflags.find("-j4 --jobserver-auth=") > -1, js.makeflags
+        finally:
+            js.close()
+
+    def test_join(self):
+        """ Tokens taken by a client of the jobserver should not be available to the others """
+        js = JobServer.create(2)
+        try:
+            client = JobServer.join(js.makeflags)
+            if client is None:
+                raise SkipTest("Joining a jobserver from its file descriptors requires /proc")
+            assert client.makeflags is None
+            assert client.try_acquire(), "Client should have its implicit token"
+            assert client.try_acquire(), "Client should take the only token of the pipe"
+            assert js.try_acquire()
+            assert not js.try_acquire()
+            client.close()
+            assert js.try_acquire(), "Tokens should be given back when the client leaves"
+        finally:
+            js.close()
+
+    def test_join_without_jobserver(self):
+        """ Nothing to join if MAKEFLAGS has no jobserver, or if its pipe has not been passed to tuttle """
+        assert JobServer.join(None) is None
+        assert JobServer.join(" -k") is None
+        assert JobServer.join(" -j4 --jobserver-auth=997,998") is None
+        assert JobServer.join(" -j4 --jobserver-auth=fifo:/does/not/exist") is None
+
+    @isolate(['A'])
+    def test_processes_share_the_jobserver(self):
+        """ With a jobserver, the programs run by the processes should find it in MAKEFLAGS """
+        project = """file://B <- file://A
+    echo $MAKEFLAGS > B
+"""
+        former_makeflags = os.environ.get('MAKEFLAGS')
+        rcode, output = run_tuttle_file(project, nb_workers=2, jobserver=True)
+        assert rcode == 0, output
+        assert open('B').read().find("--jobserver-auth=") > -1
+        assert os.environ.get('MAKEFLAGS') == former_makeflags
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+from os.path import join, isfile
+from pickle import dumps
+from subprocess import Popen
+from time import time, sleep
+
+import psutil
+from nose.plugins.skip import SkipTest
+
+from tests.functional_tests import isolate
+from tests.test_project_parser import ProjectParser
+from tuttle import journal
+from tuttle.tuttle_directories import TuttleDirectories
+from tuttle.workflow import Workflow
+from tuttle.workflow_runner import WorkflowRunner
+
+
+def get_workflow(project_source):
+    pp = ProjectParser()
+    pp.set_project(project_source)
+    return pp.parse_project()
+
+
+class TestJournal:
+
+    @isolate
+    def test_replay(self):
+        """ Loading the workflow should give the execution info and the signatures exported after the snapshot """
+        workflow = get_workflow("""file://B <- file://A
+
+file://C <- file://B
+""")
+        TuttleDirectories.create_tuttle_dirs()
+        workflow.dump()
+        b, c = workflow.iter_processes()
+        b.set_start()
+        workflow.export_progress([b])
+        b.set_end(True, None)
+        workflow.update_signatures({'file://B': 'sha1:b'})
+        c.set_start()
+        workflow.export_progress([b, c])
+        assert isfile(join('.tuttle', 'last_workflow.journal'))
+        loaded = Workflow.load()
+        b, c = loaded.iter_processes()
+        assert b.success is True
+        assert loaded.signature('file://B') == 'sha1:b'
+        assert c.start is not None and c.end is None
+
+    @isolate
+    def test_snapshot_empties_journal(self):
+        """ A new snapshot should replace the journal """
+        workflow = get_workflow("""file://B <- file://A""")
+        TuttleDirectories.create_tuttle_dirs()
+        workflow.dump()
+        process = next(workflow.iter_processes())
+        process.set_start()
+        workflow.export_progress([process])
+        workflow.dump()
+        assert not isfile(join('.tuttle', 'last_workflow.journal'))
+        assert next(Workflow.load().iter_processes()).start is not None
+
+    @isolate
+    def test_torn_record(self):
+        """ A record torn because tuttle has been killed should be ignored, as well as what follows """
+        workflow = get_workflow("""file://B <- file://A""")
+        TuttleDirectories.create_tuttle_dirs()
+        workflow.dump()
+        process = next(workflow.iter_processes())
+        process.set_start()
+        workflow.export_progress([process])
+        with open(join('.tuttle', 'last_workflow.journal'), 'ab') as f:
+            f.write('\x80\x02(U\x0btuttlefile_')
+        loaded = Workflow.load()
+        assert next(loaded.iter_processes()).start is not None
+
+    @isolate
+    def test_failed_append(self):
+        """ A record torn because writing has failed (eg the disk is full) should be removed, so that the records
+        appended afterwards are replayed """
+        workflow = get_workflow("""file://B <- file://A
+
+file://C <- file://B
+""")
+        TuttleDirectories.create_tuttle_dirs()
+        workflow.dump()
+        b, c = workflow.iter_processes()
+        b.set_start()
+
+        def disk_full(record, f, protocol):
+            data = dumps(record, protocol)
+            f.write(data[:len(data) // 2])
+            raise IOError(28, "No space left on device")
+
+        former_dump = journal.dump
+        journal.dump = disk_full
+        try:
+            workflow.export_progress([b], reports=False)
+            assert False, "The disk is full"
+        except IOError:
+            pass
+        finally:
+            journal.dump = former_dump
+        c.set_start()
+        workflow.export_progress([b, c], reports=False)
+        loaded = Workflow.load()
+        b, c = loaded.iter_processes()
+        assert b.start is not None
+        assert c.start is not None
+
+    @isolate(['A'])
+    def test_kill(self):
+        """ After tuttle has been killed, the processes that had completed should not be considered aborted """
+        if os.name != 'posix':
+            raise SkipTest("Killing tuttle only works on *nix")
+        project = """file://B <- file://A
+    echo B > B
+
+file://C <- file://B
+    sleep 30
+    echo C > C
+"""
+        with open('tuttlefile', "w") as f:
+            f.write(project)
+        code = "import sys; from tuttle.commands import run; sys.exit(run('tuttlefile'))"
+        proc = Popen([sys.executable, "-c", code])
+        try:
+            end = time() + 20
+            workflow = None
+            while time() < end:
+                workflow = Workflow.load()
+                if workflow is not None and workflow.find_process_that_creates('file://C').start is not None:
+                    break
+                sleep(0.1)
+        finally:
+            tree = psutil.Process(proc.pid).children(recursive=True)
+            proc.kill()
+            proc.wait()
+            for child in tree:
+                child.kill()
+        workflow = Workflow.load()
+        WorkflowRunner.mark_unfinished_processes_as_failure(workflow, export=False)
+        assert workflow.find_process_that_creates('file://B').success is True
+        assert workflow.signature('file://B') is not None
+        c = workflow.find_process_that_creates('file://C')
+        assert c.success is False and c.error_message.find("aborted") > -1
@@ -471,6 +471,68 @@ file://file3 <- file://file2
         except InvalidProcessorError:
             assert True
 
+    def test_process_options(self):
+        """ Options can follow the processor name, as name=value or as flags """
+        pp = ProjectParser()
+        project = "file:///result1 <- file:///source1 ! python cpu=4 mem=2G exclusive"
+        pp.set_project(project)
+        pp.read_line()
+        process = pp.parse_dependencies_and_processor()
+        assert process._processor.name == "python"
+        assert process.option('cpu') == 4, process.option('cpu')
+        assert process.option('mem') == 2 * 1024 * 1024 * 1024, process.option('mem')
+        assert process.option('exclusive') is True
+
+    def test_process_default_options(self):
+        """ Options have default values : one worker, no memory, not exclusive """
+        pp = ProjectParser()
+        project = "file:///result1 <- file:///source1 ! shell"
+        pp.set_project(project)
+        pp.read_line()
+        process = pp.parse_dependencies_and_processor()
+        assert process.option('cpu') == 1
+        assert process.option('mem') == 0
+        assert process.option('exclusive') is False
+        assert process.option('timeout') is None
+
+    def test_timeout_option(self):
+        """ The timeout of a process can be in seconds or a duration """
+        pp = ProjectParser()
+        project = "file:///result1 <- file:///source1 ! shell timeout=1h30min\n" \
+                  "file:///result2 <- file:///source2 ! shell timeout=90"
+        pp.set_project(project)
+        pp.read_line()
+        process = pp.parse_dependencies_and_processor()
+        assert process.option('timeout') == 5400, process.option('timeout')
+        pp.read_line()
+        process = pp.parse_dependencies_and_processor()
+        assert process.option('timeout') == 90, process.option('timeout')
+
+    def test_unknown_process_option(self):
+        """ Should raise an error with the line number when an option is unknown """
+        pp = ProjectParser()
+        project = "file:///result1 <- file:///source1 ! shell gpu=2"
+        pp.set_project(project)
+        pp.read_line()
+        try:
+            process = pp.parse_dependencies_and_processor()
+            assert False
+        except ParseError as e:
+            assert str(e).find('Unknown option "gpu"') >= 0, str(e)
+            assert str(e).find('line 1') >= 0, str(e)
+
+    def test_invalid_process_option(self):
+        """ Should raise an error when the value of an option is not valid """
+        pp = ProjectParser()
+        project = "file:///result1 <- file:///source1 ! shell cpu=many"
+        pp.set_project(project)
+        pp.read_line()
+        try:
+            process = pp.parse_dependencies_and_processor()
+            assert False
+        except ParseError as e:
+            assert str(e).find('Invalid value for option "cpu"') >= 0, str(e)
+
     def test_recognize_inclusion(self):
         """ Parser should recognize an include statement"""
         pp = ProjectParser()
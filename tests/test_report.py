@@ -1,8 +1,25 @@
 # -*- coding: utf-8 -*-
+from json import loads
 from os.path import isfile, join
-from re import search, DOTALL, findall
+from re import findall
 
 from tests.functional_tests import isolate, run_tuttle_file
+from tests.test_project_parser import ProjectParser
+from tuttle.report.html_repport import create_html_report, DATA_CALLBACK, PROCESSES_CALLBACK, LARGE_REPORT, \
+    CODE_CHUNK, name_prefix, process_cluster
+from tuttle.tuttle_directories import TuttleDirectories
+
+
+def read_script(filename, callback):
+    """ :return: the data a script of the report gives to the page """
+    content = open(filename).read().strip()
+    assert content.startswith(callback + "(") and content.endswith(");"), content
+    return loads(content[len(callback) + 1:-2])
+
+
+def report_data(report_dir='.tuttle'):
+    """ :return: the data displayed by the report """
+    return read_script(join(report_dir, 'report_data.js'), DATA_CALLBACK)
 
 
 class TestReport:
@@ -18,11 +35,9 @@ class TestReport:
         assert rcode == 0
         report_path = join('.tuttle', 'report.html')
         assert isfile(report_path)
-        report = open(report_path).read()
-        title_match = search(r'<h1>.*Success.*</h1>', report, DOTALL)
-        assert title_match, report
-        title_2_match = search(r'<h2.*Success.*</h2>', report, DOTALL)
-        assert title_2_match, report
+        data = report_data()
+        assert data['status'] == 'SUCCESS', data
+        assert any(process['success'] is True for process in data['processes'].values()), data
 
     @isolate(['A'])
     def test_failure(self):
@@ -40,11 +55,9 @@ file://C <- file://B
         assert rcode == 2
         report_path = join('.tuttle', 'report.html')
         assert isfile(report_path)
-        report = open(report_path).read()
-        title_match = search(r'<h1>.*Failure.*</h1>', report, DOTALL)
-        assert title_match, report
-        title_2_match = search(r'<h2.*Failure.*</h2>', report, DOTALL)
-        assert title_2_match, report
+        data = report_data()
+        assert data['status'] == 'FAILURE', data
+        assert any(process['success'] is False for process in data['processes'].values()), data
 
     @isolate(['A'])
     def test_a_failure_in_a_process_without_output_should_be_marked_in_the_repoort(self):
@@ -56,11 +69,9 @@ file://C <- file://B
         assert rcode == 2
         report_path = join('.tuttle', 'report.html')
         assert isfile(report_path)
-        report = open(report_path).read()
-        title_match = search(r'<h1>.*Failure.*</h1>', report, DOTALL)
-        assert title_match, report
-        title_2_match = search(r'<h2.*Failure.*</h2>', report, DOTALL)
-        assert title_2_match, report
+        data = report_data()
+        assert data['status'] == 'FAILURE', data
+        assert any(process['success'] is False for process in data['processes'].values()), data
 
     @isolate(['A'])
     def test_all_relative_links_must_exists(self):
@@ -95,3 +106,80 @@ file://C <- file://B
             rel_path = link[1].split('/')
             path = join('.tuttle', *rel_path)
             assert isfile(path), path
+
+    @isolate
+    def test_incremental_report(self):
+        """ The page should be written once per workflow, then each export should only update the data file """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A
+    echo A produces B > B
+""")
+        workflow = pp.parse_project()
+        TuttleDirectories.create_tuttle_dirs()
+        report_path = join('.tuttle', 'report.html')
+        create_html_report(workflow, report_path)
+        assert report_data()['status'] == 'NOT_FINISHED'
+        page = open(report_path).read()
+        assert page.find('echo A produces B') > -1, page
+        with open(report_path, 'a') as f:
+            f.write('<!-- already written -->')
+        process = next(workflow.iter_processes())
+        process.set_start()
+        process.set_end(False, "Failure on purpose")
+        create_html_report(workflow, report_path)
+        assert open(report_path).read().endswith('<!-- already written -->')
+        data = report_data()
+        assert data['status'] == 'FAILURE', data
+        assert data['processes'][process.id]['error_message'] == "Failure on purpose", data
+        assert data['dot_src'].find('color=red') > -1, data
+
+    @isolate
+    def test_running_process_logs(self):
+        """ The size of the logs of a running process should be updated at each export """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A
+    echo A produces B > B
+""")
+        workflow = pp.parse_project()
+        TuttleDirectories.create_tuttle_dirs()
+        report_path = join('.tuttle', 'report.html')
+        process = next(workflow.iter_processes())
+        process.assign_paths('reserved', 'stdout.txt', 'stderr.txt')
+        open('stdout.txt', 'w').close()
+        open('stderr.txt', 'w').close()
+        process.set_start()
+        create_html_report(workflow, report_path)
+        assert report_data()['processes'][process.id]['log_stdout_size'] == "running"
+        open('stdout.txt', 'w').write("A" * 2048)
+        create_html_report(workflow, report_path)
+        size = report_data()['processes'][process.id]['log_stdout_size']
+        assert size == "2.0 KB, running", size
+
+    def test_name_prefix(self):
+        """ Resources generated in a loop should have the same name prefix """
+        assert name_prefix("file://data/part_12.csv") == "file://data/part"
+        assert name_prefix("file://data/part-3") == "file://data/part"
+        assert name_prefix("file://result.csv") == "file://result.csv"
+        assert name_prefix("sqlite://db.sqlite/tables/t2016") == "sqlite://db.sqlite/tables/t"
+
+    @isolate
+    def test_large_report(self):
+        """ The page of a large workflow should not describe every process. The processes and their code should be
+        written aside, and the graph should be drawn by the page from groups of processes """
+        nb = LARGE_REPORT + 1
+        pp = ProjectParser()
+        pp.set_project("".join("file://part_{0} <- file://A\n    echo {0} > part_{0}\n\n".format(i) for i in range(nb)))
+        workflow = pp.parse_project()
+        TuttleDirectories.create_tuttle_dirs()
+        create_html_report(workflow, join('.tuttle', 'report.html'))
+        page = open(join('.tuttle', 'report.html')).read()
+        assert page.find('echo 1 > part_1') == -1
+        processes = read_script(join('.tuttle', 'report_processes.js'), PROCESSES_CALLBACK)
+        assert len(processes) == nb
+        assert set(process['cluster'] for process in processes) == {"_ : file://part"}
+        process = next(workflow.iter_processes())
+        assert process_cluster(process) == "_ : file://part"
+        assert isfile(join('.tuttle', 'report_code_{}.js'.format(nb // CODE_CHUNK)))
+        data = report_data()
+        assert data['dot_src'] is None
+        assert len(data['processes']) == nb
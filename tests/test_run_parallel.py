@@ -3,11 +3,18 @@ from os.path import isfile, abspath, exists
 
 from tests.test_project_parser import ProjectParser
 from tests.functional_tests import run_tuttle_file, isolate
+from tuttle.process import ProcessTask
 from tuttle.resource import FileResource
 from tuttle.tuttle_directories import TuttleDirectories
-from tuttle.workflow_runner import WorkflowRunner
+from tuttle.utils import DescendantsCpu
+from tuttle.workflow_runner import WorkflowRunner, RunnableProcesses, AUTO_WORKERS, run_process_in_worker
 from tuttle.workflow import Workflow
 from time import time, sleep
+from os import getpid
+from pickle import dumps, loads
+from multiprocessing import cpu_count, Pool
+from subprocess import Popen
+import sys
 
 
 class BuggyProcessor:
@@ -21,6 +28,39 @@ class BuggyProcessor:
         raise Exception("Unexpected error in processor")
 
 
+class UnbuildableResource(FileResource):
+    # This class must remain at module level because it is serialized
+    """ A resource that can't be rebuilt in a worker """
+
+    def __init__(self, url):
+        raise Exception("Can't build resource {}".format(url))
+
+
+class TargetedProcessor:
+    name = 'targeted'
+
+    def static_check(self, process):
+        pass
+
+    def concurrency_target(self, process):
+        return "dsn=my_db"
+
+
+class PidProcessor:
+    """ Writes the pid of the process it runs in, into the output """
+    # This class mus remain outside another class because it is serialized
+    name = 'pid'
+    io_bound = True
+
+    def static_check(self, process):
+        pass
+
+    def run(self, process, reserved_path, log_stdout, log_stderr):
+        for resource in process.iter_outputs():
+            with open(resource._get_path(), 'w') as f:
+                f.write(str(getpid()))
+
+
 class BuggySignatureResource(FileResource):
     # This class mus remain outside another class because it is serialized
     scheme = 'buggy'
@@ -46,6 +86,42 @@ class BuggyExistsResource(FileResource):
             return False
 
 
+class FixedHostWorkflowRunner(WorkflowRunner):
+    """ Sees a machine with a given load and free memory """
+
+    def __init__(self, nb_workers, load, available_mem, **kwargs):
+        WorkflowRunner.__init__(self, nb_workers, **kwargs)
+        self.host = load, available_mem
+
+    def sample_host(self):
+        return self.host
+
+
+class BatchCountingWorkflowRunner(WorkflowRunner):
+    """ Records the batches sent to the workers """
+
+    def __init__(self, *args, **kwargs):
+        WorkflowRunner.__init__(self, *args, **kwargs)
+        self.batches = []
+
+    def start_batch_in_background(self, batch):
+        self.batches.append(len(batch))
+        WorkflowRunner.start_batch_in_background(self, batch)
+
+
+def run_with_short_durations(project, nb_workers, keep_going=False):
+    """ Runs a workflow as if all its processes had been very short in the previous run """
+    pp = ProjectParser()
+    pp.set_project(project)
+    workflow = pp.parse_extend_and_check_project()
+    workflow.discover_resources()
+    TuttleDirectories.straighten_out_process_and_logs(workflow)
+    durations = {process: 0.01 for process in workflow.iter_processes()}
+    wr = BatchCountingWorkflowRunner(nb_workers)
+    successes, failures = wr.run_parallel_workflow(workflow, keep_going, durations)
+    return wr, workflow, successes, failures
+
+
 def run_first_process(one_process_workflow, extra_processor=None, extra_resource=None):
     """ utility method to run the first process of a workflow and assert on process result """
     pp = ProjectParser()
@@ -100,6 +176,321 @@ class TestRunParallel:
         except:
             wr.terminate_workers_and_clean_subprocesses()
 
+    def test_weighted_workers(self):
+        """ A process occupies as many workers and as much memory as its options say """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A ! shell cpu=3 mem=1K
+    echo A produces B > B
+file://C <- file://A ! shell cpu=2
+    echo A produces C > C
+file://D <- file://A ! shell mem=2K
+    echo A produces D > D
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pB = workflow.find_process_that_creates("file://B")
+        pC = workflow.find_process_that_creates("file://C")
+        pD = workflow.find_process_that_creates("file://D")
+        wr = WorkflowRunner(4, max_mem=2048)
+        wr.free_all_resources()
+        assert wr.fits(pB)
+        wr.acquire_worker(pB)
+        assert wr.workers_available() == 1
+        assert not wr.fits(pC), "Not enough workers left"
+        assert not wr.fits(pD), "Not enough memory left"
+        wr.release_worker(pB)
+        assert wr.workers_available() == 4
+        assert not wr.active_workers()
+        assert wr.fits(pD)
+
+    def test_weights_are_capped_to_capacity(self):
+        """ A process asking for more than the capacity should still be able to run alone """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A ! shell cpu=16 mem=1T
+    echo A produces B > B
+""")
+        workflow = pp.parse_extend_and_check_project()
+        process = workflow._processes[0]
+        wr = WorkflowRunner(4, max_mem=2048)
+        wr.free_all_resources()
+        assert wr.weights(process) == (4, 0, 2048), wr.weights(process)
+        assert wr.fits(process)
+
+    def test_exclusive_process_runs_alone(self):
+        """ No other process should start while an exclusive process waits for the workers, nor while it runs """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A ! shell exclusive
+    echo A produces B > B
+file://C <- file://A
+    echo A produces C > C
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pB = workflow.find_process_that_creates("file://B")
+        pC = workflow.find_process_that_creates("file://C")
+        wr = WorkflowRunner(2)
+        wr.free_all_resources()
+        assert wr.weights(pB) == (2, 2, wr._max_mem)
+        wr.acquire_worker(pC)
+        runnables = RunnableProcesses({pB: 2, pC: 1})
+        runnables.update([pB, pC])
+        assert not wr.start_processes_on_available_workers(runnables)
+        assert len(runnables) == 2, "Exclusive process should wait, and prevent the other one to start"
+        wr.release_worker(pC)
+        wr.acquire_worker(pB)
+        assert not wr.fits(pC)
+        assert not wr.workers_available()
+
+    def test_limit_by_processor(self):
+        """ No more processes than the limit of their processor should run at the same time, but other processes
+            can use the free workers """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A ! python
+    print("A produces B")
+file://C <- file://A ! python
+    print("A produces C")
+file://D <- file://A
+    echo A produces D > D
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pB = workflow.find_process_that_creates("file://B")
+        pC = workflow.find_process_that_creates("file://C")
+        pD = workflow.find_process_that_creates("file://D")
+        wr = WorkflowRunner(4, limits={'python': 1})
+        wr.free_all_resources()
+        assert wr.concurrency_keys(pB) == ['python']
+        assert wr.concurrency_keys(pD) == []
+        wr.acquire_worker(pB)
+        assert not wr.fits(pC), "Limit for python processor has been reached"
+        assert wr.fits(pD)
+        wr.release_worker(pB)
+        assert wr.fits(pC)
+
+    def test_limit_by_target(self):
+        """ Limits can apply to the target of the processor, eg a database """
+        pp = ProjectParser()
+        pp.wb._processors[TargetedProcessor.name] = TargetedProcessor()
+        pp.set_project("""file://B <- file://A ! targeted
+file://C <- file://A ! targeted
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pB = workflow.find_process_that_creates("file://B")
+        pC = workflow.find_process_that_creates("file://C")
+        wr = WorkflowRunner(4, limits={'dsn=my_db': 1})
+        wr.free_all_resources()
+        assert wr.concurrency_keys(pB) == ['dsn=my_db']
+        wr.acquire_worker(pB)
+        assert not wr.fits(pC)
+        wr.release_worker(pB)
+        assert wr.fits(pC)
+
+    def test_descendants_cpu(self):
+        """ The cpu used by the processes we have started should be measured since the previous measure """
+        busy = Popen([sys.executable, "-c", "while True: pass"])
+        try:
+            cpu = DescendantsCpu()
+            assert cpu.measure() == 0, "Processes are not counted until they have been seen once"
+            sleep(1)
+            assert cpu.measure() > 0.2
+        finally:
+            busy.kill()
+            busy.wait()
+        assert cpu.measure() == 0
+
+    def test_hold_back_when_load_is_high(self):
+        """ No process should start while the load is over the max, unless nothing is running """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A
+    echo A produces B > B
+file://C <- file://A
+    echo A produces C > C
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pB = workflow.find_process_that_creates("file://B")
+        pC = workflow.find_process_that_creates("file://C")
+        wr = FixedHostWorkflowRunner(4, load=8, available_mem=2 ** 30, max_load=4)
+        wr.free_all_resources()
+        assert not wr.host_saturated(), "A process can always start when nothing runs"
+        wr.acquire_worker(pB)
+        assert wr.host_saturated()
+        runnables = RunnableProcesses({pC: 1})
+        runnables.update([pC])
+        assert not wr.start_processes_on_available_workers(runnables)
+        assert len(runnables) == 1, "Process should wait for the load to drop"
+        wr.host = 1, 2 ** 30
+        wr._host_sample = None
+        assert not wr.host_saturated()
+
+    def test_hold_back_when_memory_is_low(self):
+        """ No process should start while the free memory is under the min, and the processes just started
+        count in the memory """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A ! shell mem=600M
+    echo A produces B > B
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pB = workflow.find_process_that_creates("file://B")
+        wr = FixedHostWorkflowRunner(4, load=0, available_mem=1024 * 1024 * 1024, min_free_mem=512 * 1024 * 1024)
+        wr.free_all_resources()
+        wr.acquire_worker()
+        assert not wr.host_saturated()
+        wr.account_for_start(pB)
+        assert wr.host_saturated(), "Memory of the process just started should count until next measure"
+
+    def test_auto_workers(self):
+        """ With an automatic number of workers, the load and the memory of the machine are watched """
+        wr = WorkflowRunner(AUTO_WORKERS)
+        assert wr.nb_workers() == cpu_count()
+        assert wr._max_load == cpu_count()
+        assert wr._min_free_mem > 0
+
+    def test_batchable(self):
+        """ Only processes that were short in the previous run and that only need a worker can join a batch """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A
+    echo A produces B > B
+file://C <- file://A ! shell cpu=2
+    echo A produces C > C
+file://D <- file://A
+    echo A produces D > D
+file://E <- file://A
+    echo A produces E > E
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pB = workflow.find_process_that_creates("file://B")
+        pC = workflow.find_process_that_creates("file://C")
+        pD = workflow.find_process_that_creates("file://D")
+        pE = workflow.find_process_that_creates("file://E")
+        wr = WorkflowRunner(4)
+        wr._durations = {pB: 0.01, pC: 0.01, pD: 10}
+        assert wr.batchable(pB)
+        assert not wr.batchable(pC), "Process needs more than a worker"
+        assert not wr.batchable(pD), "Process is too long"
+        assert not wr.batchable(pE), "Process has never run"
+
+    def test_pop_batch(self):
+        """ Batches should leave processes for the other free workers, and should not take long processes """
+        sections = ["file://out_{0} <- file://A\n    echo > out_{0}".format(i) for i in range(10)]
+        pp = ProjectParser()
+        pp.set_project("\n".join(sections))
+        workflow = pp.parse_extend_and_check_project()
+        processes = workflow._processes
+        wr = WorkflowRunner(2)
+        wr.free_all_resources()
+        wr._durations = {process: 0.01 for process in processes}
+        wr._durations[processes[1]] = 10
+        runnables = RunnableProcesses({process: -i for i, process in enumerate(processes)})
+        runnables.update(processes)
+        batch = wr.pop_batch(runnables)
+        assert len(batch) == 5, len(batch)
+        assert processes[1] not in batch
+        assert len(runnables) == 5
+
+    @isolate(['A'])
+    def test_run_short_processes_in_batches(self):
+        """ Short processes should run by batches, each one with its own logs, status and signatures """
+        sections = ["file://out_{0} <- file://A\n    echo produces {0}\n    echo {0} > out_{0}".format(i)
+                    for i in range(12)]
+        wr, workflow, successes, failures = run_with_short_durations("\n".join(sections), 2)
+        assert len(successes) == 12 and not failures
+        assert len(wr.batches) < 12, wr.batches
+        assert max(wr.batches) > 1, wr.batches
+        for i in range(12):
+            process = workflow.find_process_that_creates("file://out_{}".format(i))
+            assert process.success
+            assert process.start <= process.end
+            assert open(process.log_stdout).read() == "produces {}\n".format(i)
+            assert workflow.signature("file://out_{}".format(i)) is not None
+
+    @isolate(['A'])
+    def test_failure_in_batch(self):
+        """ The processes of a batch that come after a failure should not run, unless keep going """
+        sections = ["file://out_{0} <- file://A\n    error\n".format(i) for i in range(8)]
+        wr, workflow, successes, failures = run_with_short_durations("\n".join(sections), 1)
+        assert wr.batches == [8], wr.batches
+        assert len(failures) == 1 and not successes
+        not_run = [process for process in workflow.iter_processes() if process.start is None]
+        assert len(not_run) == 7, len(not_run)
+        wr, workflow, successes, failures = run_with_short_durations("\n".join(sections), 1, keep_going=True)
+        assert len(failures) == 8, len(failures)
+
+    @isolate(['A'])
+    def test_io_bound_process_runs_in_a_thread(self):
+        """ Processes of I/O bound processors should run in the main process, not in a worker process """
+        one_process_workflow = """file://B <- file://A ! pid
+        """
+        process = run_first_process(one_process_workflow, PidProcessor())
+        assert process.success, process.error_message
+        assert open('B').read() == str(getpid())
+
+    def test_io_workers_are_separate(self):
+        """ I/O bound processes can start when all the workers are busy with other processes """
+        pp = ProjectParser()
+        pp.wb._processors[PidProcessor.name] = PidProcessor()
+        pp.set_project("""file://B <- file://A ! pid
+file://C <- file://A ! pid
+file://D <- file://A
+    echo A produces D > D
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pB = workflow.find_process_that_creates("file://B")
+        pC = workflow.find_process_that_creates("file://C")
+        pD = workflow.find_process_that_creates("file://D")
+        wr = WorkflowRunner(1, nb_io_workers=1)
+        wr.free_all_resources()
+        wr.acquire_worker(pD)
+        assert not wr.workers_available()
+        assert wr.fits(pB)
+        wr.acquire_worker(pB)
+        assert not wr.fits(pC), "All the I/O workers are busy"
+        wr.release_worker(pB)
+        wr.release_worker(pD)
+        assert not wr.active_workers()
+
+    def test_process_task(self):
+        """ A worker should be able to rebuild the process from the task, without the rest of the workflow """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A
+    echo A produces B > B
+file://C <- file://B ! python cpu=2
+    print("B produces C")
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pC = workflow.find_process_that_creates("file://C")
+        pC.assign_paths("reserved", "stdout", "stderr")
+        task = loads(dumps(ProcessTask(pC)))
+        process = task.build_process()
+        assert process.id == pC.id
+        assert process.code == pC.code
+        assert process.processor.name == "python"
+        assert process.option('cpu') == 2
+        assert process.input_urls() == {"file://B"}
+        assert process.output_urls() == {"file://C"}
+        assert process._reserved_path == "reserved" and process.log_stdout == "stdout"
+        assert process.pick_an_output().creator_process is process
+        assert next(process.iter_inputs()).creator_process is None, "The task should not reference other processes"
+
+    def test_process_task_that_cant_be_built(self):
+        """ A worker that can't rebuild a process should report it as failed, otherwise the runner would wait for it
+        forever """
+        pp = ProjectParser()
+        pp.set_project("""file://B <- file://A
+    echo A produces B > B
+""")
+        workflow = pp.parse_extend_and_check_project()
+        pB = workflow.find_process_that_creates("file://B")
+        task = ProcessTask(pB)
+        task.inputs = [(UnbuildableResource, "file://A", None, None)]
+        results = []
+        pool = Pool(1)
+        try:
+            pool.apply_async(run_process_in_worker, [task], callback=results.append)
+        finally:
+            pool.close()
+            pool.join()
+        [(success, error_msg, signatures)] = results
+        assert success is False
+        assert error_msg.find(pB.id) > -1, error_msg
+        assert error_msg.find("Can't build resource file://A") > -1, error_msg
+
     def test_background_process(self):
         """ Starting a process in background should end up with the process beeing
             added to the list of completed processes"""
@@ -125,6 +516,43 @@ class TestRunParallel:
         finally:
             wr.terminate_workers_and_clean_subprocesses()
 
+    def test_wait_for_completed_processes(self):
+        """ Waiting for completion should return as soon as the running process ends, without polling """
+        first = """file://B <- file://A
+            sleep 0.2
+            echo A produces B > B
+        """
+
+        pp = ProjectParser()
+        pp.set_project(first)
+        workflow = pp.parse_extend_and_check_project()
+        process = workflow._processes[0]
+
+        wr = WorkflowRunner(3)
+        wr.init_workers()
+        try:
+            wr.start_process_in_background(process)
+            timeout = time() + 2.0
+            while time() < timeout and not wr.wait_for_completed_processes():
+                pass
+            assert wr._completed_processes, "Process should have stopped now"
+            assert not wr.active_workers()
+            assert process.end is not None
+            assert time() - process.end < 0.1, "Should have been notified right after the process ended"
+        finally:
+            wr.terminate_workers_and_clean_subprocesses()
+
+    def test_wait_for_completed_processes_without_running_process(self):
+        """ Waiting for completion should not block if no process is running """
+        wr = WorkflowRunner(2)
+        wr.init_workers()
+        try:
+            start = time()
+            assert not wr.wait_for_completed_processes()
+            assert time() - start < WorkflowRunner.COMPLETION_WAIT_TIMEOUT
+        finally:
+            wr.terminate_workers_and_clean_subprocesses()
+
     @isolate(['A'])
     def test_error_before_all_processes_complete(self):
         """ When a process stops in error, tuttle should wait for all running processes to complete and no
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from tests.functional_tests import isolate
+from tests.test_project_parser import ProjectParser
+from tuttle.scheduling import past_durations, estimated_durations, remaining_critical_paths, default_duration, \
+    DEFAULT_DURATION, simulate_schedule, critical_path, worker_utilisation
+from tuttle.tuttle_directories import TuttleDirectories
+from tuttle.workflow_runner import WorkflowRunner
+
+
+def get_workflow(project_source):
+    pp = ProjectParser()
+    pp.set_project(project_source)
+    return pp.parse_project()
+
+
+class TestScheduling:
+
+    def test_past_durations(self):
+        """ Durations should be retrieved from successful processes of the previous workflow, even if their
+        position in the tuttlefile have changed """
+        previous = get_workflow("""file://B <- file://A
+            echo B > B
+
+ <- file://B
+            echo Nothing produced
+
+file://C <- file://B
+            error
+            """)
+        for process, duration, success in zip(previous.iter_processes(), [10, 3, 5], [True, True, False]):
+            process.set_start()
+            process.set_end(success, None)
+            process._start = process._end - duration
+        workflow = get_workflow("""
+
+file://C <- file://B
+            error
+
+file://B <- file://A
+            echo B > B
+
+ <- file://B
+            echo Nothing produced
+            """)
+        durations = past_durations(workflow, previous)
+        assert {p.id: d for p, d in durations.items()} == {"__6": 10, "__9": 3}, durations
+
+    def test_no_previous_workflow(self):
+        """ Without a previous workflow, every process should be estimated with the default duration """
+        workflow = get_workflow("""file://B <- file://A""")
+        assert past_durations(workflow, None) == {}
+        estimations = estimated_durations(workflow, {})
+        assert estimations.values() == [DEFAULT_DURATION], estimations
+
+    def test_default_duration(self):
+        """ A process that never ran should be expected to last as long as the median process """
+        assert default_duration({'a': 1, 'b': 100, 'c': 3}) == 3
+
+    def test_remaining_critical_paths(self):
+        """ The critical path of a process should be its duration plus the longest critical path among the processes
+        that depend on it """
+        workflow = get_workflow("""file://B <- file://A
+file://C <- file://B
+file://D <- file://B
+file://E <- file://C file://D
+file://F <- file://A
+""")
+        processes = {p.id: p for p in workflow.iter_processes()}
+        estimations = {processes["__1"]: 1, processes["__2"]: 2, processes["__3"]: 5, processes["__4"]: 3,
+                       processes["__5"]: 4}
+        critical_paths = remaining_critical_paths(workflow, estimations)
+        assert {p.id: cp for p, cp in critical_paths.items()} == \
+               {"__1": 9, "__2": 5, "__3": 8, "__4": 3, "__5": 4}, critical_paths
+
+    @isolate(['A'])
+    def test_longest_path_first(self):
+        """ With one worker, the process at the head of the longest chain should run first, even if it comes
+        last in the tuttlefile """
+        workflow = get_workflow("""file://short <- file://A
+            echo short > short
+
+file://long1 <- file://A
+            echo long1 > long1
+
+file://long2 <- file://long1
+            echo long2 > long2
+            """)
+        workflow.static_check_processes()
+        workflow.discover_resources()
+        TuttleDirectories.create_tuttle_dirs()
+        TuttleDirectories.straighten_out_process_and_logs(workflow)
+        processes = {p.id: p for p in workflow.iter_processes()}
+        durations = {processes["__1"]: 1, processes["__4"]: 2, processes["__7"]: 2}
+        wr = WorkflowRunner(1)
+        successes, failures = wr.run_parallel_workflow(workflow, durations=durations)
+        assert not failures
+        assert [p.id for p in successes] == ["__4", "__7", "__1"], [p.id for p in successes]
+
+    def test_simulate_schedule(self):
+        """ The simulation should start processes as soon as their inputs and a worker are available """
+        workflow = get_workflow("""file://B <- file://A
+file://C <- file://A
+file://D <- file://A
+file://E <- file://B file://C
+""")
+        workflow._signatures = {"file://A": "sig A"}
+        durations = {workflow.find_process_that_creates(url): d
+                     for url, d in [("file://B", 10), ("file://C", 2), ("file://D", 4), ("file://E", 1)]}
+        wr = WorkflowRunner(2)
+        schedule, makespan = simulate_schedule(workflow, durations, wr)
+        timeline = [(process.output_urls().pop(), start, end) for process, start, end in schedule]
+        # B is on the critical path, so it starts first
+        assert timeline == [("file://B", 0, 10), ("file://D", 0, 4), ("file://C", 4, 6), ("file://E", 10, 11)], \
+            timeline
+        assert makespan == 11
+        assert worker_utilisation(schedule, makespan, wr) == 17.0 / 22, worker_utilisation(schedule, makespan, wr)
+        path = critical_path(workflow, durations)
+        assert [process.output_urls().pop() for process in path] == ["file://B", "file://E"], path
+
+    def test_simulate_schedule_skips_blocked_processes(self):
+        """ Processes whose inputs will never be available should not be part of the simulation """
+        workflow = get_workflow("""file://B <- file://A
+file://C <- file://B file://Z
+""")
+        workflow._signatures = {"file://A": "sig A"}
+        schedule, makespan = simulate_schedule(workflow, estimated_durations(workflow, {}), WorkflowRunner(1))
+        assert [process.id for process, start, end in schedule] == ["__1"], schedule
+        assert makespan == DEFAULT_DURATION
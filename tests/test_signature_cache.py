@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import os
+from os.path import abspath, isfile, join
+from time import time
+
+from tests.functional_tests import isolate
+from tuttle.resource import FileResource
+from tuttle.hashing import HASH_VARIABLE
+from tuttle.signature_cache import cached_signature, CACHE_VARIABLE, TRUST_MTIME_VARIABLE
+from tuttle.tuttle_directories import TuttleDirectories
+from tuttle.utils import EnvVar
+
+
+class CountingSignature:
+    """ Counts the times a signature is computed """
+
+    def __init__(self, signature="sha1:a"):
+        self.signature = signature
+        self.nb_calls = 0
+
+    def __call__(self):
+        self.nb_calls += 1
+        return self.signature
+
+
+def write_old_file(path, content):
+    """ Writes a file modified long enough ago to be cached """
+    with open(path, "w") as f:
+        f.write(content)
+    # Whole seconds, that os.utime() sets without rounding
+    past = int(time()) - 60
+    os.utime(path, (past, past))
+
+
+class TestSignatureCache:
+
+    @isolate
+    def test_unchanged_file(self):
+        """ A file should only be hashed again if it has changed """
+        TuttleDirectories.create_tuttle_dirs()
+        write_old_file('A', 'A')
+        compute = CountingSignature()
+        assert cached_signature(abspath('A'), compute) == "sha1:a"
+        assert cached_signature(abspath('A'), compute) == "sha1:a"
+        assert compute.nb_calls == 1
+        write_old_file('A', 'AA')
+        cached_signature(abspath('A'), compute)
+        assert compute.nb_calls == 2
+
+    @isolate
+    def test_other_algorithm(self):
+        """ A signature should be computed again if the hash algorithm has changed """
+        TuttleDirectories.create_tuttle_dirs()
+        write_old_file('A', 'A')
+        cached_signature(abspath('A'), CountingSignature())
+        compute = CountingSignature("sha256:a")
+        with EnvVar(HASH_VARIABLE, 'sha256'):
+            assert cached_signature(abspath('A'), compute) == "sha256:a"
+            assert cached_signature(abspath('A'), compute) == "sha256:a"
+        assert compute.nb_calls == 1
+
+    @isolate
+    def test_racy_file(self):
+        """ The signature of a file that has just been modified should not be stored, because it could change again
+        within the same modification time """
+        TuttleDirectories.create_tuttle_dirs()
+        with open('A', 'w') as f:
+            f.write('A')
+        compute = CountingSignature()
+        cached_signature(abspath('A'), compute)
+        cached_signature(abspath('A'), compute)
+        assert compute.nb_calls == 2
+
+    @isolate
+    def test_trust_mtime(self):
+        """ A file copied with the same size and modification time should be hashed again, unless modification times
+        are trusted """
+        TuttleDirectories.create_tuttle_dirs()
+        write_old_file('A', 'A')
+        compute = CountingSignature()
+        cached_signature(abspath('A'), compute)
+        stat = os.stat('A')
+        os.rename('A', 'B')
+        write_old_file('A', 'B')
+        os.utime('A', (stat.st_atime, stat.st_mtime))
+        with EnvVar(TRUST_MTIME_VARIABLE, '1'):
+            assert cached_signature(abspath('A'), compute) == "sha1:a"
+        assert compute.nb_calls == 1
+        cached_signature(abspath('A'), compute)
+        assert compute.nb_calls == 2
+
+    @isolate
+    def test_shared_cache(self):
+        """ The cache can be anywhere, to be shared across projects """
+        write_old_file('A', 'A')
+        with EnvVar(CACHE_VARIABLE, abspath('signatures.sqlite')):
+            sig = FileResource("file://A").signature()
+        assert sig == "sha1:6dcd4ce23d88e2ee9568ba546c007c63d9131c1b", sig
+        assert isfile('signatures.sqlite')
+        assert not isfile(join('.tuttle', 'signatures.sqlite'))
+
+    @isolate
+    def test_no_tuttle_directory(self):
+        """ Without a tuttle directory, files should be hashed every time """
+        write_old_file('A', 'A')
+        compute = CountingSignature()
+        cached_signature(abspath('A'), compute)
+        cached_signature(abspath('A'), compute)
+        assert compute.nb_calls == 2
+        assert not isfile(join('.tuttle', 'signatures.sqlite'))
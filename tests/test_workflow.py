@@ -146,3 +146,92 @@ file://B <- file://A
         assert processes, processes
         p = processes.pop()
         assert p.id.find("_5") >= 0, p.id
+
+    @isolate(['A'])
+    def test_discover_runnable_processes(self):
+        """ When a process completes, only the processes that depend on it and have all their inputs should become
+        runnable """
+        workflow = self.get_workflow(
+            """file://B <- file://A
+            echo B > B
+
+file://C <- file://A
+            echo C > C
+
+file://D <- file://B file://C
+            echo D > D
+
+file://E <- file://B
+            echo E > E
+            """)
+        workflow.discover_resources()
+        runnables = workflow.runnable_processes()
+        assert {p.id for p in runnables} == {"__1", "__4"}, [p.id for p in runnables]
+        p_b = workflow.find_process_that_creates("file://B")
+        p_b.set_start()
+        p_b.set_end(True, None)
+        workflow.update_signatures({"file://B": "sig B"})
+        new_runnables = workflow.discover_runnable_processes(p_b)
+        assert {p.id for p in new_runnables} == {"__10"}, [p.id for p in new_runnables]
+        p_c = workflow.find_process_that_creates("file://C")
+        p_c.set_start()
+        p_c.set_end(True, None)
+        workflow.update_signatures({"file://C": "sig C"})
+        new_runnables = workflow.discover_runnable_processes(p_c)
+        assert {p.id for p in new_runnables} == {"__7"}, [p.id for p in new_runnables]
+
+    def test_circular_groups(self):
+        """ Each group of processes referencing one another should be reported separately, without the processes
+        that are only blocked by the groups """
+        workflow = self.get_workflow(
+            """file://A <- file://B
+
+file://B <- file://A
+
+file://C <- file://D
+
+file://D <- file://C
+
+file://E <- file://A file://F
+
+file://G <- file://G
+            """)
+        groups = workflow.circular_groups()
+        assert [[p.id for p in group] for group in groups] == [["__1", "__3"], ["__5", "__7"], ["__11"]], groups
+        assert len(workflow.circular_references()) == 6
+
+    def test_dependency_order(self):
+        """ Processes should be iterated after the processes they depend on """
+        workflow = self.get_workflow(
+            """file://D <- file://B file://C
+
+file://C <- file://B
+
+file://B <- file://A
+
+file://E <- file://A
+            """)
+        order = [p.id for p in workflow.iter_processes_on_dependency_order()]
+        assert order == ["__5", "__7", "__3", "__1"], order
+        assert not workflow.circular_groups()
+
+    def test_select_ancestors(self):
+        """ Selecting a resource should select the processes needed to build it, and their inputs and outputs """
+        workflow = self.get_workflow(
+            """file://B <- file://A
+            echo B > B
+
+file://C <- file://B
+            echo C > C
+
+file://D <- file://A
+            echo D > D
+
+file://E <- file://C file://D
+            echo E > E
+            """)
+        workflow.select(["file://C"])
+        assert [p.id for p in workflow.iter_selected_processes()] == ["__1", "__4"]
+        urls = {resource.url for resource in workflow.iter_selected_resources()}
+        assert urls == {"file://A", "file://B", "file://C"}, urls
+        assert not workflow.is_selected(workflow.find_process_that_creates("file://E"))
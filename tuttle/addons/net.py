@@ -10,6 +10,10 @@ try:
 except ImportError:
     from urllib.request import urlopen, Request
     from urllib.error import URLError, HTTPError
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
 from tuttle.error import TuttleError
 from tuttle.resource import ResourceMixIn
 from tuttle.version import version
@@ -104,6 +108,8 @@ class DownloadProcessor:
     """ A processor for downloading http resources
     """
     name = 'download'
+    # Spends its time waiting for the network : runs in a thread rather than in a worker process
+    io_bound = True
 
     def __init__(self):
         self._to_download = None
@@ -132,6 +138,12 @@ class DownloadProcessor:
                     result = resource
         return result
 
+    def concurrency_target(self, process):
+        """ The host to download from, so that --limit can cap the processes hitting the same server """
+        to_download = DownloadProcessor.the_downloadable_resource(process.iter_inputs())
+        if to_download:
+            return urlparse(to_download.url).hostname
+
     def static_check(self, process):
         inputs = [res for res in process.iter_inputs()]
         outputs = [res for res in process.iter_outputs()]
@@ -153,19 +165,19 @@ class DownloadProcessor:
         self.reader2writer(fin, fout, notifier)
 
     def run_pycurl(self, to_download, fout, notifier):
-        self._progress_b = 0
-        self._progress_hMB = 0
+        # Progress is kept out of the processor because several downloads can run in threads at the same time
+        progress = {'b': 0, 'hMB': 0}
 
         def show_progress(download_t, download_d, upload_t, upload_d):
-            if download_d >= download_t and download_d > self._progress_b:
+            if download_d >= download_t and download_d > progress['b']:
                 notifier.write('.')
-                self._progress_b = download_t
-            elif download_d > self._progress_b + 32768:
+                progress['b'] = download_t
+            elif download_d > progress['b'] + 32768:
                 notifier.write('.')
-                self._progress_b = download_d
-            if download_d > self._progress_hMB + 100 * 1024 * 1024:
-                self._progress_hMB = download_d
-                notifier.write('\n{} / {}\n'.format(nice_size(self._progress_hMB), nice_size(download_t)))
+                progress['b'] = download_d
+            if download_d > progress['hMB'] + 100 * 1024 * 1024:
+                progress['hMB'] = download_d
+                notifier.write('\n{} / {}\n'.format(nice_size(progress['hMB']), nice_size(download_t)))
 
         c = pycurl.Curl()
         c.setopt(c.URL, to_download.url)
@@ -5,8 +5,8 @@ from re import compile
 from urlparse import parse_qs
 
 from tuttle.error import TuttleError
+from tuttle.hashing import new_hash, hash_algorithm, digest_signature
 from tuttle.resource import MalformedUrl, ResourceMixIn
-from hashlib import sha1
 import pyodbc
 
 
@@ -116,25 +116,26 @@ class ODBCResource(ResourceMixIn, object):
         finally:
             conn.close()
 
-    def relation_hash(self, db, relation, filters):
+    def relation_hash(self, db, relation, filters, algorithm):
         """Generate a hash for the contents of a table."""
-        checksum = sha1()
+        checksum = new_hash(algorithm)
         cur = db.cursor()
         where, values = self.where_filter(filters)
         cur.execute('SELECT * FROM "{}" {}'.format(relation, where), values)
         for row in cur:
             for field in row:
                 checksum.update(str(field))
-        return checksum.hexdigest()
+        return digest_signature(algorithm, checksum.hexdigest())
 
-    def signature(self):
+    def signature(self, algorithm=None):
+        algorithm = algorithm or hash_algorithm()
         conn_string = "dsn={}".format(self._dsn)
         try:
             conn = pyodbc.connect(conn_string)
         except pyodbc.InterfaceError:
             return False
         try:
-            return self.relation_hash(conn, self._relation, self._filters)
+            return self.relation_hash(conn, self._relation, self._filters, algorithm)
         finally:
             conn.close()
 
@@ -160,6 +161,8 @@ class ODBCProcessor:
     """ A processor that runs sql directly in an odbc database
     """
     name = 'odbc'
+    # Spends its time waiting for the database : runs in a thread rather than in a worker process
+    io_bound = True
 
     def _get_db_connection_string(self, process):
         conn_string = None
@@ -174,6 +177,10 @@ class ODBCProcessor:
                         "Found connections string '{}' and '{}'.".format(conn_string, resource_conn_string))
         return conn_string
 
+    def concurrency_target(self, process):
+        """ The DSN the process connects to, so that --limit can cap the processes hitting the same database """
+        return self._get_db_connection_string(process)
+
     def static_check(self, process):
         # Will raise if there is an ambiguity on the database
         for resource in chain(process.iter_inputs(), process.iter_outputs()):
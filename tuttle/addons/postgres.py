@@ -4,8 +4,8 @@ from itertools import chain
 from re import compile
 from tuttle.addons.netutils import hostname_resolves
 from tuttle.error import TuttleError
+from tuttle.hashing import new_hash, hash_algorithm, digest_signature
 from tuttle.resource import MalformedUrl, ResourceMixIn
-from hashlib import sha1
 import psycopg2
 
 
@@ -173,9 +173,9 @@ class PostgreSQLResource(ResourceMixIn, object):
         finally:
             db.close()
 
-    def table_signature(self, db, schema, tablename):
+    def table_signature(self, db, schema, tablename, algorithm):
         """Generate a hash for the contents of a table."""
-        checksum = sha1()
+        checksum = new_hash(algorithm)
         cur = db.cursor()
         query = """SELECT *
                     FROM information_schema.columns
@@ -190,7 +190,7 @@ class PostgreSQLResource(ResourceMixIn, object):
         for row in cur:
             for field in row:
                 checksum.update(str(field))
-        return checksum.hexdigest()
+        return digest_signature(algorithm, checksum.hexdigest())
 
     def view_signature(self, db, schema, tablename):
         """Returns the definition of the view"""
@@ -203,9 +203,9 @@ class PostgreSQLResource(ResourceMixIn, object):
         row = cur.fetchone()
         return row[0]
 
-    def function_signature(self, db, schema, name):
+    def function_signature(self, db, schema, name, algorithm):
         """Returns a hash of the function source."""
-        checksum = sha1()
+        checksum = new_hash(algorithm)
         cur = db.cursor()
         query = """SELECT p.proname, n.nspname AS schema, p.prosrc
                      FROM pg_proc p
@@ -215,7 +215,7 @@ class PostgreSQLResource(ResourceMixIn, object):
         cur.execute(query, (name, schema, ))
         _, _, function_src = cur.fetchone()
         checksum.update(str(function_src))
-        return checksum.hexdigest()
+        return digest_signature(algorithm, checksum.hexdigest())
 
     def schema_signature(self, db, name):
         """Returns the owner of the schema."""
@@ -229,7 +229,8 @@ class PostgreSQLResource(ResourceMixIn, object):
         _, owner = cur.fetchone()
         return "owner : {}".format(owner)
 
-    def signature(self):
+    def signature(self, algorithm=None):
+        algorithm = algorithm or hash_algorithm()
         try:
             conn_string = "host=\'{}\' dbname='{}' port={}".format(self._server, self._database,
                                                                    self._port)
@@ -240,11 +241,11 @@ class PostgreSQLResource(ResourceMixIn, object):
         try:
             object_type = self.pg_object_type(db, self._schema, self._objectname)
             if object_type == self.TYPE_TABLE:
-                result = self.table_signature(db, self._schema, self._objectname)
+                result = self.table_signature(db, self._schema, self._objectname, algorithm)
             elif object_type == self.TYPE_VIEW:
                 result = self.view_signature(db, self._schema, self._objectname)
             elif object_type == self.TYPE_FUNCTION:
-                result = self.function_signature(db, self._schema, self._objectname)
+                result = self.function_signature(db, self._schema, self._objectname, algorithm)
             elif object_type == self.TYPE_SCHEMA:
                 result = self.schema_signature(db, self._schema)
         finally:
@@ -261,6 +262,8 @@ class PostgresqlProcessor:
     """ A processor that runs sql directely in a postgres database
     """
     name = 'postgresql'
+    # Spends its time waiting for the database : runs in a thread rather than in a worker process
+    io_bound = True
 
     def _get_db_connection_string(self, process):
         conn_string = None
@@ -276,6 +279,10 @@ class PostgresqlProcessor:
                         "Found connections string '{}' and '{}'.".format(conn_string , resource_conn_string))
         return conn_string
 
+    def concurrency_target(self, process):
+        """ The database the process connects to, so that --limit can cap the processes hitting the same server """
+        return self._get_db_connection_string(process)
+
     def static_check(self, process):
         # Will raise if there is an ambiguity on the database
         for resource in chain(process.iter_inputs(), process.iter_outputs()):
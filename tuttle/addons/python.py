@@ -1,13 +1,41 @@
 # -*- coding: utf8 -*-
 
+import os
+import sys
+from importlib import import_module
 from os import path, mkdir
-from tuttle.processors import run_and_log
+from tuttle.error import TuttleError
+from tuttle.processors import run_and_log, fork_and_log, ProcessExecutionError
+
+
+def preload_modules(modules):
+    """ Imports the modules in the current process, so that they are already loaded in the processes forked
+    from it. Modules already imported cost nothing
+    :raises ProcessExecutionError: if a module can't be imported
+    """
+    # Like the code of the processes, modules can come from the workspace
+    if os.getcwd() not in sys.path:
+        sys.path.append(os.getcwd())
+    for module in modules:
+        if module not in sys.modules:
+            try:
+                import_module(module)
+            except Exception as e:
+                raise ProcessExecutionError("Can't preload module {} : {}".format(module, e))
+
+
+def run_script(script):
+    """ Runs a python script in the current interpreter, as if it was the main program """
+    sys.argv = [script]
+    execfile(script, {'__name__': '__main__', '__file__': script})
 
 
 class PythonProcessor:
     """ A processor to run python2 code
     """
     name = 'python'
+    # Stops the interpreter, or the forked child in warm mode, after the timeout option
+    supports_timeout = True
     header = u"""# -*- coding: utf8 -*-
 from os import getcwd as __get_current_dir__
 from sys import path as __python__path__
@@ -27,10 +55,19 @@ __python__path__.append(__get_current_dir__())
             f.write(process.code.encode('utf8'))
         return script_name
 
+    @staticmethod
+    def is_warm(process):
+        return process.option('warm') or len(process.option('preload')) > 0
+
     def run(self, process, reserved_path, log_stdout, log_stderr):
         script = self.generate_executable(process, reserved_path)
-        run_and_log(["python", script], log_stdout, log_stderr)
+        if self.is_warm(process):
+            # The worker acts as a zygote : it imports the modules once, then forks for every process it runs
+            preload_modules(process.option('preload'))
+            fork_and_log(lambda: run_script(script), log_stdout, log_stderr, process.option('timeout'))
+        else:
+            run_and_log(["python", script], log_stdout, log_stderr, process.option('timeout'))
 
     def static_check(self, process):
-        pass
-
+        if self.is_warm(process) and not hasattr(os, 'fork'):
+            raise TuttleError("Process {} can't run in warm mode on this system".format(process.id))
@@ -7,8 +7,8 @@ from os import remove
 from os.path import isfile
 from re import compile
 from tuttle.error import TuttleError
+from tuttle.hashing import new_hash, hash_algorithm, digest_signature
 from tuttle.resource import MalformedUrl, ResourceMixIn
-from hashlib import sha1
 
 
 class SQLiteTuttleError(TuttleError):
@@ -19,6 +19,8 @@ class SQLiteProcessor:
     """ A processor for Windows command line
     """
     name = 'sqlite'
+    # Spends its time waiting for the sqlite database : runs in a thread rather than in a worker process
+    io_bound = True
 
     def _get_sqlite_file(self, process):
         filename = None
@@ -98,9 +100,9 @@ class SQLiteResource(ResourceMixIn, object):
             db.close()
         return True
 
-    def table_signature(self, db, tablename):
+    def table_signature(self, db, tablename, algorithm):
         """Generate a hash for the contents of a file."""
-        checksum = sha1()
+        checksum = new_hash(algorithm)
         cur = db.cursor()
         cur.execute("SELECT sql FROM sqlite_master WHERE name=?", (self.objectname, ))
         row = cur.fetchone()
@@ -109,7 +111,7 @@ class SQLiteResource(ResourceMixIn, object):
         for row in cur:
             for field in row:
                 checksum.update(field)
-        return checksum.hexdigest()
+        return digest_signature(algorithm, checksum.hexdigest())
 
     def db_declaration(self, db, objectname):
         """Generate a hash for the contents of a file."""
@@ -118,13 +120,14 @@ class SQLiteResource(ResourceMixIn, object):
         row = cur.fetchone()
         return row[0]
 
-    def signature(self):
+    def signature(self, algorithm=None):
+        algorithm = algorithm or hash_algorithm()
         db = sqlite3.connect(self.db_file)
         db.text_factory = str
         try:
             obj_type = self.sqlite_object_type(db, self.objectname)
             if obj_type == "table":
-                result = self.table_signature(db, self.objectname)
+                result = self.table_signature(db, self.objectname, algorithm)
             elif obj_type == "index" or obj_type == "view" or obj_type == "trigger":
                 result = self.db_declaration(db, self.objectname)
         finally:
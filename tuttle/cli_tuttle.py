@@ -4,8 +4,11 @@
 import sys
 from os.path import abspath, exists
 from argparse import ArgumentParser, ArgumentTypeError
-from tuttle.commands import run, invalidate
-from tuttle.figures_formating import parse_duration
+from tuttle.commands import run, invalidate, worker, merge_shards
+from tuttle.figures_formating import parse_duration, parse_size
+from tuttle.remote import parse_address
+from tuttle.sharding import parse_shard
+from tuttle.workflow_runner import AUTO_WORKERS
 from tuttle.utils import CurrentDir
 from tuttle.version import version
 
@@ -17,6 +20,46 @@ def check_minus_1_or_positive(value):
     return ivalue
 
 
+def check_jobs(value):
+    if value == AUTO_WORKERS:
+        return value
+    try:
+        return check_minus_1_or_positive(value)
+    except ValueError:
+        raise ArgumentTypeError("%s is an invalid positive int value, -1 or auto" % value)
+
+
+def check_load(value):
+    try:
+        load = float(value)
+    except ValueError:
+        load = 0
+    if load <= 0:
+        raise ArgumentTypeError("%s is an invalid load : expected a positive number" % value)
+    return load
+
+
+def check_address(value):
+    try:
+        return parse_address(value)
+    except ValueError as e:
+        raise ArgumentTypeError(e.message)
+
+
+def check_shard(value):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise ArgumentTypeError(e.message)
+
+
+def check_positive(value):
+    ivalue = int(value)
+    if ivalue <= 0:
+        raise ArgumentTypeError("%s is an invalid positive int value" % value)
+    return ivalue
+
+
 def check_duration(value):
     if len(value) == 0:
         raise ArgumentTypeError("Duration can't be empty")
@@ -33,6 +76,26 @@ def check_duration(value):
         raise ArgumentTypeError(e.message)
 
 
+def check_size(value):
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise ArgumentTypeError(e.message)
+
+
+def check_limit(value):
+    key, equal, limit = value.rpartition('=')
+    if not key:
+        raise ArgumentTypeError('"{}" is not a valid limit : expected KEY=N'.format(value))
+    try:
+        nb = int(limit)
+    except ValueError:
+        nb = 0
+    if nb <= 0:
+        raise ArgumentTypeError('"{}" is not a valid limit : N must be a positive int'.format(value))
+    return key, nb
+
+
 def tuttle_main():
     try:
         parser = ArgumentParser(
@@ -65,14 +128,49 @@ def tuttle_main():
                                            help='Run the missing part of workflow')
         parser_run.add_argument('-j', '--jobs',
                                 help='Number of workers (to run processes in parallel)\n'
-                                     '-1 = half of the number of cpus',
+                                     '-1 = half of the number of cpus\n'
+                                     'auto = as many as the cpus, but new processes wait while the machine is '
+                                     'busy (see --max-load and --min-free-mem)',
                                 default=1,
-                                type=check_minus_1_or_positive)
+                                type=check_jobs)
+        parser_run.add_argument('--max-load',
+                                help="Don't start new processes while the load of the machine is over this value, "
+                                     "unless nothing is running. Default with -j auto is the number of cpus",
+                                default=None,
+                                dest='max_load',
+                                type=check_load)
+        parser_run.add_argument('--min-free-mem',
+                                help="Don't start new processes while the free memory of the machine is under this "
+                                     "size, eg 2G, unless nothing is running. Default with -j auto is 5%% of the "
+                                     "memory",
+                                default=None,
+                                dest='min_free_mem',
+                                type=check_size)
+        parser_run.add_argument('--io-jobs',
+                                help='Number of threads to run processes of I/O bound processors (download, sqlite, '
+                                     'postgresql, odbc) in parallel. Default is the number of workers',
+                                default=None,
+                                dest='io_jobs',
+                                type=check_positive)
+        parser_run.add_argument('--jobserver',
+                                help="Share the workers with the programs run by the processes that understand the "
+                                     "jobserver of GNU make (eg make -j or a nested tuttle run), so that they don't "
+                                     "run more jobs all together. When tuttle itself runs in a make -j, it always "
+                                     "shares the jobs of make",
+                                default=False,
+                                dest='jobserver',
+                                action="store_true")
         parser_run.add_argument('-k', '--keep-going',
                                 help="Don't stop when a process fail : run all the processes you can",
                                 default=False,
                                 dest='keep_going',
                                 action="store_true")
+        parser_run.add_argument('--fail-fast',
+                                help="When a process fails, stop the processes that are still running instead of "
+                                     "waiting for them to complete. Ignored with --keep-going",
+                                default=False,
+                                dest='fail_fast',
+                                action="store_true")
         parser_run.add_argument('-i', '--check-integrity',
                                 help="Check integrity of all resources in case some have changed outside of tuttle.\n"
                                      "Requires to compute signature of every resource produced by tuttle, which can "
@@ -80,18 +178,115 @@ def tuttle_main():
                                 default=False,
                                 dest='check_integrity',
                                 action="store_true")
+        parser_run.add_argument('-m', '--max-mem',
+                                help="Memory the processes can use together, according to their mem option, "
+                                     "eg 16G. Default is the memory of the machine",
+                                default=None,
+                                dest='max_mem',
+                                type=check_size)
+        parser_run.add_argument('-l', '--limit',
+                                help="Maximum number of processes running at the same time for a processor or for a "
+                                     "target, as KEY=N. KEY can be the name of a processor (eg download=2), a host "
+                                     "for the download processor, a DSN for the odbc processor "
+                                     "(eg dsn=my_db=4) or a connection string for the postgresql processor. "
+                                     "Can be repeated",
+                                default=[],
+                                dest='limits',
+                                action='append',
+                                type=check_limit)
+        parser_run.add_argument('-n', '--dry-run',
+                                help="Don't remove nor run anything : show the processes that would run and an "
+                                     "estimation of the duration of the run, based on the durations of the "
+                                     "previous run",
+                                default=False,
+                                dest='dry_run',
+                                action="store_true")
+        parser_run.add_argument('--listen',
+                                help="Let worker agents on other machines run processes, as HOST:PORT where they "
+                                     "can connect (see tuttle worker). The machines must share the file system of "
+                                     "the workspace, and the secret key in the TUTTLE_AUTHKEY environment variable",
+                                default=None,
+                                dest='listen',
+                                type=check_address)
+        parser_run.add_argument('--export-interval',
+                                help="Minimum time between two updates of the report while the workflow runs, in "
+                                     "seconds or as a DURATION (see --threshold). The updates happen in the "
+                                     "background. Default is 1 second",
+                                default=None,
+                                dest='export_interval',
+                                type=check_duration)
+        parser_run.add_argument('--serve',
+                                help="Serve the report on HOST:PORT while the workflow runs, eg localhost:8000. "
+                                     "The page is updated as soon as processes start or end",
+                                default=None,
+                                dest='serve',
+                                type=check_address)
+        parser_run.add_argument('--shard',
+                                help="Only run the i-th of N parts of the workflow, as i/N. The parts are balanced "
+                                     "according to the durations of the previous run. Each part runs on its own "
+                                     "machine sharing the file system of the workspace, and waits for the resources "
+                                     "created by the other parts. Then run tuttle merge-shards",
+                                default=None,
+                                dest='shard',
+                                type=check_shard)
+        parser_run.add_argument('--shard-timeout',
+                                help="With --shard, fail the processes whose inputs have not been created by the "
+                                     "other parts after this time, in seconds or as a DURATION (see --threshold). "
+                                     "Default is to wait until the parts that create them end",
+                                default=None,
+                                dest='shard_timeout',
+                                type=check_duration)
+        parser_run.add_argument('targets', help='url of the resources to build. Only the processes needed to build '
+                                                'them will run. Default is the whole workflow', nargs="*")
         parser_invalidate = subparsers.add_parser('invalidate', parents=[parent_parser],
                                                   help='Remove some resources already computed and all their dependencies')
         parser_invalidate.add_argument('resources', help='url of the resources to invalidate', nargs="*")
+        parser_worker = subparsers.add_parser('worker',
+                                              help='Run processes for a tuttle run --listen on another machine')
+        parser_worker.add_argument('address', help='HOST:PORT the tuttle run listens to', type=check_address)
+        parser_worker.add_argument('-j', '--jobs',
+                                   help='Number of workers (to run processes in parallel)\n'
+                                        '-1 = half of the number of cpus',
+                                   default=-1,
+                                   type=check_minus_1_or_positive)
+        parser_worker.add_argument('-w', '--workspace',
+                                   default=None,
+                                   dest='workspace',
+                                   help='Directory of the workspace, if the shared file system is not mounted at the '
+                                        'same place as on the machine of the tuttle run')
+        parser_worker.add_argument('--once',
+                                   help="Stop when the run is over instead of waiting for the next one",
+                                   default=False,
+                                   dest='once',
+                                   action="store_true")
+        parser_merge_shards = subparsers.add_parser('merge-shards',
+                                                    help='Gather the results of the shards of a run with --shard')
+        parser_merge_shards.add_argument('-w', '--workspace',
+                                         default='.',
+                                         dest='workspace',
+                                         help='Directory where the workspace lies. Default is the current directory')
         params = parser.parse_args(sys.argv[1:])
 
+        if params.command == 'worker':
+            return worker(params.address, params.jobs, params.workspace, params.once)
+        if params.command == 'merge-shards':
+            with CurrentDir(params.workspace):
+                return merge_shards()
+
         tuttlefile_path = abspath(params.tuttlefile)
         if not exists(tuttlefile_path):
             print "No tuttlefile"
             sys.exit(2)
         with CurrentDir(params.workspace):
             if params.command == 'run':
-                return run(tuttlefile_path, params.threshold, params.jobs, params.keep_going, params.check_integrity)
+                # By keyword : run() has many options, that must not be shifted when a new one comes
+                return run(tuttlefile_path, threshold=params.threshold, nb_workers=params.jobs,
+                           keep_going=params.keep_going, check_integrity=params.check_integrity,
+                           max_mem=params.max_mem, limits=dict(params.limits), nb_io_workers=params.io_jobs,
+                           targets=params.targets, dry_run=params.dry_run, fail_fast=params.fail_fast,
+                           max_load=params.max_load, min_free_mem=params.min_free_mem, jobserver=params.jobserver,
+                           listen=params.listen, shard=params.shard, shard_timeout=params.shard_timeout,
+                           export_interval=params.export_interval, serve=params.serve)
             elif params.command == 'invalidate':
                 return invalidate(tuttlefile_path, params.resources, params.threshold)
     except KeyboardInterrupt:
@@ -2,18 +2,42 @@ from tuttle.error import TuttleError
 from tuttle.figures_formating import nice_duration
 from tuttle.invalidation import InvalidCollector
 from tuttle.project_parser import ProjectParser
+from tuttle.report.report_server import ReportServer
+from tuttle.scheduling import past_durations, estimated_durations, simulate_schedule, critical_path, \
+    worker_utilisation
+from tuttle.sharding import shard_dir, check_not_run, partition, resources_to_remove, CrossShardInputs, \
+    shard_running, merge_shards as merge_shard_workflows
 from tuttle.workflow import Workflow
 from tuttle.workflow_builder import WorkflowBuilder
+from tuttle.remote import authkey_from_env
+from tuttle import signature_cache
+from tuttle.worker_agent import run_agent, get_logger
 from tuttle.workflow_runner import WorkflowRunner
 from tuttle_directories import TuttleDirectories
 from os.path import abspath
 
 
-def load_project(tuttlefile):
+def load_project(tuttlefile, targets=None, dry_run=False):
+    """ Parses the project and discovers its resources
+    :param targets: urls of the resources to build. If given, only the resources needed to build them are discovered
+    :param dry_run: if True, nothing is written : the preprocesses don't run and the signatures are not cached
+    :return: the workflow
+    """
     pp = ProjectParser()
-    workflow = pp.parse_and_check_file(tuttlefile)
-    print("Discovering {} resources...".format(workflow.nb_resources()))
-    workflow.discover_resources()
+    workflow = pp.parse_and_check_file(tuttlefile, run_preprocesses=not dry_run)
+    if dry_run and workflow.has_preprocesses():
+        print("Preprocesses don't run in a dry run : the processes they add are the ones of the previous run")
+    if targets:
+        unknown = [url for url in targets if not workflow.find_resource(url)]
+        if unknown:
+            raise TuttleError("Tuttle cannot build {} : not part of the workflow".format(", ".join(unknown)))
+        workflow.select(targets)
+        nb_resources = len([resource for resource in workflow.iter_selected_resources()])
+    else:
+        nb_resources = workflow.nb_resources()
+    print("Discovering {} resources...".format(nb_resources))
+    with signature_cache.read_only(dry_run):
+        workflow.discover_resources()
     return workflow
 
 
@@ -71,70 +95,208 @@ def print_lost_sec(inv_duration):
     print("{} of processing will be lost".format(nice_duration(inv_duration)))
 
 
-def run(tuttlefile, threshold=-1, nb_workers=-1, keep_going=False, check_integrity=False):
+def print_shard(shard, processes, workflow):
+    to_run = [process for process in workflow.iter_selected_processes() if process.start is None]
+    nb_in_shard = len([process for process in to_run if process in processes])
+    print("Shard {}/{} runs {} of the {} processes to run. Run tuttle merge-shards when all the shards are "
+          "done".format(shard[0], shard[1], nb_in_shard, len(to_run)))
+
+
+def print_plan(workflow, durations, runner):
+    """ Prints the processes that would run, and the simulation of the run with the workers of the runner """
+    estimations = estimated_durations(workflow, durations)
+    schedule, makespan = simulate_schedule(workflow, estimations, runner)
+    if not schedule:
+        print("No process would run")
+        return
+
+    def process_line(process):
+        if process in durations:
+            return "* {} : {}".format(process.id, nice_duration(estimations[process]))
+        else:
+            return "* {} : {} (has never run, estimated)".format(process.id, nice_duration(estimations[process]))
+
+    print("The following {} process(es) would run :".format(len(schedule)))
+    for process, start, end in schedule:
+        print(process_line(process))
+    path = critical_path(workflow, estimations)
+    print("Critical path ({}) :".format(nice_duration(sum(estimations[process] for process in path))))
+    for process in path:
+        print(process_line(process))
+    print("Estimated duration with {} worker(s) : {}".format(runner.nb_workers(), nice_duration(makespan)))
+    print("Average worker utilisation : {:.0f}%".format(100 * worker_utilisation(schedule, makespan, runner)))
+
+
+def run(tuttlefile, threshold=-1, nb_workers=-1, keep_going=False, check_integrity=False, max_mem=None, limits=None,
+        nb_io_workers=None, targets=None, dry_run=False, fail_fast=False, max_load=None, min_free_mem=None,
+        jobserver=False, listen=None, shard=None, export_interval=None, serve=None, shard_timeout=None):
+    """ Runs the workflow described in tuttlefile
+    :param dry_run: if True, only prints what would be invalidated and run, with an estimation of the duration.
+    Nothing is removed nor run
+    :param listen: host and port where worker agents can connect to run processes (see worker())
+    :param shard: (i, N) to run only the i-th of N parts of the workflow, in its own tuttle directory. The other parts
+    run on other machines sharing the workspace, then merge_shards() gathers them (see sharding.py)
+    :param shard_timeout: seconds after which a shard fails the processes whose inputs have not been created by the
+    other shards. Default is to wait until these shards end
+    :param export_interval: minimum time in seconds between two updates of the report while the workflow runs
+    :param serve: host and port where to serve the report while the workflow runs (see report/report_server.py).
+    Then the report files are only updated at the end of the run
+    """
+    if shard is None:
+        root = TuttleDirectories.main_dir()
+    else:
+        root = shard_dir(shard)
+    with TuttleDirectories.use_root(root):
+        if shard is not None:
+            try:
+                check_not_run(shard)
+            except TuttleError as e:
+                print(e)
+                return 2
+        # The other shards wait for the resources of this one until it has ended
+        with shard_running(shard if not dry_run else None):
+            try:
+                workflow = load_project(tuttlefile, targets, dry_run)
+                authkey = None
+                if listen is not None and not dry_run:
+                    authkey = authkey_from_env()
+            except TuttleError as e:
+                print(e)
+                return 2
+
+            missing = workflow.primary_inputs_not_available()
+            if missing:
+                print_missing_input(missing)
+                return 2
+
+            # A shard starts from the workflow of the workspace, not from its own directory
+            previous_workflow = Workflow.load(TuttleDirectories.main_dir("last_workflow.pickle"))
+            if previous_workflow:
+                # TODO : check that tuttle is not running before running again !
+                WorkflowRunner.mark_unfinished_processes_as_failure(previous_workflow,
+                                                                    export=not dry_run and shard is None)
+
+            durations = past_durations(workflow, previous_workflow)
+            inv_collector = InvalidCollector(previous_workflow)
+            inv_collector.retrieve_common_processes_form_previous(workflow)
+            if shard is not None:
+                # Only depends on the tuttlefile and on the previous run, so that every shard finds the same partition
+                parts = partition(workflow, estimated_durations(workflow, durations), shard[1])
+                shard_processes = parts[shard[0] - 1]
+            inv_collector.insure_dependency_coherence(workflow, [], False, check_integrity)
+            # A shard only removes the invalid resources of its own processes
+            to_remove = None
+            if shard is not None:
+                to_remove = resources_to_remove(workflow, shard_processes, inv_collector.resources_to_invalidate(),
+                                                shard[0] == 1)
+
+            inv_duration = inv_collector.duration()  # compute duration before reset
+            inv_collector.reset_execution_info()  # Ensure invalid failure process are reseted
+
+            failing_process = workflow.pick_a_failing_process()
+            if failing_process and not keep_going:
+                # check before invalidate
+                print_failing_process(failing_process)
+                return 2
+
+            if inv_collector._resources_and_reasons:  # BETTER TEST NEEDED HERE
+                inv_collector.warn_remove_resoures(to_remove)
+                if -1 < threshold <= inv_duration:
+                    print_abort_on_threshold(inv_duration, threshold)
+                    return 2
+                else:
+                    print_lost_sec(inv_duration)
+
+            report_server = None
+            if serve is not None and not dry_run:
+                try:
+                    report_server = ReportServer(workflow, serve, TuttleDirectories.tuttle_dir())
+                except TuttleError as e:
+                    print(e)
+                    return 2
+            wr = WorkflowRunner(nb_workers, max_mem=max_mem, limits=limits, nb_io_workers=nb_io_workers,
+                                max_load=max_load, min_free_mem=min_free_mem, jobserver=jobserver, listen=listen,
+                                authkey=authkey, export_interval=export_interval, report_server=report_server)
+            if shard is not None:
+                print_shard(shard, shard_processes, workflow)
+            if dry_run:
+                inv_collector.straighten_out_signatures(workflow)
+                print_plan(workflow, durations, wr)
+                return 0
+
+            # We have to remove resources, even if there is no previous workflow,
+            # because of resources that may not have been produced by tuttle
+            inv_collector.remove_resources(workflow, to_remove)
+            inv_collector.straighten_out_signatures(workflow)
+            cross_shard_inputs = None
+            if shard is not None:
+                workflow.select_processes(shard_processes)
+                cross_shard_inputs = CrossShardInputs(workflow, shard, parts, shard_timeout)
+            TuttleDirectories.straighten_out_process_and_logs(workflow)
+            workflow.export()
+
+            if report_server is not None:
+                report_server.start()
+                print("Live report at {}".format(report_server.url()))
+            try:
+                success_processes, failure_processes = wr.run_parallel_workflow(workflow, keep_going, durations,
+                                                                                fail_fast, cross_shard_inputs)
+            finally:
+                if report_server is not None:
+                    report_server.close()
+            if failure_processes:
+                print_failures(failure_processes)
+                return 2
+
+            if success_processes:
+                print_success()
+                if failing_process:
+                    print_earlier_failures()
+                    return 2
+            elif inv_collector.something_to_invalidate():
+                print_updated()
+            else:
+                print_nothing_to_do()
+                if failing_process:
+                    print_earlier_failures()
+                    return 2
+
+            return 0
+
+
+def worker(address, nb_workers=-1, workspace=None, once=False):
+    """ Runs a worker agent, that runs processes for the tuttle run listening on address, usually on another machine
+    sharing the same file system. The secret key is read from the environment (see remote.py)
+    :param workspace: directory of the workspace, if not mounted at the same place as on the coordinator
+    :param once: stop after the first run instead of waiting for the next one
+    """
     try:
-        workflow = load_project(tuttlefile)
+        authkey = authkey_from_env()
+        get_logger()
+        if workspace is not None:
+            workspace = abspath(workspace)
+        return run_agent(address, authkey, nb_workers, workspace, once)
     except TuttleError as e:
         print(e)
         return 2
 
-    missing = workflow.primary_inputs_not_available()
-    if missing:
-        print_missing_input(missing)
-        return 2
 
-    previous_workflow = Workflow.load()
-    if previous_workflow:
-        # TODO : check that tuttle is not running before running again !
-        WorkflowRunner.mark_unfinished_processes_as_failure(previous_workflow)
-
-    inv_collector = InvalidCollector(previous_workflow)
-    inv_collector.retrieve_common_processes_form_previous(workflow)
-    inv_collector.insure_dependency_coherence(workflow, [], False, check_integrity)
-
-    inv_duration = inv_collector.duration()  # compute duration before reset
-    inv_collector.reset_execution_info()  # Ensure invalid failure process are reseted
-
-    failing_process = workflow.pick_a_failing_process()
-    if failing_process and not keep_going:
-        # check before invalidate
-        print_failing_process(failing_process)
+def merge_shards():
+    """ Gathers the shards of a run with --shard into the workspace, with a single report """
+    try:
+        workflow, shards = merge_shard_workflows()
+    except TuttleError as e:
+        print(e)
         return 2
-
-    if inv_collector._resources_and_reasons:  # BETTER TEST NEEDED HERE
-        inv_collector.warn_remove_resoures()
-        if -1 < threshold <= inv_duration:
-            print_abort_on_threshold(inv_duration, threshold)
-            return 2
-        else:
-            print_lost_sec(inv_duration)
-
-    # We have to remove resources, even if there is no previous workflow,
-    # because of resources that may not have been produced by tuttle
-    inv_collector.remove_resources(workflow)
-    inv_collector.straighten_out_signatures(workflow)
-    TuttleDirectories.straighten_out_process_and_logs(workflow)
-    workflow.export()
-
-    wr = WorkflowRunner(nb_workers)
-    success_processes, failure_processes = wr.run_parallel_workflow(workflow, keep_going)
-    if failure_processes:
-        print_failures(failure_processes)
+    nb_shards = shards[0][1]
+    print("Merged shards {} of {}".format(", ".join(str(index) for index, count in shards), nb_shards))
+    if len(shards) < nb_shards:
+        print("Processes of the shards that have not run are left as they were before the run")
+    failures = [process for process in workflow.iter_processes() if process.success is False]
+    if failures:
+        print_failures(failures)
         return 2
-
-    if success_processes:
-        print_success()
-        if failing_process:
-            print_earlier_failures()
-            return 2
-    elif inv_collector.something_to_invalidate():
-        print_updated()
-    else:
-        print_nothing_to_do()
-        if failing_process:
-            print_earlier_failures()
-            return 2
-
+    print("See report at {}".format(report_url()))
     return 0
 
 
@@ -0,0 +1,98 @@
+# -*- coding: utf8 -*-
+
+"""
+Export of a running workflow from a background thread, so that the main loop of the WorkflowRunner doesn't wait for
+the reports to be rendered before starting the next processes
+"""
+import logging
+from threading import Thread, Condition
+from time import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class BackgroundExporter:
+    """ Exports the progress of a workflow (see Workflow.export_progress()) at most once per interval : the
+    processes that start or end in the meantime are exported together. The reports only read the workflow, so they
+    can be rendered while processes go on. A failed export is logged and retried with the next one
+    """
+
+    # Minimum time in seconds before an export that has failed is tried again
+    RETRY_DELAY = 1.0
+
+    def __init__(self, workflow, interval, reports=True):
+        """
+        :param interval: minimum time in seconds between two exports
+        :param reports: False to only write the journal (see Workflow.export_progress())
+        """
+        self._workflow = workflow
+        self._interval = interval
+        self._reports = reports
+        self._pending = []
+        self._closed = False
+        self._failing = False
+        self._condition = Condition()
+        self._thread = Thread(target=self.export_in_background)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def notify(self, processes):
+        """ Asks for the export of processes that have started or ended """
+        if not processes:
+            return
+        with self._condition:
+            self._pending.extend(processes)
+            self._condition.notify()
+
+    def pop_pending(self):
+        with self._condition:
+            processes, self._pending = self._pending, []
+        # A process that has both started and ended is exported once
+        unique = []
+        seen = set()
+        for process in processes:
+            if process not in seen:
+                seen.add(process)
+                unique.append(process)
+        return unique
+
+    def export_in_background(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+            processes = self.pop_pending()
+            retry = False
+            try:
+                self._workflow.export_progress(processes, self._reports)
+                if self._failing:
+                    LOGGER.warning("Exports of the report and the journal have resumed")
+                    self._failing = False
+            except Exception:
+                if not self._failing:
+                    # Only once, not at every retry
+                    LOGGER.exception("Can't export the report and the journal. Will try again")
+                    self._failing = True
+                with self._condition:
+                    self._pending[:0] = processes
+                retry = True
+            next_export = time() + (max(self._interval, self.RETRY_DELAY) if retry else self._interval)
+            with self._condition:
+                # Events coming until then will be exported together
+                while not self._closed and time() < next_export:
+                    self._condition.wait(next_export - time())
+
+    def close(self):
+        """ Stops the thread and exports what is left, in the calling thread
+        :raises: the error of this last export, if any
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        processes = self.pop_pending()
+        if processes:
+            self._workflow.export_progress(processes, self._reports)
@@ -25,17 +25,18 @@ def nice_size(size):
 
 
 def nice_file_size(filename, running):
-    if running:
-        return "running"
+    """ The size of a log. While the process is running, the size so far """
     if not filename:
-        return ""
+        return "running" if running else ""
     try:
         file_size = path.getsize(filename)
-        if file_size == 0:
-            return "empty"
-        return nice_size(file_size)
     except error:
-        return ""
+        return "running" if running else ""
+    if running:
+        return "{}, running".format(nice_size(file_size)) if file_size else "running"
+    if file_size == 0:
+        return "empty"
+    return nice_size(file_size)
 
 
 ONE_MINUTE = timedelta(minutes=1)
@@ -80,3 +81,23 @@ def parse_duration(expression):
         days = group_value(m, 'days')
         return ((((days * 24) + hours ) * 60) + min) * 60 + sec
     raise ValueError('"{}" is not a valid duration'.format(expression))
+
+
+SIZE_REGEX = compile("^(?P<number>\d+(\.\d+)?)\s*(?P<unit>[KMGT]?)B?$")
+SIZE_UNITS = {
+    '': 1,
+    'K': KB,
+    'M': MB,
+    'G': GB,
+    'T': 1024 * GB,
+}
+
+
+def parse_size(expression):
+    """ Parses a size in bytes, eg 512, 100K, 2G or 1.5GB
+    :return: the size in bytes
+    """
+    m = SIZE_REGEX.match(expression.strip().upper())
+    if m:
+        return int(float(m.group('number')) * SIZE_UNITS[m.group('unit')])
+    raise ValueError('"{}" is not a valid size'.format(expression))
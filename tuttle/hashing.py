@@ -0,0 +1,109 @@
+# -*- coding: utf8 -*-
+
+"""
+Hash algorithms of the signatures of resources. The algorithm is chosen with the environment variable TUTTLE_HASH,
+so that the workers use the same one : sha1 (default), any algorithm of hashlib, blake2b (python 3.6+ or module
+pyblake2) or xxh64 (module xxhash).
+
+Signatures are tagged with their algorithm, eg "blake2b:<hex>", so that a signature computed with the algorithm
+used by a previous run can still be compared. For compatibility, signatures of database tables computed with sha1
+are not tagged : an untagged signature is a sha1 one.
+"""
+import hashlib
+import os
+import re
+
+from tuttle.error import TuttleError
+
+
+HASH_VARIABLE = 'TUTTLE_HASH'
+DEFAULT_ALGORITHM = 'sha1'
+TAGGED_SIGNATURE = re.compile(r"^([a-z0-9_]+):[0-9a-f]+$")
+
+
+def blake2b():
+    if hasattr(hashlib, 'blake2b'):
+        return hashlib.blake2b()
+    from pyblake2 import blake2b
+    return blake2b()
+
+
+def xxh64():
+    from xxhash import xxh64
+    return xxh64()
+
+
+# Algorithms that are not available in every hashlib
+EXTRA_ALGORITHMS = {
+    'blake2b': blake2b,
+    'xxh64': xxh64,
+}
+
+
+def known_algorithms():
+    return set(getattr(hashlib, 'algorithms', ())) | set(getattr(hashlib, 'algorithms_guaranteed', ())) | \
+           set(EXTRA_ALGORITHMS.keys())
+
+
+def new_hash(algorithm):
+    """ :return: a new hash object, with update() and hexdigest() methods
+    :raise TuttleError: if the algorithm is unknown or its module is not installed
+    """
+    if algorithm in EXTRA_ALGORITHMS:
+        try:
+            return EXTRA_ALGORITHMS[algorithm]()
+        except ImportError:
+            raise TuttleError("Hash algorithm {} is not available : its module is not installed".format(algorithm))
+    if algorithm not in known_algorithms():
+        raise TuttleError("Unknown hash algorithm '{}'. Available algorithms are : {}".format(
+            algorithm, ", ".join(sorted(known_algorithms()))))
+    return hashlib.new(algorithm)
+
+
+def algorithm_available(algorithm):
+    try:
+        new_hash(algorithm)
+        return True
+    except TuttleError:
+        return False
+
+
+def hash_algorithm():
+    """ :return: the algorithm to compute signatures with, from the environment variable TUTTLE_HASH
+    :raise TuttleError: if it is not available
+    """
+    algorithm = os.environ.get(HASH_VARIABLE) or DEFAULT_ALGORITHM
+    new_hash(algorithm)
+    return algorithm
+
+
+def digest_signature(algorithm, hexdigest):
+    """ :return: the signature of a database object from its digest. Untagged for sha1, as they have always been """
+    if algorithm == DEFAULT_ALGORITHM:
+        return hexdigest
+    return "{}:{}".format(algorithm, hexdigest)
+
+
+def signature_algorithm(signature):
+    """ :return: the algorithm of a signature, from its tag. Signatures without a known tag are sha1 ones (or don't
+    come from a hash)
+    """
+    if isinstance(signature, basestring):
+        match = TAGGED_SIGNATURE.match(signature)
+        if match and match.group(1) in known_algorithms():
+            return match.group(1)
+    return DEFAULT_ALGORITHM
+
+
+def signature_changed(resource, former_signature, signature):
+    """ Compares the signature of a resource with the one from a previous run. If they have been computed with
+    different algorithms, the resource is hashed again with the former algorithm, so that changing algorithm doesn't
+    invalidate the whole workflow
+    :return: True if the resource has changed since the former signature
+    """
+    if former_signature == signature:
+        return False
+    former_algorithm = signature_algorithm(former_signature)
+    if former_algorithm == signature_algorithm(signature) or not algorithm_available(former_algorithm):
+        return True
+    return resource.signature(former_algorithm) != former_signature
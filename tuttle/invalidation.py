@@ -1,6 +1,8 @@
 # -*- coding: utf8 -*-
 from itertools import chain
 
+from tuttle.hashing import signature_changed
+
 NOT_PRODUCED_BY_TUTTLE = "The existing resource has not been produced by tuttle"
 USER_REQUEST = "User request"
 PROCESS_HAS_FAILED = "The resource has been produced by a failing process"
@@ -29,6 +31,7 @@ class InvalidCollector:
         self._resources_and_reasons = []
         self._resources_urls = set()
         self._processes = []
+        self._invalid_processes = set()
         self._previous_processes = []
         self._previous_workflow = previous_workflow
 
@@ -50,13 +53,21 @@ class InvalidCollector:
         duration_sum = sum( (process.end - process.start for process in all_processes if process.end is not None) )
         return int(duration_sum)
 
-    def warn_remove_resoures(self):
+    def warn_remove_resoures(self, urls=None):
+        """ :param urls: if given, only the collected resources among these urls will be removed """
+        to_remove = [(resource, reason) for resource, reason in self._resources_and_reasons
+                     if urls is None or resource.url in urls]
+        if not to_remove:
+            return
         print("The following resources are not valid any more and will be removed :")
-        for resource, reason in self._resources_and_reasons:
+        for resource, reason in to_remove:
             print("* {} - {}".format(resource.url, reason))
 
-    def remove_resources(self, workflow):
+    def remove_resources(self, workflow, urls=None):
+        """ :param urls: if given, only the collected resources among these urls are removed (eg by a shard) """
         for resource, reason in self._resources_and_reasons:
+            if urls is not None and resource.url not in urls:
+                continue
             # if resource is from the workflow, we know its availability
             # but we have to check existence if it comes from the previous workflow
             if (workflow.contains_resource(resource) and workflow.resource_available(resource.url)) \
@@ -90,12 +101,24 @@ class InvalidCollector:
             if workflow.resource_available(resource.url):
                 self.collect_resource(resource, reason)
         self._processes.append(process)
+        self._invalid_processes.add(process)
+
+    def collect_unselected_process_and_outputs(self, process, reason):
+        """ Same as collect_process_and_available_outputs() for a process out of the selection : its outputs have not
+        been discovered, so we check if they exist
+        """
+        for resource in process.iter_outputs():
+            if resource.exists():
+                self.collect_resource(resource, reason)
+        self._processes.append(process)
+        self._invalid_processes.add(process)
 
     def ensure_complete_process_validity(self, workflow, process, invalidate_urls, check_integrity):
         for input_resource in process.iter_inputs():
             if input_resource.is_primary():
                 if self._previous_workflow:
-                    if self._previous_workflow.signature(input_resource.url) != workflow.signature(input_resource.url):
+                    if signature_changed(input_resource, self._previous_workflow.signature(input_resource.url),
+                                         workflow.signature(input_resource.url)):
                         reason = RESOURCE_HAS_CHANGED.format(input_resource.url)
                         self.collect_process_and_available_outputs(workflow, process, reason)
                         # All outputs have been invalidated, no need to dig further
@@ -121,7 +144,8 @@ class InvalidCollector:
                 # All outputs have been invalidated, no need to dig further
                 return
             elif check_integrity and not output_resource.is_primary() and \
-                    self._previous_workflow.signature(output_resource.url) != workflow.signature(output_resource.url):
+                    signature_changed(output_resource, self._previous_workflow.signature(output_resource.url),
+                                      workflow.signature(output_resource.url)):
                 self.collect_resource(output_resource, RESOURCE_INTEGRITY)
                 reason = BROTHER_INTEGRITY.format(output_resource.url)
                 self.collect_process_and_available_outputs(workflow, process, reason)
@@ -146,10 +170,37 @@ class InvalidCollector:
                         self.collect_resource(resource, PROCESS_HAS_FAILED)
                         #  NB : we don't collect the process itself, in order to be able to check for failing processes
 
+    def ensure_unselected_process_validity(self, workflow, process):
+        """ A process out of the selection keeps what it has produced in a previous run... unless one of its inputs
+        is computed again by this run, or is a discovered primary resource that has changed. Then it has to be
+        invalidated now, because the next runs would take its outputs as up to date
+        """
+        if not process.start:
+            return
+        for input_resource in process.iter_inputs():
+            if input_resource.is_primary():
+                # Primary resources out of the selection have not been discovered : the next run will check them
+                if self._previous_workflow and workflow.is_url_selected(input_resource.url) and \
+                        signature_changed(input_resource, self._previous_workflow.signature(input_resource.url),
+                                          workflow.signature(input_resource.url)):
+                    reason = RESOURCE_HAS_CHANGED.format(input_resource.url)
+                    self.collect_unselected_process_and_outputs(process, reason)
+                    return
+            else:
+                creator = input_resource.creator_process
+                if self.resource_invalid(input_resource.url) or creator in self._invalid_processes or \
+                        (workflow.is_selected(creator) and creator.start is None):
+                    reason = DEPENDENCY_CHANGED.format(input_resource.url)
+                    self.collect_unselected_process_and_outputs(process, reason)
+                    return
+
     def insure_dependency_coherence(self, workflow, invalidate_urls, invalidate_failures, check_integrity):
         # Take care of failing processes
         for process in workflow.iter_processes_on_dependency_order():
-            self.ensure_process_validity(workflow, process, invalidate_urls, invalidate_failures, check_integrity)
+            if workflow.is_selected(process):
+                self.ensure_process_validity(workflow, process, invalidate_urls, invalidate_failures, check_integrity)
+            else:
+                self.ensure_unselected_process_validity(workflow, process)
 
     def retrieve_common_processes_form_previous(self, workflow):
         if not self._previous_workflow:
@@ -160,6 +211,11 @@ class InvalidCollector:
                 process = workflow.similar_process(prev_process)
                 if not process:
                     self.collect_prev_process_and_not_primary_outputs(workflow, prev_process, NO_LONGER_CREATED)
+                elif not workflow.is_selected(process):
+                    # Out of the selection, a process that has changed is left to a later run. In the meantime, it is
+                    # considered as not having run
+                    if self.same_process(process, prev_process):
+                        process.retrieve_execution_info(prev_process)
                 else:
                     if process.code != prev_process.code:
                         self.collect_prev_process_and_not_primary_outputs(workflow, prev_process, PROCESS_HAS_CHANGED)
@@ -177,6 +233,11 @@ class InvalidCollector:
                         # Both process are the same
                         process.retrieve_execution_info(prev_process)
 
+    @staticmethod
+    def same_process(process, prev_process):
+        return process.code == prev_process.code and process.processor.name == prev_process.processor.name and \
+            process.input_urls() == prev_process.input_urls() and process.output_urls() == prev_process.output_urls()
+
     def straighten_out_signatures(self, workflow):
         if self._previous_workflow:
             workflow.retrieve_signatures(self._previous_workflow)
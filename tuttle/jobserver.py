@@ -0,0 +1,143 @@
+# -*- coding: utf8 -*-
+
+"""
+Compatibility with the jobserver of GNU make, so that the processes of a workflow and the programs they run
+(make -j, ninja, a nested tuttle run...) share the same number of jobs.
+
+The jobserver is a pipe holding one token (a byte) per job that can start, on top of the job every client
+holds implicitly. A client reads a token before starting an extra job and writes it back when the job has ended.
+Clients find the pipe in the MAKEFLAGS environment variable : --jobserver-auth=R,W gives the file descriptors,
+inherited from the parent, and --jobserver-auth=fifo:PATH (GNU make 4.4) gives a named pipe.
+"""
+import errno
+import os
+from re import compile
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tuttle.error import TuttleError
+
+
+JOBSERVER_AUTH_REGEX = compile("--jobserver-(?:auth|fds)=(?:fifo:(?P<fifo>\S+)|(?P<read_fd>\d+),(?P<write_fd>\d+))")
+
+TOKEN = '+'
+
+
+class JobServerError(TuttleError):
+    pass
+
+
+def fd_is_open(fd):
+    try:
+        os.fstat(fd)
+        return True
+    except OSError:
+        return False
+
+
+class JobServer:
+    """ Reads and gives back the tokens of a jobserver. Tuttle reads the tokens through its own non blocking
+    file descriptor : the descriptors shared with the programs it runs remain blocking, as they expect
+    """
+
+    def __init__(self, private_read_fd, write_fd, makeflags, tmp_dir=None, shared_fds=()):
+        self._read_fd = private_read_fd
+        self._write_fd = write_fd
+        self._makeflags = makeflags
+        self._tmp_dir = tmp_dir
+        self._shared_fds = shared_fds
+        self._tokens = []
+        self._implicit_token_used = False
+
+    @staticmethod
+    def create(nb_jobs):
+        """ Creates a jobserver for nb_jobs jobs, to share with the programs tuttle runs
+        :raises JobServerError: if the system has no named pipes (eg Windows)
+        """
+        if not hasattr(os, 'mkfifo'):
+            raise JobServerError("The jobserver is not available on this system")
+        tmp_dir = mkdtemp(prefix='tuttle-jobserver-')
+        fifo = os.path.join(tmp_dir, 'jobserver')
+        os.mkfifo(fifo, 0o600)
+        # Opening for reading and writing does not wait for a writer. The programs expect blocking reads
+        shared_read_fd = os.open(fifo, os.O_RDWR)
+        private_read_fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+        write_fd = os.open(fifo, os.O_WRONLY)
+        os.write(write_fd, TOKEN * (nb_jobs - 1))
+        makeflags = " -j{} --jobserver-auth={},{}".format(nb_jobs, shared_read_fd, write_fd)
+        return JobServer(private_read_fd, write_fd, makeflags, tmp_dir, [shared_read_fd])
+
+    @staticmethod
+    def join(makeflags):
+        """ Joins the jobserver advertised in MAKEFLAGS, if any
+        :return: the jobserver, or None if there is none, or if its pipe has not been passed to tuttle (eg the make
+        rule running tuttle is not marked as recursive with a +)
+        """
+        m = JOBSERVER_AUTH_REGEX.search(makeflags or '')
+        if not m:
+            return None
+        if m.group('fifo'):
+            path = m.group('fifo')
+            if not os.path.exists(path):
+                return None
+        else:
+            read_fd, write_fd = int(m.group('read_fd')), int(m.group('write_fd'))
+            if not fd_is_open(read_fd) or not fd_is_open(write_fd):
+                return None
+            # Opening the pipe again gives a file descriptor with its own non blocking flag (Linux only)
+            path = "/proc/self/fd/{}".format(read_fd)
+            if not os.path.exists(path):
+                return None
+        try:
+            private_read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+            if m.group('fifo'):
+                # Readers exist, so the opening does not wait
+                write_fd = os.open(path, os.O_WRONLY)
+        except OSError:
+            return None
+        return JobServer(private_read_fd, write_fd, None)
+
+    @property
+    def makeflags(self):
+        """ The value of MAKEFLAGS for the programs tuttle runs, or None if the current MAKEFLAGS is right """
+        return self._makeflags
+
+    def try_acquire(self):
+        """ Takes a token without waiting. The first job uses the implicit token of tuttle
+        :return: True if a job can start
+        """
+        if not self._implicit_token_used:
+            self._implicit_token_used = True
+            return True
+        try:
+            token = os.read(self._read_fd, 1)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return False
+            raise
+        if not token:
+            return False
+        self._tokens.append(token)
+        return True
+
+    def release(self):
+        """ Gives back the token of a job that has ended """
+        if self._tokens:
+            os.write(self._write_fd, self._tokens.pop())
+        else:
+            self._implicit_token_used = False
+
+    def release_all(self):
+        while self._tokens:
+            self.release()
+        self._implicit_token_used = False
+
+    def close(self):
+        """ Gives back the tokens still held. A jobserver created by tuttle is removed """
+        self.release_all()
+        os.close(self._read_fd)
+        if self._tmp_dir:
+            os.close(self._write_fd)
+            for fd in self._shared_fds:
+                os.close(fd)
+            rmtree(self._tmp_dir, ignore_errors=True)
@@ -0,0 +1,71 @@
+# -*- coding: utf8 -*-
+
+"""
+The state of a run is a snapshot of the workflow, last_workflow.pickle, followed by a journal of what has happened
+since : every time processes start or end, a record per process is appended to last_workflow.journal, instead of
+pickling the whole workflow again. Loading the workflow replays the journal on top of the snapshot. Writing a new
+snapshot (see Workflow.dump()) empties the journal.
+"""
+from os import remove, SEEK_END
+from os.path import splitext, exists
+from pickle import dump, load, HIGHEST_PROTOCOL
+
+
+def journal_path(snapshot_path):
+    """ :return: the path of the journal that goes with a snapshot """
+    return splitext(snapshot_path)[0] + ".journal"
+
+
+def process_record(workflow, process):
+    """ The execution info of a process, and the signatures of its outputs that are available """
+    signatures = {url: workflow.signature(url) for url in process.output_urls() if workflow.resource_available(url)}
+    return process.id, process.start, process.end, process.success, process.error_message, signatures
+
+
+def append_records(path, records):
+    """ Appends records at the end of the journal. The file is flushed, so that the records survive if tuttle is
+    killed. If writing fails (eg the disk is full), the journal is truncated back to its former size : a torn record
+    would hide the records appended when the export is retried, because the replay stops there """
+    with open(path, "ab") as f:
+        f.seek(0, SEEK_END)
+        size = f.tell()
+        try:
+            for record in records:
+                dump(record, f, HIGHEST_PROTOCOL)
+            f.flush()
+        except:
+            f.truncate(size)
+            raise
+
+
+def replay(workflow, path):
+    """ Applies the records of a journal to the workflow loaded from the snapshot. If tuttle has been killed while
+    writing a record, the replay stops at this torn record
+    :return: the number of records replayed
+    """
+    if not exists(path):
+        return 0
+    processes = {process.id: process for process in workflow.iter_processes()}
+    nb_records = 0
+    with open(path, "rb") as f:
+        while True:
+            try:
+                process_id, start, end, success, error_message, signatures = load(f)
+            except EOFError:
+                break
+            except Exception:
+                # Torn record
+                break
+            nb_records += 1
+            process = processes.get(process_id)
+            if process is None:
+                continue
+            process.restore_execution_info(start, end, success, error_message)
+            workflow.clear_signatures([url for url in process.output_urls() if url not in signatures])
+            workflow.update_signatures(signatures)
+    return nb_records
+
+
+def remove_journal(path):
+    if exists(path):
+        remove(path)
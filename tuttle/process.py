@@ -2,6 +2,60 @@
 
 from time import time
 
+from tuttle.error import TuttleError
+from tuttle.figures_formating import parse_size, parse_duration
+
+
+def parse_positive_int(value):
+    result = int(value)
+    if result <= 0:
+        raise ValueError('"{}" is not a positive integer'.format(value))
+    return result
+
+
+def parse_timeout(value):
+    """ A timeout is either a number of seconds or a duration like 1h30min """
+    try:
+        result = int(value)
+    except ValueError:
+        result = parse_duration(value)
+    if result <= 0:
+        raise ValueError('"{}" is not a positive duration'.format(value))
+    return result
+
+
+def parse_list(value):
+    """ A comma separated list, eg pandas,numpy """
+    result = tuple(item.strip() for item in value.split(',') if item.strip())
+    if not result:
+        raise ValueError("the list is empty")
+    return result
+
+
+def parse_flag(value):
+    if value is not True:
+        raise ValueError("this option doesn't take a value")
+    return True
+
+
+# Options that can follow the processor name in the declaration of a process, eg : ! shell cpu=4 mem=2G
+# For each option : the function that parses the value from the tuttlefile and the default value
+PROCESS_OPTIONS = {
+    # Number of workers the process occupies
+    'cpu': (parse_positive_int, 1),
+    # Memory the process needs, in bytes
+    'mem': (parse_size, 0),
+    # The process must run alone
+    'exclusive': (parse_flag, False),
+    # The process is stopped if it is still running after this number of seconds (processors with supports_timeout
+    # only)
+    'timeout': (parse_timeout, None),
+    # The python code runs in a child of the worker instead of a new interpreter (python processor only)
+    'warm': (parse_flag, False),
+    # Modules the worker imports before running the python code in warm mode, eg preload=pandas,numpy
+    'preload': (parse_list, ()),
+}
+
 
 class Process:
     """ Class wrapping a process. A process has some input resources, some output resources, 
@@ -22,6 +76,7 @@ class Process:
         self._reserved_path = None
         self._success = None
         self._error_message = None
+        self._options = {}
         self._id = "{}_{}".format(self._filename, self._line_num)
 
     @property
@@ -56,6 +111,28 @@ class Process:
     def processor(self):
         return self._processor
 
+    def set_option(self, name, value):
+        """ Sets an option from its textual value in the tuttlefile
+        :param name: name of the option
+        :param value: the value as a string, or True if the option is a flag
+        :raises ValueError: if the option does not exist or if the value is not valid
+        """
+        if name not in PROCESS_OPTIONS:
+            raise ValueError('Unknown option "{}"'.format(name))
+        parse, _ = PROCESS_OPTIONS[name]
+        if value is True and parse is not parse_flag:
+            raise ValueError('Option "{}" requires a value'.format(name))
+        try:
+            self._options[name] = parse(value)
+        except ValueError as e:
+            raise ValueError('Invalid value for option "{}" : {}'.format(name, e))
+
+    def option(self, name):
+        if name in self._options:
+            return self._options[name]
+        _, default = PROCESS_OPTIONS[name]
+        return default
+
     def add_input(self, input_res):
         self._inputs.append(input_res)
 
@@ -106,10 +183,18 @@ class Process:
         self._start = process.start
         self._end = process.end
         self._success = process.success
+        self._error_message = process.error_message
         self.log_stdout = process.log_stdout
         self.log_stderr = process.log_stderr
         self._reserved_path = process._reserved_path
 
+    def restore_execution_info(self, start, end, success, error_message):
+        """ Sets the execution info recorded in the journal of a run (see journal.py) """
+        self._start = start
+        self._end = end
+        self._success = success
+        self._error_message = error_message
+
     def reset_execution_info(self):
         """ Reset the execution info (all the properties set by function run()) because the resources produced
         by this process have been invalidated
@@ -126,6 +211,9 @@ class Process:
         Runs a verification that the process won't obviously fail. This is used for static analysis before any process
          is run
         """
+        if self.option('timeout') and not getattr(self._processor, 'supports_timeout', False):
+            raise TuttleError("Process {} can't have a timeout : {} processor doesn't support it".format(
+                self.id, self._processor.name))
         self._processor.static_check(self)
 
     def assign_paths(self, reserved_path, log_stdout, log_stderr):
@@ -134,11 +222,17 @@ class Process:
         self.log_stdout = log_stdout
         self.log_stderr = log_stderr
 
-    def set_start(self):
-        self._start = time()
+    def set_start(self, start=None):
+        """ :param start: when the process has started, if not now """
+        self._start = start or time()
+
+    def cancel_start(self):
+        """ The process has been sent to a worker but has not run """
+        self._start = None
 
-    def set_end(self, success, error_msg):
-        self._end = time()
+    def set_end(self, success, error_msg, end=None):
+        """ :param end: when the process has ended, if not now """
+        self._end = end or time()
         self._success = success
         self._error_message = error_msg
 
@@ -150,4 +244,52 @@ class Process:
         for resource in self.iter_outputs():
             if not resource.exists():
                 result.append(resource)
-        return result
\ No newline at end of file
+        return result
+
+
+def resource_descriptor(resource):
+    return resource.__class__, resource.url, resource._user, resource._password
+
+
+def build_resource(descriptor):
+    resource_class, url, user, password = descriptor
+    resource = resource_class(url)
+    resource.set_authentication(user, password)
+    return resource
+
+
+class ProcessTask:
+    """ What a worker needs to run a process. Unlike the process itself, it does not reference the resources of
+    the rest of the workflow (through the creator process of the inputs), so it is cheap to send to a worker
+    """
+
+    def __init__(self, process):
+        self.process_id = process.id
+        self.filename = process._filename
+        self.line_num = process._line_num
+        self.code = process.code
+        self.processor = process.processor
+        self.options = process._options
+        self.inputs = [resource_descriptor(resource) for resource in process.iter_inputs()]
+        self.outputs = [resource_descriptor(resource) for resource in process.iter_outputs()]
+        self.reserved_path = process._reserved_path
+        self.log_stdout = process.log_stdout
+        self.log_stderr = process.log_stderr
+
+    def build_process(self):
+        """ Rebuilds the process and its resources, on the side of the worker
+        :return: a process that can be run
+        """
+        process = Process(self.processor, self.filename, self.line_num)
+        process.set_code(self.code)
+        process._options = self.options
+        for descriptor in self.inputs:
+            process.add_input(build_resource(descriptor))
+        for descriptor in self.outputs:
+            resource = build_resource(descriptor)
+            resource.set_creator_process(process)
+            process.add_output(resource)
+        process._reserved_path = self.reserved_path
+        process.log_stdout = self.log_stdout
+        process.log_stderr = self.log_stderr
+        return process
@@ -1,26 +1,108 @@
 # -*- coding: utf8 -*-
 
+import os
+import sys
 from os import path, chmod, stat, mkdir
 from stat import S_IXUSR, S_IXGRP, S_IXOTH
 from subprocess import Popen, PIPE
+from threading import Timer
+from traceback import print_exc
 from tuttle.error import TuttleError
+from tuttle.figures_formating import nice_duration
+from tuttle.utils import terminate_process_tree
 
 
 class ProcessExecutionError(TuttleError):
     pass
 
 
-def run_and_log(args, log_stdout, log_stderr):
+def wait_with_timeout(pid, wait, timeout):
+    """ Waits for a program to end. If it is still running after timeout seconds, it is stopped with all its
+    subprocesses
+    :param wait: function that waits for the program and returns its return code
+    :raises ProcessExecutionError: if the program fails or times out
+    """
+    timed_out = []
+
+    def stop():
+        timed_out.append(True)
+        terminate_process_tree(pid)
+
+    timer = None
+    if timeout:
+        timer = Timer(timeout, stop)
+        timer.start()
+    rcode = wait()
+    if timer:
+        timer.cancel()
+    # Even if the return code is 0 : the program may have been reaped while its tree was terminated, and its
+    # status lost
+    if timed_out:
+        msg = "Process has been stopped after the timeout of {}".format(nice_duration(timeout))
+        raise ProcessExecutionError(msg)
+    if rcode != 0:
+        msg = "Process ended with error code {}".format(rcode)
+        raise ProcessExecutionError(msg)
+
+
+def run_and_log(args, log_stdout, log_stderr, timeout=None):
+    """ Runs a program and writes its outputs into the log files
+    :param timeout: if the program is still running after timeout seconds, it is stopped with all its subprocesses
+    :raises ProcessExecutionError: if the program fails or times out
+    """
     fout = open(log_stdout, 'w')
     ferr = open(log_stderr, 'w')
     osprocess = Popen(args, stdout=fout.fileno(), stderr=ferr.fileno(), stdin=PIPE)
     osprocess.stdin.close()
     fout.close()
     ferr.close()
-    rcode = osprocess.wait()
-    if rcode != 0:
-        msg = "Process ended with error code {}".format(rcode)
-        raise ProcessExecutionError(msg)
+    wait_with_timeout(osprocess.pid, osprocess.wait, timeout)
+
+
+def fork_and_log(function, log_stdout, log_stderr, timeout=None):
+    """ Runs a function in a child process forked from the current one, so it finds all the modules already imported,
+    and writes its outputs into the log files. The function can end with sys.exit() like a program
+    :param timeout: if the function is still running after timeout seconds, it is stopped with all its subprocesses
+    :raises ProcessExecutionError: if the function fails or times out
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        rcode = 1
+        try:
+            # Both the python objects and the file descriptors, for the subprocesses the function may start
+            fout = open(log_stdout, 'w')
+            ferr = open(log_stderr, 'w')
+            os.dup2(fout.fileno(), 1)
+            os.dup2(ferr.fileno(), 2)
+            sys.stdout, sys.stderr = fout, ferr
+            sys.stdin = open(os.devnull)
+            os.dup2(sys.stdin.fileno(), 0)
+            function()
+            rcode = 0
+        except SystemExit as e:
+            if e.code is None:
+                rcode = 0
+            elif isinstance(e.code, int):
+                rcode = e.code
+            else:
+                sys.stderr.write("{}\n".format(e.code))
+        except BaseException:
+            print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Don't run the cleanup of the parent, eg the one of a worker process
+            os._exit(rcode)
+
+    def wait():
+        _, status = os.waitpid(pid, 0)
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
+
+    wait_with_timeout(pid, wait, timeout)
 
 
 class ShellProcessor:
@@ -28,6 +110,8 @@ class ShellProcessor:
     """
     name = 'shell'
     header = u"#!/usr/bin/env sh\nset -e\n"
+    # Stops the program after the timeout option
+    supports_timeout = True
 
     def generate_executable(self, process, script_path):
         """ Create an executable file
@@ -42,7 +126,7 @@ class ShellProcessor:
 
     def run(self, process, reserved_path, log_stdout, log_stderr):
         self.generate_executable(process, reserved_path)
-        run_and_log([reserved_path], log_stdout, log_stderr)
+        run_and_log([reserved_path], log_stdout, log_stderr, process.option('timeout'))
 
     def static_check(self, process):
         pass
@@ -53,6 +137,8 @@ class BatProcessor:
     """
     name = 'bat'
     header = u"@echo off\n"
+    # Stops the program after the timeout option
+    supports_timeout = True
     exit_if_fail = u'if %ERRORLEVEL% neq 0 exit /b 1\n'
 
     def generate_executable(self, process, reserved_path):
@@ -73,7 +159,7 @@ class BatProcessor:
 
     def run(self, process, reserved_path, log_stdout, log_stderr):
         prog = self.generate_executable(process, reserved_path)
-        run_and_log([prog], log_stdout, log_stderr)
+        run_and_log([prog], log_stdout, log_stderr, process.option('timeout'))
 
     def static_check(self, process):
         pass
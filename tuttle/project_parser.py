@@ -103,15 +103,16 @@ class ProjectParser():
         self._streamer = LinesStreamer()
         self._outputless_processes = {}
 
-    def parse_and_check_file(self, filename):
+    def parse_and_check_file(self, filename, run_preprocesses=True):
         """ Reads a workflows from a tuttle file, runs the preprocesses, load the extensions and make
         overall static checks
         :param filename:
+        :param run_preprocesses: if False, the extensions are the ones left by the previous run
         :return: the workflow
         """
         self._streamer = LinesStreamer()
         self._streamer.add_file(filename)
-        return self.parse_extend_and_check_project()
+        return self.parse_extend_and_check_project(run_preprocesses)
 
     def parse_extensions_to_workflow(self, workflow):
         extensions = workflow.get_extensions()
@@ -119,22 +120,23 @@ class ProjectParser():
             self._streamer.add_file(ext)
         self.parse_project_to_workflow(workflow)
 
-    def parse_extend_and_check_project(self):
+    def parse_extend_and_check_project(self, run_preprocesses=True):
         """ Reads a workflows from the current streamer, runs the preprocesses, load the extensions and make
         overall static checks in order to return a valid workflow
-        :param filename:
+        :param run_preprocesses: if False, the extensions are the ones left by the previous run
         :return: the workflow
         """
         workflow = self.parse_project()
-        workflow.run_pre_processes()
+        if run_preprocesses:
+            workflow.run_pre_processes()
         self.parse_extensions_to_workflow(workflow)
 
-        unreachable = workflow.circular_references()
-        if unreachable:
-            error_msg = "The following resources references one another as inputs in a circular way that don't allow " \
-                        "to choose which one to run first :\n"
-            for process in unreachable:
-                error_msg += "* {}\n".format(process.id)
+        circular_groups = workflow.circular_groups()
+        if circular_groups:
+            error_msg = "The following processes references one another as inputs in a circular way that don't " \
+                        "allow to choose which one to run first :\n"
+            for group in circular_groups:
+                error_msg += "* {}\n".format(", ".join(process.id for process in group))
             raise WorkflowError(error_msg, self._filename, self._streamer._num_line)
         workflow.static_check_processes()
         workflow.check_resources_consistency()
@@ -157,6 +159,26 @@ class ProjectParser():
         line_stripped = line.strip()
         return len(line_stripped) == 0
         
+    def build_process(self, processor_declaration):
+        """ Builds a process from what follows the exclamation mark : the name of the processor then
+        the options of the process, eg : "shell cpu=4 exclusive"
+        """
+        tokens = processor_declaration.split()
+        if tokens:
+            processor_name = tokens[0]
+        else:
+            processor_name = ""
+        process = self.wb.build_process(processor_name, self._filename, self._num_line)
+        if not process:
+            raise InvalidProcessorError("Invalid processor : '{}' ".format(processor_name), self._filename, self._num_line)
+        for option in tokens[1:]:
+            name, equal, value = option.partition('=')
+            try:
+                process.set_option(name, value if equal else True)
+            except ValueError as e:
+                raise ParseError("{} in process declaration".format(e), self._filename, self._num_line)
+        return process
+
     def parse_dependencies_and_processor(self):
         arrow_pos = self._line.find(self.ARROW)
         if arrow_pos == -1:
@@ -165,12 +187,9 @@ class ProjectParser():
         mark_pos = self._line.find('!')
         if mark_pos == -1:
             mark_pos = len(self._line)
-            processor_name = "default"
+            process = self.build_process("default")
         else:
-            processor_name = self._line[mark_pos + 1:].strip()
-        process = self.wb.build_process(processor_name, self._filename, self._num_line)
-        if not process:
-            raise InvalidProcessorError("Invalid processor : '{}' ".format(processor_name), self._filename, self._num_line)
+            process = self.build_process(self._line[mark_pos + 1:])
         # Main separator is space, but comas are still accepted
         inputs = self._line[arrow_pos + 2:mark_pos].replace(self.OLD_SEP, self.SPACE_SEP)
         input_urls = inputs.split()
@@ -290,13 +309,9 @@ class ProjectParser():
     def parse_preprocess_declaration(self):
         mark_pos = self._line.find('!')
         if mark_pos == -1:
-            processor_name = "default"
+            return self.build_process("default")
         else:
-            processor_name = self._line[mark_pos + 1:].strip()
-        process = self.wb.build_process(processor_name, self._filename, self._num_line)
-        if not process:
-            raise InvalidProcessorError("Invalid processor : '{}' ".format(processor_name), self._filename, self._num_line)
-        return process
+            return self.build_process(self._line[mark_pos + 1:])
 
     def parse_preprocess(self):
         """ Returns a preprocess according to the incoming section
@@ -0,0 +1,252 @@
+# -*- coding: utf8 -*-
+
+"""
+Remote workers : worker agents (see worker_agent.py) running on other machines connect to the coordinator, ie the
+WorkflowRunner of a tuttle run, and run processes for it. The machines must share the file system of the workspace.
+
+The connections are authenticated with a secret key shared by the coordinator and the agents, through the
+TUTTLE_AUTHKEY environment variable. Processes are sent as pickled objects, so the key must remain secret.
+"""
+import os
+import socket
+from itertools import count
+from multiprocessing.connection import Listener, AuthenticationError, deliver_challenge, answer_challenge
+from threading import Thread, Lock
+from traceback import format_exc
+
+from tuttle.error import TuttleError
+
+
+AUTHKEY_VARIABLE = 'TUTTLE_AUTHKEY'
+
+AGENT_LOST = "Worker agent {} has disconnected before the end of the process"
+
+TASK_NOT_SENT = "An unexpected error have happen in tuttle while sending the process to worker agent {agent} : \n" \
+                "{stacktrace}\n" \
+                "Process will not run."
+
+# Seconds a client has to answer each step of the handshake before it is dropped
+HANDSHAKE_TIMEOUT = 10
+
+
+def parse_address(address):
+    """ Parses an address as HOST:PORT. HOST can be omitted to listen on all interfaces
+    :return: host, port
+    :raises ValueError: if the address is not valid
+    """
+    host, sep, port = address.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError('"{}" is not a valid address : expected HOST:PORT'.format(address))
+    if not sep or not 0 <= port < 65536:
+        raise ValueError('"{}" is not a valid address : expected HOST:PORT'.format(address))
+    return host, port
+
+
+def authkey_from_env():
+    """ :raises TuttleError: if the secret key is not set """
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        raise TuttleError("Remote workers need a secret key in the {} environment variable".format(AUTHKEY_VARIABLE))
+    return authkey
+
+
+class HandshakeConnection:
+    """ A connection whose receptions fail if nothing comes before a timeout, so that a client that connects but
+    doesn't talk can't hold a thread of the coordinator forever """
+
+    def __init__(self, conn, timeout):
+        self._conn = conn
+        self._timeout = timeout
+
+    def send_bytes(self, buf):
+        self._conn.send_bytes(buf)
+
+    def recv_bytes(self, maxlength=None):
+        if not self._conn.poll(self._timeout):
+            raise IOError("No answer from the client after {}s".format(self._timeout))
+        if maxlength is None:
+            return self._conn.recv_bytes()
+        return self._conn.recv_bytes(maxlength)
+
+    def recv(self):
+        if not self._conn.poll(self._timeout):
+            raise IOError("No answer from the client after {}s".format(self._timeout))
+        return self._conn.recv()
+
+
+class Agent:
+    """ A worker agent connected to the coordinator """
+
+    def __init__(self, conn, nb_slots, name):
+        self.conn = conn
+        self.nb_slots = nb_slots
+        self.free_slots = nb_slots
+        self.name = name
+        # Callback and number of slots of the running processes, by task id
+        self.running = {}
+        self.send_lock = Lock()
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+
+class RemoteWorkers:
+    """ The worker agents of the coordinator. Agents can join at any time : they add their workers to the ones the
+    coordinator can use
+    """
+
+    def __init__(self, address, authkey, condition, logger):
+        """
+        :param address: host and port to listen to
+        :param condition: the condition of the runner, notified when an agent joins, so that it can start processes
+        """
+        # The authentication is done by welcome_agent() rather than by the listener, in a thread per client
+        self._listener = Listener(address)
+        self._authkey = authkey
+        self._condition = condition
+        self._logger = logger
+        self._agents = []
+        self._task_ids = count()
+        self._closed = False
+        thread = Thread(target=self.accept_agents)
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    def accept_agents(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except (IOError, EOFError):
+                # Listener closed
+                continue
+            if self._closed:
+                conn.close()
+                return
+            # The handshake of a client must not delay the others
+            thread = Thread(target=self.welcome_agent, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def welcome_agent(self, conn):
+        """ Authenticates a client and registers it as an agent. A client that fails or doesn't answer in time is
+        dropped """
+        handshake = HandshakeConnection(conn, HANDSHAKE_TIMEOUT)
+        try:
+            deliver_challenge(handshake, self._authkey)
+            answer_challenge(handshake, self._authkey)
+            _, nb_slots, name = handshake.recv()
+            conn.send(('welcome', os.getcwd()))
+        except Exception:
+            # Wrong key, no answer, disconnection or unexpected message
+            conn.close()
+            return
+        agent = Agent(conn, nb_slots, name)
+        with self._condition:
+            if self._closed:
+                conn.close()
+                return
+            self._agents.append(agent)
+            self._condition.notify()
+        self._logger.info("Worker agent {} has joined with {} worker(s)".format(name, nb_slots))
+        thread = Thread(target=self.listen_to_agent, args=(agent,))
+        thread.daemon = True
+        thread.start()
+
+    def listen_to_agent(self, agent):
+        """ Receives the results of the processes run by an agent. If the agent disconnects, the processes it was
+        running fail """
+        try:
+            while True:
+                _, task_id, result = agent.conn.recv()
+                with self._condition:
+                    callback, slots = agent.running.pop(task_id)
+                    agent.free_slots += slots
+                    callback(result)
+        except (IOError, OSError, EOFError):
+            pass
+        if not self._closed:
+            self._logger.warn("Worker agent {} has disconnected".format(agent.name))
+        with self._condition:
+            self._agents.remove(agent)
+            # Still holding the lock, so that the runner never sees the processes neither running nor completed
+            for callback, slots in agent.running.values():
+                callback((False, AGENT_LOST.format(agent.name), None))
+            agent.running = {}
+
+    def slots_needed(self, nb_workers):
+        """ A process can't be split over several agents : it occupies at most all the workers of the biggest one """
+        with self._condition:
+            biggest = max([agent.nb_slots for agent in self._agents] or [0])
+        return min(nb_workers, biggest)
+
+    def available(self, nb_workers=1):
+        """ :return: True if an agent can run a process that needs nb_workers workers """
+        slots = self.slots_needed(nb_workers)
+        with self._condition:
+            return any(agent.free_slots >= slots > 0 for agent in self._agents)
+
+    def nb_running(self):
+        with self._condition:
+            return sum(len(agent.running) for agent in self._agents)
+
+    def run(self, task, nb_workers, callback):
+        """ Sends a process to the agent with the most free workers
+        :param task: the ProcessTask of the process
+        :param callback: called with the result of the process (see run_process_without_exception())
+        """
+        slots = self.slots_needed(nb_workers)
+        with self._condition:
+            if not self._agents:
+                # The last agent has left in the meantime
+                callback((False, AGENT_LOST.format("(any)"), None))
+                return
+            agent = max(self._agents, key=lambda a: a.free_slots)
+            agent.free_slots -= slots
+            task_id = next(self._task_ids)
+            agent.running[task_id] = (callback, slots)
+        try:
+            agent.send(('run', task_id, task))
+        except IOError:
+            # The agent is gone : listen_to_agent() reports the failure of its processes
+            pass
+        except Exception:
+            # Eg the task can't be pickled. The agent is fine, but the process fails
+            with self._condition:
+                if agent.running.pop(task_id, None) is not None:
+                    agent.free_slots += slots
+                    callback((False, TASK_NOT_SENT.format(agent=agent.name, stacktrace=format_exc()), None))
+
+    def cancel(self):
+        """ Asks the agents to stop the processes they are running """
+        with self._condition:
+            agents = list(self._agents)
+        for agent in agents:
+            try:
+                agent.send(('cancel',))
+            except IOError:
+                pass
+
+    def close(self):
+        """ Stops listening and tells the agents to disconnect. They can connect again for the next run """
+        self._closed = True
+        # Wakes up the thread waiting for agents, so that it sees it has to stop
+        host, port = self._listener.address
+        try:
+            socket.create_connection((host if host not in ('', '0.0.0.0') else '127.0.0.1', port)).close()
+        except socket.error:
+            pass
+        self._listener.close()
+        with self._condition:
+            agents = list(self._agents)
+        for agent in agents:
+            try:
+                agent.send(('stop',))
+            except IOError:
+                pass
@@ -1,6 +1,7 @@
 # -*- coding: utf8 -*-
 
 from os import path
+from weakref import WeakKeyDictionary
 
 
 DOT_HEADER = """digraph workflow {
@@ -39,33 +40,49 @@ def process_node_id(id):
     return p_node
 
 
+def process_dot(process, color):
+    """ :return: the part of the dot source that describes a process and its resources """
+    p_node = process_node_id(process.id)
+    if color != "none":
+        fontcolor = color
+    else:
+        fontcolor = "black"
+    lines = ['    {} [label="{}", URL="#{}", color={}, fontcolor={}, width=0, height=0] '
+             ';\n'.format(p_node, process.id, process.id, color, fontcolor)]
+    for res_input in process.iter_inputs():
+        nick = nick_from_url(res_input.url)
+        resource_id = dot_id(res_input.url)
+        lines.append('    "{}" -> {} [arrowhead="none"] \n'.format(resource_id,  p_node))
+        if res_input.is_primary():
+            lines.append('    "{}" [fillcolor=beige, label="{}"] ;\n'.format(resource_id, nick))
+    for res_output in process.iter_outputs():
+        nick = nick_from_url(res_output.url)
+        resource_id = dot_id(res_output.url)
+        lines.append('    {} -> "{}" \n'.format(p_node, resource_id))
+        lines.append('    "{}" [fillcolor={}, label="{}"] ;\n'.format(resource_id, color, nick))
+    return "".join(lines)
+
+
+# Parts of the dot source of the workflows being reported, by process. A part only changes with the color of its
+# process
+_fragments = WeakKeyDictionary()
+
+
 def dot(workflow):
     # TODO :
     # * Add a legend
     # * Show missing resources in a different color
-    result = DOT_HEADER
+    fragments = _fragments.setdefault(workflow, {})
+    parts = [DOT_HEADER]
     for process in workflow.iter_processes():
         color = color_from_process(process)
-        p_node = process_node_id(process.id)
-        if color != "none":
-            fontcolor = color
-        else:
-            fontcolor = "black"
-        result += '    {} [label="{}", URL="#{}", color={}, fontcolor={}, width=0, height=0] ' \
-                  ';\n'.format(p_node, process.id, process.id, color, fontcolor)
-        for res_input in process.iter_inputs():
-            nick = nick_from_url(res_input.url)
-            resource_id = dot_id(res_input.url)
-            result += '    "{}" -> {} [arrowhead="none"] \n'.format(resource_id,  p_node)
-            if res_input.is_primary():
-                result += '    "{}" [fillcolor=beige, label="{}"] ;\n'.format(resource_id, nick)
-        for res_output in process.iter_outputs():
-            nick = nick_from_url(res_output.url)
-            resource_id = dot_id(res_output.url)
-            result += '    {} -> "{}" \n'.format(p_node, resource_id)
-            result += '    "{}" [fillcolor={}, label="{}"] ;\n'.format(resource_id, color, nick)
-    result += '}'
-    return result
+        cached = fragments.get(process)
+        if cached is None or cached[0] != color:
+            cached = (color, process_dot(process, color))
+            fragments[process] = cached
+        parts.append(cached[1])
+    parts.append('}')
+    return "".join(parts)
 
 
 def create_dot_report(workflow, filename):
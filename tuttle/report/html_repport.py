@@ -1,9 +1,13 @@
 # -*- coding: utf8 -*-
 import sys
-from os import path
+import re
+from itertools import chain
+from json import dumps
+from os import path, rename, remove
 from os.path import dirname, join, relpath, abspath, split
 from shutil import copytree
 from time import strftime, localtime
+from weakref import WeakKeyDictionary
 
 from jinja2 import Template
 
@@ -11,6 +15,21 @@ from tuttle.figures_formating import nice_file_size, nice_duration
 from tuttle.report.dot_repport import dot
 
 
+DATA_FILE = "report_data.js"
+# Function of the page called by the data file. A script can be loaded from the file system, unlike a json file
+DATA_CALLBACK = "tuttle_report_data"
+
+# Above this number of processes, the page doesn't describe every process any more : it shows a paginated table
+# and a graph of groups of processes, from report_processes.js, and loads the code of the processes on demand, by
+# chunks (report_code_0.js, report_code_1.js...)
+LARGE_REPORT = 500
+PROCESSES_FILE = "report_processes.js"
+PROCESSES_CALLBACK = "tuttle_report_processes"
+CODE_FILE = "report_code_{}.js"
+CODE_CALLBACK = "tuttle_report_code"
+CODE_CHUNK = 100
+
+
 def data_path(*path_parts):
     if getattr(sys, 'frozen', False):
         # The application is frozen
@@ -22,14 +41,12 @@ def data_path(*path_parts):
     return join(datadir, *path_parts)
 
 
-def format_resource(resource, workflow):
-    sig = workflow.signature(resource.url)
+def format_resource(resource):
     creator_process_id = None
     if resource.creator_process:
         creator_process_id = resource.creator_process.id
     return {
         'url': resource.url,
-        'signature': sig,
         'creator_process_id' : creator_process_id,
     }
 
@@ -59,59 +76,239 @@ def path2url(path, ref_path):
     return '/'.join(parts)
 
 
-def format_process(process, workflow, report_dir):
+def format_process(process):
+    """ The description of a process that doesn't change while it runs, for the static page of the report """
+    return {
+        'id': process.id,
+        'processor': process.processor.name,
+        'outputs': [format_resource(resource) for resource in process.iter_outputs()],
+        'inputs': [format_resource(resource) for resource in process.iter_inputs()],
+        'code': process.code,
+    }
+
+
+def process_state(process, workflow, report_dir):
+    """ The state of a process, for the data file of the report """
     duration = ""
     start = ""
     end = ""
+    log_stdout_size = ""
+    log_stderr_size = ""
     if process.start:
         start = strftime("%a, %d %b %Y %H:%M:%S", localtime(process.start))
         if process.end:
             end = strftime("%a, %d %b %Y %H:%M:%S", localtime(process.end))
             duration = nice_duration(process.end - process.start)
-    running = start and not end
+        running = start and not end
+        log_stdout_size = nice_file_size(process.log_stdout, running)
+        log_stderr_size = nice_file_size(process.log_stderr, running)
+    urls = [resource.url for resource in chain(process.iter_inputs(), process.iter_outputs())]
     return {
-        'id': process.id,
-        'processor': process.processor.name,
         'start': start,
         'end': end,
         'duration': duration,
         'log_stdout': path2url(process.log_stdout, report_dir),
-        'log_stdout_size': nice_file_size(process.log_stdout, running),
+        'log_stdout_size': log_stdout_size,
         'log_stderr': path2url(process.log_stderr, report_dir),
-        'log_stderr_size': nice_file_size(process.log_stderr, running),
-        'outputs': (format_resource(resource, workflow) for resource in process.iter_outputs()),
-        'inputs': (format_resource(resource, workflow) for resource in process.iter_inputs()),
-        'code': process.code,
+        'log_stderr_size': log_stderr_size,
+        'signatures': {url: workflow.signature(url) for url in urls if workflow.signature(url)},
         'success': process.success,
         'error_message': process.error_message,
     }
 
 
+def workflow_state(workflow, processes, report_dir):
+    """ The state of a workflow and of some of its processes, in the format of the data file of the report
+    :param processes: the processes to describe, eg the ones that have started or ended since the last update
+    """
+    if len(list(workflow.iter_processes())) > LARGE_REPORT:
+        dot_src = None
+    else:
+        dot_src = dot(workflow)
+    return {
+        'status': workflow_status(workflow),
+        'dot_src': dot_src,
+        'processes': {process.id: process_state(process, workflow, report_dir) for process in processes},
+    }
+
+
+def log_size(filename):
+    try:
+        return path.getsize(filename)
+    except (OSError, TypeError):
+        return None
+
+
+def state_key(process, workflow):
+    """ Changes when the state of a process has to be serialised again. Only the logs of the running processes are
+    read from the disk, because their sizes change """
+    urls = [resource.url for resource in chain(process.iter_inputs(), process.iter_outputs())]
+    signatures = tuple(workflow.signature(url) for url in urls)
+    log_sizes = None
+    if process.start and not process.end:
+        log_sizes = log_size(process.log_stdout), log_size(process.log_stderr)
+    return process.start, process.end, process.success, process.error_message, process.log_stdout, \
+        process.log_stderr, log_sizes, signatures
+
+
+# What comes before the first number in the name of a resource
+NAME_PREFIX = re.compile(r"^([^0-9]*?)[_.-]*([0-9]|$)")
+
+
+def name_prefix(url):
+    """ :return: the url of a resource, without what comes after the first number of its name. Resources generated
+    in a loop have the same prefix """
+    directory, _, name = url.rpartition("/")
+    prefix = NAME_PREFIX.match(name).group(1)
+    return "{}/{}".format(directory, prefix) if directory else prefix
+
+
+def process_cluster(process):
+    """ The group of a process in the graph of a large workflow : the file it is defined in (an included file is
+    another group) and the name prefix of its first output
+    """
+    for resource in process.iter_outputs():
+        return "{} : {}".format(process._filename, name_prefix(resource.url))
+    return process._filename
+
+
+def process_structure(process, cluster):
+    """ The description of a process in a large report. Its code is written aside """
+    return {
+        'id': process.id,
+        'processor': process.processor.name,
+        'inputs': [resource.url for resource in process.iter_inputs()],
+        'outputs': [resource.url for resource in process.iter_outputs()],
+        'cluster': cluster,
+    }
+
+
 def ensure_assets(dest_dir):
     assets_dir = path.join(dest_dir, 'html_report_assets')
     if not path.isdir(assets_dir):
         copytree(data_path('html_report_assets', ''), assets_dir)
 
 
+_templates = {}
+
+
+def report_template(name="report_template.html"):
+    """ :return: the template of a static page, compiled once """
+    if name not in _templates:
+        with open(data_path(name), 'rb') as ftpl:
+            _templates[name] = Template(ftpl.read().decode('utf8'))
+    return _templates[name]
+
+
+def write_aside(filename, content):
+    """ Writes a file aside, then renames it, so that a browser never reads it half written """
+    with open(filename + ".tmp", 'wb') as fout:
+        fout.write(content)
+    try:
+        rename(filename + ".tmp", filename)
+    except OSError:
+        # Windows can't rename over an existing file
+        remove(filename)
+        rename(filename + ".tmp", filename)
+
+
+class HtmlReport:
+    """ The html report of a workflow is a static page, written once, and a data file, report_data.js, loaded by the
+    page to display the state of the processes. Each export only serialises again the processes that have changed
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._report_dir = abspath(dirname(filename))
+        self._data_filename = join(dirname(filename), DATA_FILE)
+        # The processes the page has been written for. Preprocesses can extend the workflow
+        self._structure = None
+        # Serialised state of each process, with the key it was computed for
+        self._states = {}
+
+    def write_shell(self, workflow, processes, preprocesses):
+        ensure_assets(dirname(self.filename))
+        if len(processes) > LARGE_REPORT:
+            self.write_large_shell(workflow, processes, preprocesses)
+            return
+        content = report_template().render(
+            processes=[format_process(p) for p in processes],
+            preprocesses=[format_process(p) for p in preprocesses],
+            data_file=DATA_FILE,
+            data_callback=DATA_CALLBACK,
+            tuttle_version=workflow.tuttle_version
+        )
+        write_aside(self.filename, content.encode('utf8'))
+
+    def write_large_shell(self, workflow, processes, preprocesses):
+        report_dir = dirname(self.filename)
+        all_processes = processes + preprocesses
+        structures = [process_structure(p, process_cluster(p)) for p in processes]
+        structures += [process_structure(p, "Preprocesses") for p in preprocesses]
+        write_aside(join(report_dir, PROCESSES_FILE),
+                    "{}({});\n".format(PROCESSES_CALLBACK, dumps(structures, separators=(',', ':'))))
+        for first in xrange(0, len(all_processes), CODE_CHUNK):
+            chunk = all_processes[first:first + CODE_CHUNK]
+            codes = {process.id: process.code for process in chunk}
+            write_aside(join(report_dir, CODE_FILE.format(first // CODE_CHUNK)),
+                        "{}({}, {});\n".format(CODE_CALLBACK, first // CODE_CHUNK, dumps(codes)))
+        content = report_template("large_report_template.html").render(
+            nb_processes=len(processes),
+            data_file=DATA_FILE,
+            data_callback=DATA_CALLBACK,
+            processes_file=PROCESSES_FILE,
+            processes_callback=PROCESSES_CALLBACK,
+            code_file=CODE_FILE,
+            code_callback=CODE_CALLBACK,
+            code_chunk=CODE_CHUNK,
+            tuttle_version=workflow.tuttle_version
+        )
+        write_aside(self.filename, content.encode('utf8'))
+
+    def serialised_state(self, process, workflow):
+        key = state_key(process, workflow)
+        cached = self._states.get(process)
+        if cached is None or cached[0] != key:
+            state = process_state(process, workflow, self._report_dir)
+            cached = (key, "{}:{}".format(dumps(process.id), dumps(state, separators=(',', ':'))))
+            self._states[process] = cached
+        return cached[1]
+
+    def write(self, workflow):
+        processes = list(workflow.iter_processes())
+        preprocesses = list(workflow.iter_preprocesses())
+        structure = (processes, preprocesses)
+        if structure != self._structure or not path.isfile(self.filename):
+            self.write_shell(workflow, processes, preprocesses)
+            self._structure = structure
+        states = [self.serialised_state(p, workflow) for p in chain(processes, preprocesses)]
+        if len(processes) > LARGE_REPORT:
+            # The page draws the graph of the groups of processes
+            dot_src = None
+        else:
+            dot_src = dot(workflow)
+        data = '{}({{"status":{},"dot_src":{},"processes":{{{}}}}});\n'.format(
+            DATA_CALLBACK,
+            dumps(workflow_status(workflow)),
+            dumps(dot_src),
+            ",".join(states)
+        )
+        write_aside(self._data_filename, data)
+
+
+# Reports of the workflows that have been exported
+_reports = WeakKeyDictionary()
+
+
 def create_html_report(workflow, filename):
-    """ Write an html file describing the workflow
+    """ Write an html file describing the workflow, or update its data file if it has already been written for
+    this workflow
     :param workflow:
     :param filename: path to the html fil to be generated
     :return: None
     """
-    file_dir = path.dirname(filename)
-    ensure_assets(file_dir)
-    tpl_filename = data_path("report_template.html")
-    with open(tpl_filename, 'rb') as ftpl:
-        t = Template(ftpl.read().decode('utf8'))
-    processes = [format_process(p, workflow, abspath(file_dir)) for p in workflow.iter_processes()]
-    preprocesses = [format_process(p, workflow, abspath(file_dir)) for p in workflow.iter_preprocesses()]
-    with open(filename, 'wb') as fout:
-        content = t.render(
-            processes=processes,
-            preprocesses=preprocesses,
-            dot_src=dot(workflow),
-            status=workflow_status(workflow),
-            tuttle_version=workflow.tuttle_version
-        )
-        fout.write(content.encode('utf8)'))
+    report = _reports.get(workflow)
+    if report is None or report.filename != filename:
+        report = HtmlReport(filename)
+        _reports[workflow] = report
+    report.write(workflow)
@@ -0,0 +1,224 @@
+# -*- coding: utf8 -*-
+
+"""
+A small http server that shows the report of a running workflow (tuttle run --serve). The page, its assets, its data
+files and the logs are served from the tuttle directory, and nothing else : the dump of the workflow or the cache of
+the signatures are not published. The state of the processes comes from the workflow in memory :
+/status gives the whole state and /events sends it, then pushes the processes that start or end, as Server-Sent
+Events. The report files don't have to be written again while the workflow runs.
+"""
+import posixpath
+import re
+import socket
+import sys
+from BaseHTTPServer import HTTPServer
+from Queue import Queue, Empty
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from itertools import chain
+from json import dumps
+from os.path import abspath, join
+from threading import Thread, Condition, Lock
+from urllib import unquote
+
+from tuttle.error import TuttleError
+from tuttle.report.html_repport import workflow_state, DATA_FILE, PROCESSES_FILE, CODE_FILE
+
+
+REPORT_FILE = "report.html"
+# Files of the tuttle directory the report needs
+PUBLISHED_FILES = re.compile(r"^({}|{}|{}|{})$".format(re.escape(REPORT_FILE), re.escape(DATA_FILE),
+                                                       re.escape(PROCESSES_FILE),
+                                                       re.escape(CODE_FILE).replace(r"\{\}", r"\d+")))
+# Directories of the tuttle directory the report needs, with everything inside
+PUBLISHED_DIRS = [('html_report_assets',), ('processes', 'logs')]
+
+
+def path_words(path):
+    """ :return: the parts of the path of a url, without the query, the fragment, nor any way up """
+    path = posixpath.normpath(unquote(path.split('?', 1)[0].split('#', 1)[0]))
+    return [word for word in path.split('/') if word and word not in ('.', '..')]
+
+
+def published(words):
+    """ :return: True if the file of the tuttle directory is part of the report """
+    if len(words) == 1:
+        return PUBLISHED_FILES.match(words[0]) is not None
+    return any(len(words) > len(directory) and tuple(words[:len(directory)]) == directory
+               for directory in PUBLISHED_DIRS)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+        # Otherwise the browser has gone
+
+
+class ReportRequestHandler(SimpleHTTPRequestHandler):
+    """ Answers /status and /events from the report server, and serves the files of the report from the tuttle
+    directory """
+
+    # Time in seconds between two comments sent to keep an event stream open
+    KEEP_ALIVE = 15
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == "/status":
+            self.send_status()
+        elif path == "/events":
+            self.send_events()
+        else:
+            SimpleHTTPRequestHandler.do_GET(self)
+
+    def send_head(self):
+        """ Anything else than the files of the report is not found, directories included """
+        if not published(path_words(self.path)):
+            self.send_error(404, "File not found")
+            return None
+        return SimpleHTTPRequestHandler.send_head(self)
+
+    def translate_path(self, path):
+        """ Files are served from the report directory instead of the current directory """
+        return join(self.server.report_server.report_dir, *path_words(path))
+
+    def send_status(self):
+        content = dumps(self.server.report_server.state())
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        events = self.server.report_server.subscribe()
+        try:
+            # The whole state first. The changes that come after are already in the queue
+            self.wfile.write("data: {}\n\n".format(dumps(self.server.report_server.state())))
+            self.wfile.flush()
+            while True:
+                try:
+                    event = events.get(timeout=self.KEEP_ALIVE)
+                except Empty:
+                    self.wfile.write(": keep-alive\n\n")
+                    self.wfile.flush()
+                    continue
+                if event is None:
+                    self.wfile.write("event: end\ndata: {}\n\n")
+                    self.wfile.flush()
+                    return
+                self.wfile.write("data: {}\n\n".format(event))
+                self.wfile.flush()
+        except IOError:
+            # The browser has gone
+            pass
+        finally:
+            self.server.report_server.unsubscribe(events)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReportServer:
+    """ Serves the report of a workflow while it runs. The runner notifies the processes that start or end, and a
+    thread sends their state to the pages that follow the events
+    """
+
+    def __init__(self, workflow, address, report_dir):
+        """
+        :param address: host and port to listen to
+        :param report_dir: the directory of the static report (see html_repport.py)
+        """
+        self._workflow = workflow
+        self.report_dir = abspath(report_dir)
+        try:
+            self._http_server = ThreadingHTTPServer(address, ReportRequestHandler)
+        except socket.error as e:
+            raise TuttleError("Can't serve the report on {}:{} : {}".format(address[0], address[1], e))
+        self._http_server.report_server = self
+        self._subscribers = []
+        self._subscribers_lock = Lock()
+        self._pending = []
+        self._closed = False
+        self._condition = Condition()
+        self._serving_thread = None
+        self._sending_thread = None
+
+    def address(self):
+        """ :return: host and port the server listens to """
+        return self._http_server.server_address
+
+    def url(self):
+        host, port = self.address()
+        if host in ("", "0.0.0.0"):
+            host = "localhost"
+        return "http://{}:{}/{}".format(host, port, REPORT_FILE)
+
+    def start(self):
+        self._serving_thread = Thread(target=self._http_server.serve_forever)
+        self._serving_thread.daemon = True
+        self._serving_thread.start()
+        self._sending_thread = Thread(target=self.send_in_background)
+        self._sending_thread.daemon = True
+        self._sending_thread.start()
+
+    def state(self, processes=None):
+        """ :return: the state of the workflow and of the processes. Default is all the processes """
+        if processes is None:
+            processes = chain(self._workflow.iter_processes(), self._workflow.iter_preprocesses())
+        return workflow_state(self._workflow, processes, self.report_dir)
+
+    def subscribe(self):
+        """ :return: a queue of events, the state of the processes that have changed serialised in json. None
+        means the run is over """
+        events = Queue()
+        with self._subscribers_lock:
+            self._subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self._subscribers_lock:
+            self._subscribers.remove(events)
+
+    def publish(self, event):
+        with self._subscribers_lock:
+            for events in self._subscribers:
+                events.put(event)
+
+    def notify(self, processes):
+        """ Asks to send the state of processes that have started or ended. Doesn't wait for it to be sent """
+        if not processes:
+            return
+        with self._condition:
+            self._pending.extend(processes)
+            self._condition.notify()
+
+    def send_in_background(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                processes, self._pending = self._pending, []
+            self.publish(dumps(self.state(set(processes))))
+
+    def close(self):
+        """ Sends the final state of the workflow, ends the event streams and stops the server """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._sending_thread is not None:
+            self._sending_thread.join()
+            self.publish(dumps(self.state()))
+            self.publish(None)
+        if self._serving_thread is not None:
+            self._http_server.shutdown()
+        self._http_server.server_close()
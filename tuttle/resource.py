@@ -1,9 +1,14 @@
 # -*- coding: utf8 -*-
-from hashlib import sha1
-from os import remove
+from mmap import mmap, ACCESS_READ
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from os import remove, fstat, getpid
 from os.path import abspath, exists, isfile
 from shutil import rmtree
+from threading import Lock
 from tuttle.error import TuttleError
+from tuttle.hashing import new_hash, hash_algorithm, DEFAULT_ALGORITHM
+from tuttle.signature_cache import cached_signature
 
 
 class MalformedUrl(TuttleError):
@@ -48,14 +53,66 @@ class ResourceMixIn:
         return self_inputs == other_inputs
 
 
-def hash_file(file_like_object):
+# Files are read by blocks of READ_SIZE bytes. Files bigger than MMAP_SIZE are mapped in memory instead, and hashed
+# MMAP_SIZE bytes at a time without being copied
+READ_SIZE = 1024 * 1024
+MMAP_SIZE = 64 * 1024 * 1024
+
+
+def hash_file(file_like_object, algorithm=DEFAULT_ALGORITHM):
     """Generate a hash for the contents of a file."""
-    checksum = sha1()
-    for chunk in iter(lambda: file_like_object.read(32768), b''):
+    checksum = new_hash(algorithm)
+    for chunk in iter(lambda: file_like_object.read(READ_SIZE), b''):
         checksum.update(chunk)
     return checksum.hexdigest()
 
 
+def hash_path(path, algorithm=DEFAULT_ALGORITHM):
+    """ Generate a hash for the contents of the file at path. Same hash as hash_file() """
+    with open(path, 'rb') as f:
+        size = fstat(f.fileno()).st_size
+        if size < MMAP_SIZE:
+            return hash_file(f, algorithm)
+        mapped = mmap(f.fileno(), 0, access=ACCESS_READ)
+        try:
+            checksum = new_hash(algorithm)
+            for offset in xrange(0, size, MMAP_SIZE):
+                checksum.update(buffer(mapped, offset, MMAP_SIZE))
+            return checksum.hexdigest()
+        finally:
+            mapped.close()
+
+
+# Below this number of resources, hashing them one after the other costs less than dispatching them to threads
+INLINE_SIGNATURES = 4
+
+_pool = [None, None]
+_pool_lock = Lock()
+
+
+def signature_pool():
+    """ :return: the pool of threads that compute signatures, shared by all the calls. A new one is created in a
+    forked process, because the threads of the parent don't exist there
+    """
+    with _pool_lock:
+        if _pool[1] != getpid():
+            _pool[0] = ThreadPool(cpu_count())
+            _pool[1] = getpid()
+        return _pool[0]
+
+
+def compute_signatures(resources):
+    """ Computes the signatures of several resources at the same time, in threads : hashing and reading files don't
+    hold the GIL
+    :return: the signatures indexed by url
+    """
+    resources = list(resources)
+    if len(resources) < INLINE_SIGNATURES:
+        return {resource.url: resource.signature() for resource in resources}
+    signatures = signature_pool().map(lambda resource: resource.signature(), resources)
+    return {resource.url: signature for resource, signature in zip(resources, signatures)}
+
+
 class FileResource(ResourceMixIn, object):
     """A resource for a local file"""
     scheme = 'file'
@@ -69,14 +126,23 @@ class FileResource(ResourceMixIn, object):
     def exists(self):
         return exists(self._get_path())
 
-    def signature(self):
-        res_sha1 = None
+    def compute_signature(self, algorithm=None):
+        algorithm = algorithm or hash_algorithm()
+        digest = None
         try:
-            with open(self._get_path()) as f:
-                res_sha1 = hash_file(f)
-        except IOError:
+            digest = hash_path(self._get_path(), algorithm)
+        except (IOError, OSError):
             pass
-        return "sha1:{}".format(res_sha1)
+        return "{}:{}".format(algorithm, digest)
+
+    def signature(self, algorithm=None):
+        """ The file is only hashed if it has changed since its signature was stored in the cache
+        (see signature_cache.py)
+        :param algorithm: the hash algorithm, default is the one of the environment (see hashing.py)
+        """
+        if algorithm is not None and algorithm != hash_algorithm():
+            return self.compute_signature(algorithm)
+        return cached_signature(self._get_path(), self.compute_signature)
 
     def remove(self):
         path = self._get_path()
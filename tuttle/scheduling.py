@@ -0,0 +1,177 @@
+# -*- coding: utf8 -*-
+
+"""
+Estimations used to choose which process to run first, based on how long processes took in previous runs
+"""
+from heapq import heappush, heappop
+from itertools import count
+
+
+# Estimated duration of a process, in seconds, when no process has ever run
+DEFAULT_DURATION = 1.0
+
+
+def past_durations(workflow, previous_workflow):
+    """ Retrieves how long the processes of the workflow took when they succeeded in the previous workflow
+    :param workflow: the current workflow
+    :param previous_workflow: the workflow from the last run. Can be None
+    :return: a dictionary of durations in seconds, indexed by the processes of the current workflow
+    """
+    durations = {}
+    if previous_workflow is None:
+        return durations
+    outputless = {process.sorted_inputs_string(): process
+                  for process in workflow.iter_processes() if not process.has_outputs()}
+    for prev_process in previous_workflow.iter_processes():
+        if not prev_process.success or prev_process.start is None or prev_process.end is None:
+            continue
+        output_resource = prev_process.pick_an_output()
+        if output_resource:
+            process = workflow.find_process_that_creates(output_resource.url)
+        else:
+            process = outputless.get(prev_process.sorted_inputs_string())
+        if process is not None:
+            durations[process] = prev_process.end - prev_process.start
+    return durations
+
+
+def default_duration(durations):
+    """ The duration to expect for a process that have never run : the median of known durations
+    :param durations: a dictionary of known durations
+    """
+    if not durations:
+        return DEFAULT_DURATION
+    known = sorted(durations.values())
+    return known[len(known) // 2]
+
+
+def estimated_durations(workflow, durations):
+    """ Estimates the duration of every process of the workflow that still have to run. Processes that have already
+    run cost nothing
+    :param durations: a dictionary of known durations, as returned by past_durations()
+    :return: a dictionary of durations indexed by process
+    """
+    default = default_duration(durations)
+    estimations = {}
+    for process in workflow.iter_processes():
+        if process.start is not None:
+            estimations[process] = 0
+        else:
+            estimations[process] = durations.get(process, default)
+    return estimations
+
+
+def processes_successors(workflow):
+    """ :return: a dictionary of the sets of processes that use the outputs of a process, indexed by process """
+    successors = {process: set() for process in workflow.iter_processes()}
+    for process in workflow.iter_processes():
+        for in_res in process.iter_inputs():
+            if in_res.creator_process in successors:
+                successors[in_res.creator_process].add(process)
+    return successors
+
+
+def remaining_critical_paths(workflow, estimations):
+    """ Computes, for every process, the estimated duration of the longest chain of processes that can only start
+    after this one. The longer it is, the sooner the process should start
+    :param estimations: a dictionary of durations indexed by process, as returned by estimated_durations()
+    :return: a dictionary of durations indexed by process
+    """
+    successors = processes_successors(workflow)
+    order = [process for process in workflow.iter_processes_on_dependency_order()]
+    critical_paths = {}
+    for process in reversed(order):
+        longest_next = max([critical_paths[successor] for successor in successors[process]] or [0])
+        critical_paths[process] = estimations[process] + longest_next
+    return critical_paths
+
+
+def critical_path(workflow, estimations):
+    """ The chain of processes left to run that takes the longest, according to the estimations. Whatever the number
+    of workers, the workflow can't complete sooner
+    :return: the list of processes of the chain, in the order they have to run
+    """
+    critical_paths = remaining_critical_paths(workflow, estimations)
+    successors = processes_successors(workflow)
+    candidates = [process for process in workflow.iter_selected_processes() if process.start is None]
+    path = []
+    while candidates:
+        process = max(candidates, key=critical_paths.get)
+        path.append(process)
+        candidates = [successor for successor in successors[process] if successor.start is None]
+    return path
+
+
+class RunnableProcesses:
+    """ The processes ready to run, popped by decreasing priority. Processes without priority come last """
+
+    def __init__(self, priorities):
+        self._priorities = priorities
+        self._heap = []
+        # Keeps the order of insertion between processes of same priority
+        self._counter = count()
+
+    def update(self, processes):
+        for process in processes:
+            heappush(self._heap, (-self._priorities.get(process, 0), next(self._counter), process))
+
+    def pop(self):
+        return heappop(self._heap)[2]
+
+    def __len__(self):
+        return len(self._heap)
+
+
+def simulate_schedule(workflow, estimations, runner):
+    """ Simulates the run of the processes left to run, as the runner would start them on its workers, assuming that
+    every process takes its estimated duration and succeeds
+    :param estimations: a dictionary of durations indexed by process, as returned by estimated_durations()
+    :param runner: a WorkflowRunner, whose workers are not running anything
+    :return: the list of (process, start, end) of the processes that would run, in the order they start, and the
+    total duration of the simulated run
+    """
+    to_run = {process for process in workflow.iter_selected_processes() if process.start is None}
+    successors = processes_successors(workflow)
+    # Number of processes to run before each process can start, or None if the process will never be able to start
+    # because an input is missing and won't be created
+    nb_missing = {}
+    for process in to_run:
+        creators = {in_res.creator_process for in_res in process.iter_inputs()
+                    if not workflow.resource_available(in_res.url)}
+        if creators <= to_run:
+            nb_missing[process] = len(creators)
+        else:
+            nb_missing[process] = None
+    runnables = RunnableProcesses(remaining_critical_paths(workflow, estimations))
+    runnables.update(process for process in workflow.iter_selected_processes() if nb_missing.get(process) == 0)
+    runner.free_all_resources()
+    now = 0
+    running = []
+    starts = []
+    while True:
+        for process in runner.admit_processes(runnables):
+            runner.acquire_worker(process)
+            heappush(running, (now + estimations[process], len(starts), process))
+            starts.append((process, now))
+        if not running:
+            break
+        now, _, process = heappop(running)
+        runner.release_worker(process)
+        for successor in successors[process]:
+            if nb_missing.get(successor):
+                nb_missing[successor] -= 1
+                if nb_missing[successor] == 0:
+                    runnables.update([successor])
+    schedule = [(process, start, start + estimations[process]) for process, start in starts]
+    return schedule, now
+
+
+def worker_utilisation(schedule, makespan, runner):
+    """ The share of the time the workers of the runner would be busy during the simulated run. I/O bound processes
+    run in threads and don't count
+    :return: a ratio between 0 and 1
+    """
+    if makespan == 0:
+        return 0
+    busy = sum(runner.weights(process)[0] * (end - start) for process, start, end in schedule)
+    return float(busy) / (makespan * runner.nb_workers())
@@ -0,0 +1,284 @@
+# -*- coding: utf8 -*-
+
+"""
+Static sharding of a workflow across machines sharing the file system of the workspace : tuttle run --shard i/N on
+N machines, then tuttle merge-shards.
+
+Every shard computes the same partition of the processes from the tuttlefile and from the previous run, and runs its
+own part. Shards don't talk to each other : a shard waits for the inputs created by other shards by polling the
+dumps of these shards, and a shard writes a marker when its run is over. Each shard writes in its own tuttle
+directory, so that the shards don't overwrite each other's dump and logs, until merge-shards gathers them into the
+.tuttle directory of the workspace.
+"""
+from contextlib import contextmanager
+from glob import glob
+from itertools import chain
+from os import makedirs, remove
+from os.path import join, exists, basename, isdir
+from shutil import rmtree
+from time import time
+
+from tuttle.error import TuttleError
+from tuttle.tuttle_directories import TuttleDirectories
+from tuttle.workflow import Workflow
+
+
+# A shard can take up to this share more than its part of the total estimated duration, in order to keep processes
+# that exchange resources together
+BALANCE_TOLERANCE = 0.1
+
+# Seconds between two checks for the inputs created by other shards
+POLL_INTERVAL = 1.0
+
+CREATOR_HAS_FAILED = "Input {} has not been created : process {} has failed in shard {}/{}"
+SHARD_HAS_ENDED = "Input {} has not been created : shard {}/{} has ended without running process {}"
+WAIT_TIMED_OUT = "Input {} has not been created by shard {}/{} after waiting for {}s"
+
+
+def parse_shard(value):
+    """ Parses a shard as i/N, i being between 1 and N
+    :return: i, N
+    :raises ValueError: if the shard is not valid
+    """
+    index, sep, count = value.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError('"{}" is not a valid shard : expected i/N'.format(value))
+    if not 1 <= index <= count:
+        raise ValueError('"{}" is not a valid shard : i must be between 1 and N'.format(value))
+    return index, count
+
+
+def shard_dir(shard):
+    """ :return: the tuttle directory of a shard """
+    return TuttleDirectories.main_dir('shards', '{}-of-{}'.format(*shard))
+
+
+def partition(workflow, estimations, nb_shards):
+    """ Splits the selected processes into nb_shards parts of about the same estimated duration, keeping processes
+    that exchange resources in the same part when possible. Processes are assigned in dependency order, each one
+    to the part that creates most of its inputs, weighted by the room left in the part (linear deterministic greedy
+    partitioning). A part can't exceed its share of the total duration by more than BALANCE_TOLERANCE
+    :param estimations: a dictionary of durations indexed by process, as returned by estimated_durations()
+    :return: a list of nb_shards sets of processes
+    """
+    processes = [process for process in workflow.iter_processes_on_dependency_order()
+                 if workflow.is_selected(process)]
+    total = sum(estimations[process] for process in processes)
+    capacity = (1 + BALANCE_TOLERANCE) * total / nb_shards
+    parts = [set() for _ in range(nb_shards)]
+    loads = [0] * nb_shards
+    shard_of = {}
+    for process in processes:
+        cost = estimations[process]
+        affinities = [0] * nb_shards
+        for in_res in process.iter_inputs():
+            if in_res.creator_process in shard_of:
+                affinities[shard_of[in_res.creator_process]] += 1
+        candidates = [i for i in range(nb_shards) if loads[i] + cost <= capacity] or range(nb_shards)
+
+        def score(i):
+            room = 1 - float(loads[i]) / capacity if capacity else 1
+            # Ties go to the least loaded part, then to the first one, so that every shard finds the same partition
+            return affinities[i] * room, -loads[i], -i
+
+        chosen = max(candidates, key=score)
+        parts[chosen].add(process)
+        loads[chosen] += cost
+        shard_of[process] = chosen
+    return parts
+
+
+def resources_to_remove(workflow, processes, urls, first_shard):
+    """ A shard only removes the invalid resources created by its processes, and the first shard the ones no process
+    creates any more. Resources created by other shards may already have been created again
+    :param urls: the urls of the invalid resources
+    :return: the set of urls the shard removes
+    """
+    result = set()
+    for url in urls:
+        creator = workflow.find_process_that_creates(url)
+        if creator in processes or (creator is None and first_shard):
+            result.add(url)
+    return result
+
+
+def ended_marker(shard):
+    """ :return: the path of the file a shard writes when its run is over, whatever the outcome """
+    return join(shard_dir(shard), "ended")
+
+
+def mark_ended(shard, ended=True):
+    """ Tells the other shards that this one has ended (or starts again after a run that has stopped early) """
+    marker = ended_marker(shard)
+    if ended:
+        if not isdir(shard_dir(shard)):
+            makedirs(shard_dir(shard))
+        open(marker, "w").close()
+    elif exists(marker):
+        remove(marker)
+
+
+@contextmanager
+def shard_running(shard):
+    """ Marks the shard as ended when the block exits, whatever the outcome. Nothing is marked if shard is None """
+    if shard is None:
+        yield
+        return
+    mark_ended(shard, False)
+    try:
+        yield
+    finally:
+        mark_ended(shard)
+
+
+def check_not_run(shard):
+    """ :raises TuttleError: if the shard has already run and has not been merged """
+    if exists(join(shard_dir(shard), "last_workflow.pickle")):
+        raise TuttleError("Shard {}/{} has already run. Merge the shards with tuttle merge-shards before running them "
+                          "again".format(*shard))
+
+
+class CrossShardInputs:
+    """ The inputs of the processes of a shard that other shards create. As shards don't communicate, an input is
+    considered created when the dump of the shard that creates it shows it is available : the file may exist before,
+    because it is left from a previous run or because it is still being written """
+
+    def __init__(self, workflow, shard, parts, timeout=None):
+        """
+        :param shard: the shard that runs the workflow, as (i, N)
+        :param parts: the partition of the processes between the shards (see partition())
+        :param timeout: seconds after which the inputs that have not been created are considered as failed. None to
+        wait until the shards that create them end
+        """
+        owners = {process: (i + 1, shard[1]) for i, part in enumerate(parts) for process in part}
+        self._awaited = {}
+        self._owners = {}
+        for process in workflow.iter_selected_processes():
+            if process.start is not None:
+                continue
+            for in_res in process.iter_inputs():
+                creator = in_res.creator_process
+                if creator in owners and not workflow.is_selected(creator) \
+                        and not workflow.resource_available(in_res.url):
+                    self._awaited[in_res.url] = in_res
+                    self._owners[in_res.url] = owners[creator]
+        self._timeout = timeout
+        self._start = time()
+        self._last_poll = None
+
+    def urls(self):
+        return self._awaited.keys()
+
+    def pending(self):
+        return len(self._awaited) > 0
+
+    @staticmethod
+    def load_shard_workflow(shard):
+        """ :return: the workflow a shard has dumped so far, or None if it has not started yet """
+        return Workflow.load(join(shard_dir(shard), "last_workflow.pickle"))
+
+    def poll(self):
+        """ Checks for the awaited resources in the dumps of the shards that create them, at most every POLL_INTERVAL
+        :return: the signatures of the awaited resources that have been created since the last poll, indexed by url,
+        and the error messages of the ones that will not be created, indexed by url
+        """
+        now = time()
+        if not self._awaited or (self._last_poll is not None and now - self._last_poll < POLL_INTERVAL):
+            return {}, {}
+        self._last_poll = now
+        timed_out = self._timeout is not None and now - self._start >= self._timeout
+        created, failed = {}, {}
+        owner_workflows = {}
+        for url in self._awaited.keys():
+            owner = self._owners[url]
+            if owner not in owner_workflows:
+                # Checked before loading the dump, so that the dump is the last one if the shard has ended
+                ended = exists(ended_marker(owner))
+                owner_workflows[owner] = self.load_shard_workflow(owner), ended
+            owner_workflow, ended = owner_workflows[owner]
+            creator = self._awaited[url].creator_process
+            if owner_workflow is not None:
+                if owner_workflow.resource_available(url):
+                    created[url] = owner_workflow.signature(url)
+                    continue
+                owner_creator = owner_workflow.find_process_that_creates(url)
+                if owner_creator is not None and owner_creator.success is False:
+                    failed[url] = CREATOR_HAS_FAILED.format(url, creator.id, *owner)
+                    continue
+            if ended:
+                failed[url] = SHARD_HAS_ENDED.format(url, owner[0], owner[1], creator.id)
+            elif timed_out:
+                failed[url] = WAIT_TIMED_OUT.format(url, owner[0], owner[1], self._timeout)
+        for url in chain(created, failed):
+            del self._awaited[url]
+        return created, failed
+
+
+def find_shards():
+    """ :return: the directories of the shards that have run, indexed by shard """
+    shards = {}
+    for directory in glob(TuttleDirectories.main_dir('shards', '*-of-*')):
+        try:
+            shard = parse_shard(basename(directory).replace('-of-', '/'))
+        except ValueError:
+            continue
+        shards[shard] = directory
+    return shards
+
+
+def merge_shard_workflow(workflow, shard_workflow, directory):
+    """ Retrieves in workflow the execution info, the logs and the signatures of the outputs of the processes
+    of a shard
+    :param directory: the tuttle directory of the shard
+    """
+    processes = {process.id: process for process in workflow.iter_processes()}
+    shard_processes_dir = join(directory, 'processes')
+    for shard_process in shard_workflow.iter_selected_processes():
+        process = processes[shard_process.id]
+        process.retrieve_execution_info(shard_process)
+        if process.start is not None and process.log_stdout.startswith(shard_processes_dir):
+            TuttleDirectories.move_paths_from(process, shard_processes_dir)
+        for url in process.output_urls():
+            signature = shard_workflow.signature(url)
+            if signature is None:
+                workflow.clear_signatures([url])
+            else:
+                workflow.update_signatures({url: signature})
+
+
+def merge_shards():
+    """ Gathers the workflows of the shards that have run into the .tuttle directory of the workspace, as if a single
+    run had run all the processes. A shard that has not run leaves its processes as they were before the run
+    :return: the merged workflow, and the list of the shards that have been merged
+    :raises TuttleError: if there is nothing to merge
+    """
+    shards = find_shards()
+    if not shards:
+        raise TuttleError("No shard to merge")
+    if len({count for index, count in shards}) > 1:
+        raise TuttleError("Can't merge shards from runs with different numbers of shards : {}".format(
+            ", ".join("{}/{}".format(*shard) for shard in sorted(shards))))
+    TuttleDirectories.create_tuttle_dirs()
+    workflow = None
+    merged = []
+    for shard in sorted(shards):
+        shard_workflow = Workflow.load(join(shards[shard], "last_workflow.pickle"))
+        if shard_workflow is None:
+            continue
+        if workflow is None:
+            # All the shards start from the same workflow : the first one brings the processes of the shards that
+            # have not run, and the preprocesses
+            workflow = shard_workflow
+            for preprocess in workflow.iter_preprocesses():
+                if preprocess.start is not None:
+                    TuttleDirectories.move_paths_from(preprocess, join(shards[shard], 'processes'))
+        merge_shard_workflow(workflow, shard_workflow, shards[shard])
+        merged.append(shard)
+    if workflow is None:
+        raise TuttleError("No shard to merge : the shards have not run any process")
+    workflow.select_processes(None)
+    workflow.export()
+    rmtree(TuttleDirectories.main_dir('shards'))
+    return workflow, merged
@@ -0,0 +1,141 @@
+# -*- coding: utf8 -*-
+
+"""
+Cache of the signatures of files, like the index of git : the signature of a file is stored with its size, its
+modification time, its inode and its change time, and the file is only hashed again if one of them has changed.
+The cache is a sqlite database, .tuttle/signatures.sqlite, shared by the workers. Setting the environment variable
+TUTTLE_SIGNATURE_CACHE to another path, eg in the home directory, shares it across projects.
+
+With TUTTLE_TRUST_MTIME=1, a file is considered unchanged as long as its size and modification time are the same,
+even if it has been copied or restored (new inode and change time).
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+from os.path import abspath, dirname, isdir, isfile
+from stat import S_ISREG
+from threading import local
+from time import time
+
+from tuttle.hashing import hash_algorithm, signature_algorithm
+from tuttle.tuttle_directories import TuttleDirectories
+
+
+CACHE_VARIABLE = 'TUTTLE_SIGNATURE_CACHE'
+TRUST_MTIME_VARIABLE = 'TUTTLE_TRUST_MTIME'
+# A file modified less than RACY_DELAY seconds before being hashed could change again within the precision of its
+# modification time, without the cache noticing. Its signature is not stored
+RACY_DELAY = 2
+# Seconds to wait for another process that writes in the cache
+LOCK_TIMEOUT = 60
+
+
+def cache_path():
+    # Absolute, because the connection of a thread is kept while the current directory may change
+    return abspath(os.environ.get(CACHE_VARIABLE) or TuttleDirectories.main_dir("signatures.sqlite"))
+
+
+def trust_mtime():
+    return os.environ.get(TRUST_MTIME_VARIABLE, '') not in ('', '0')
+
+
+class SignatureCache:
+    """ A connection to the cache. Connections can't be shared between processes nor threads (see open_cache()) """
+
+    def __init__(self, path, read_only=False):
+        """ :param read_only: if True, the cache must already exist, and signatures can't be stored """
+        self.path = path
+        self.read_only = read_only
+        self.pid = os.getpid()
+        self._db = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        if not read_only:
+            self._db.execute("CREATE TABLE IF NOT EXISTS signatures (path TEXT PRIMARY KEY, size INTEGER, "
+                             "mtime REAL, inode INTEGER, ctime REAL, signature TEXT)")
+            self._db.commit()
+
+    def get(self, path, stat, trust_mtime=False):
+        """ :return: the signature of the file if it has not changed since it was stored, otherwise None """
+        row = self._db.execute("SELECT size, mtime, inode, ctime, signature FROM signatures WHERE path = ?",
+                               (path,)).fetchone()
+        if row is None:
+            return None
+        size, mtime, inode, ctime, signature = row
+        if size != stat.st_size or mtime != stat.st_mtime:
+            return None
+        if not trust_mtime and (inode != stat.st_ino or ctime != stat.st_ctime):
+            return None
+        return signature
+
+    def set(self, path, stat, signature):
+        self._db.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?, ?)",
+                         (path, stat.st_size, stat.st_mtime, stat.st_ino, stat.st_ctime, signature))
+        self._db.commit()
+
+
+_caches = local()
+# Shared by all the threads, eg the ones of compute_signatures()
+_read_only = [False]
+
+
+@contextmanager
+def read_only(enabled=True):
+    """ Uses the cache without writing to it, eg for a dry run """
+    former = _read_only[0]
+    _read_only[0] = enabled
+    try:
+        yield
+    finally:
+        _read_only[0] = former
+
+
+def open_cache():
+    """ :return: the cache of the current thread, or None if it can't be used, eg before the tuttle directory is
+    created """
+    path = cache_path()
+    cache = getattr(_caches, 'cache', None)
+    if cache is not None and cache.pid == os.getpid() and cache.path == path and cache.read_only == _read_only[0]:
+        return cache
+    _caches.cache = None
+    if not isdir(dirname(path)) or (_read_only[0] and not isfile(path)):
+        return None
+    try:
+        _caches.cache = SignatureCache(path, _read_only[0])
+    except sqlite3.Error:
+        pass
+    return _caches.cache
+
+
+def cached_signature(path, compute_signature):
+    """ :return: the signature of a file, from the cache if the file has not changed since it was computed
+    :param compute_signature: the function that computes the signature, eg by hashing the file
+    """
+    try:
+        before = os.stat(path)
+    except OSError:
+        return compute_signature()
+    if not S_ISREG(before.st_mode):
+        return compute_signature()
+    cache = open_cache()
+    if cache is None:
+        return compute_signature()
+    try:
+        signature = cache.get(path, before, trust_mtime())
+        # The signature is computed again if the hash algorithm has changed
+        if signature is not None and signature_algorithm(signature) == hash_algorithm():
+            return signature
+    except sqlite3.Error:
+        return compute_signature()
+    signature = compute_signature()
+    try:
+        after = os.stat(path)
+    except OSError:
+        return signature
+    unchanged = (after.st_size, after.st_mtime, after.st_ino, after.st_ctime) == \
+                (before.st_size, before.st_mtime, before.st_ino, before.st_ctime)
+    if unchanged and time() - after.st_mtime >= RACY_DELAY and not cache.read_only:
+        try:
+            cache.set(path, after, signature)
+        except sqlite3.Error:
+            # Eg the cache is locked for too long. The signature will be computed again next time
+            pass
+    return signature
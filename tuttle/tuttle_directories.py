@@ -1,7 +1,8 @@
 # -*- coding: utf8 -*-
+from contextlib import contextmanager
 from glob import glob
 from itertools import chain
-from os.path import join, isfile, isdir, basename, exists
+from os.path import join, isfile, isdir, basename, exists, dirname
 from os import remove, makedirs
 from shutil import rmtree, move
 
@@ -12,14 +13,38 @@ def tuttle_dir(*args):
 
 class TuttleDirectories:
 
+    _root = tuttle_dir()
     _processes_dir = tuttle_dir('processes')
     _logs_dir = tuttle_dir('processes', 'logs')
     _extensions_dir = tuttle_dir('extensions')
 
     @staticmethod
     def tuttle_dir(*args):
+        return join(TuttleDirectories._root, *args)
+
+    @staticmethod
+    def main_dir(*args):
+        """ The .tuttle directory of the workspace, even when another directory is in use (see use_root()) """
         return tuttle_dir(*args)
-        #return join('.tuttle', *args)
+
+    @staticmethod
+    def set_root(root):
+        TuttleDirectories._root = root
+        TuttleDirectories._processes_dir = join(root, 'processes')
+        TuttleDirectories._logs_dir = join(root, 'processes', 'logs')
+        TuttleDirectories._extensions_dir = join(root, 'extensions')
+
+    @staticmethod
+    @contextmanager
+    def use_root(root):
+        """ Within this context, root replaces the .tuttle directory for everything a run writes, eg the directory
+        of a shard (see sharding.py) """
+        former_root = TuttleDirectories._root
+        TuttleDirectories.set_root(root)
+        try:
+            yield
+        finally:
+            TuttleDirectories.set_root(former_root)
 
     @staticmethod
     def list_extensions():
@@ -81,6 +106,9 @@ class TuttleDirectories:
         TuttleDirectories.create_tuttle_dirs()
         for process in chain(workflow.iter_processes(), workflow.iter_preprocesses()):
             if process.start is not None:
+                if dirname(process.log_stdout) != TuttleDirectories._logs_dir:
+                    # Has run with another tuttle directory, eg the main one for a shard : its logs stay there
+                    continue
                 TuttleDirectories.move_paths_from(process, tmp_processes)
             else:
                 TuttleDirectories.prepare_and_assign_paths(process)
@@ -1,6 +1,9 @@
 # -*- coding: utf8 -*-
 import os
 
+import psutil
+from psutil import NoSuchProcess, AccessDenied
+
 
 class CurrentDir(object):
     """
@@ -37,3 +40,78 @@ class EnvVar(object):
             os.environ[self.var] = self.former_value
         else:
             del os.environ[self.var]
+
+
+def terminate_processes(procs, timeout=2):
+    """ Terminates the (psutil) processes, then kills the ones that are still alive after timeout seconds """
+    for p in procs:
+        try:
+            p.terminate()
+        except NoSuchProcess:
+            pass
+    gone, still_alive = psutil.wait_procs(procs, timeout=timeout)
+    for p in still_alive:
+        try:
+            p.kill()
+        except NoSuchProcess:
+            pass
+
+
+def terminate_process_tree(pid, timeout=2):
+    """ Terminates a process and all its descendants """
+    try:
+        process = psutil.Process(pid)
+        procs = process.children(recursive=True) + [process]
+    except NoSuchProcess:
+        return
+    terminate_processes(procs, timeout)
+
+
+class DescendantsCpu:
+    """ Measures the cpus used by the descendants of a process, eg the workers of tuttle and the programs they run """
+
+    def __init__(self, pid=None):
+        self._root = psutil.Process(pid or os.getpid())
+        # The processes seen at the previous measure, by pid : psutil measures their cpu since then
+        self._processes = {}
+
+    def measure(self):
+        """ :return: the number of cpus used by the descendants since the previous measure. Processes started in the
+        meantime are not counted yet
+        """
+        try:
+            descendants = self._root.children(recursive=True)
+        except NoSuchProcess:
+            return 0.0
+        used = 0.0
+        processes = {}
+        for process in descendants:
+            previous = self._processes.get(process.pid)
+            if previous is not None and previous == process:
+                # Same process, not a new one with the same pid
+                process = previous
+            try:
+                used += process.cpu_percent(None) / 100.0
+            except (NoSuchProcess, AccessDenied):
+                continue
+            processes[process.pid] = process
+        self._processes = processes
+        return used
+
+
+def system_load():
+    """ The load of the machine. On Linux, it is the number of processes currently running or waiting for a cpu,
+    like GNU make -l does, because the load average reacts too slowly to the processes we've just started.
+    Elsewhere, it is the load average over the last minute, or the cpu usage converted to a number of cpus
+    """
+    try:
+        with open('/proc/loadavg') as f:
+            running = f.read().split()[3].split('/')[0]
+        # Don't count ourselves
+        return max(int(running) - 1, 0)
+    except (IOError, IndexError, ValueError):
+        pass
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return psutil.cpu_percent() * psutil.cpu_count() / 100.0
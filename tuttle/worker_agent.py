@@ -0,0 +1,115 @@
+# -*- coding: utf8 -*-
+
+"""
+The worker agent runs processes for a coordinator on another machine (see remote.py) : tuttle worker HOST:PORT
+"""
+import logging
+import os
+import socket
+import sys
+from multiprocessing import Pool, cpu_count
+from multiprocessing.connection import Client, AuthenticationError
+from threading import Lock
+from time import sleep
+
+from tuttle.error import TuttleError
+from tuttle.workflow_runner import run_process_in_worker, terminate_pool_subprocesses
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds between two attempts to connect to the coordinator
+RETRY_DELAY = 1.0
+
+
+def connect(address, authkey):
+    """ Waits for the coordinator to listen
+    :raises TuttleError: if the coordinator does not accept the secret key
+    """
+    while True:
+        try:
+            return Client(address, authkey=authkey)
+        except AuthenticationError:
+            raise TuttleError("The coordinator on {}:{} has rejected the secret key".format(*address))
+        except socket.error:
+            sleep(RETRY_DELAY)
+
+
+def register(conn, nb_workers, workspace):
+    """ Tells the coordinator how many processes the agent can run, and moves to the workspace
+    :param workspace: the directory where to run processes. Default is the workspace of the coordinator, which
+    is the same on a shared file system mounted at the same place
+    """
+    conn.send(('register', nb_workers, socket.gethostname()))
+    _, coordinator_workspace = conn.recv()
+    os.chdir(workspace or coordinator_workspace)
+    LOGGER.info("Running processes in {}".format(os.getcwd()))
+
+
+def serve(conn, pool):
+    """ Runs the processes sent by the coordinator, until it disconnects """
+    send_lock = Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == 'run':
+                _, task_id, task = message
+
+                def callback(result, task_id=task_id):
+                    try:
+                        send(('result', task_id, result))
+                    except IOError:
+                        pass
+
+                pool.apply_async(run_process_in_worker, [task], callback=callback)
+            elif message[0] == 'cancel':
+                terminate_pool_subprocesses(pool)
+            elif message[0] == 'stop':
+                return
+    except (IOError, EOFError):
+        pass
+
+
+def run_agent(address, authkey, nb_workers=-1, workspace=None, once=False):
+    """ Connects to the coordinator and runs the processes it sends. When the run is over, waits for the next one
+    :param nb_workers: number of processes that can run at the same time. -1 means half of the cpus
+    :param once: stop after the first run
+    """
+    if nb_workers == -1:
+        nb_workers = int((cpu_count() + 1) / 2)
+    while True:
+        conn = connect(address, authkey)
+        LOGGER.info("Connected to coordinator on {}:{} with {} worker(s)".format(address[0], address[1], nb_workers))
+        try:
+            register(conn, nb_workers, workspace)
+        except (IOError, EOFError):
+            conn.close()
+            continue
+        # A new pool for every run, so that nothing is left from the previous one. The workers start in the workspace
+        pool = Pool(nb_workers)
+        try:
+            serve(conn, pool)
+        finally:
+            # Closing rather than terminating the pool : once their processes are stopped, the workers are idle and
+            # leave cleanly, whereas Pool.terminate() can hang on a worker waiting for a task
+            terminate_pool_subprocesses(pool)
+            pool.close()
+            pool.join()
+            conn.close()
+        LOGGER.info("Coordinator has disconnected")
+        if once:
+            return 0
+
+
+def get_logger():
+    formater = logging.Formatter("%(message)s")
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(formater)
+    LOGGER.setLevel(logging.INFO)
+    LOGGER.addHandler(handler)
+    return LOGGER
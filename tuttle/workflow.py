@@ -1,52 +1,101 @@
 # -*- coding: utf8 -*-
 import sys
+from collections import deque
 from traceback import format_exception
 
 from tuttle.error import TuttleError
+from tuttle.resource import compute_signatures
 from tuttle.report.dot_repport import create_dot_report
 from tuttle.report.html_repport import create_html_report
 from pickle import dump, load
+from os import rename, remove
+from tuttle.journal import journal_path, process_record, append_records, replay, remove_journal
 from tuttle.workflow_runner import WorkflowRunner, TuttleEnv
 from tuttle_directories import TuttleDirectories
 from tuttle.log_follower import LogsFollower
 from tuttle.version import version
 
 class ProcessDependencyIterator:
-    """ Provides an iterator on processes according to dependency order"""
+    """ Provides an iterator on processes according to dependency order, in O(processes + dependencies)"""
 
     def __init__(self, workflow):
-        self._resources_to_build = {r for r in workflow.iter_resources() if r.creator_process}
-        self._processes_to_run = {p for p in workflow.iter_processes()}
-
-    def all_inputs_built(self, process):
-        """ Returns True if all inputs of this process where build, ie if the process can be executed """
-        for input_res in process.iter_inputs():
-            if input_res in self._resources_to_build:
-                return False
-        return True
-
-    def pick_a_process(self):
-        """ Pick an executable process, if there is one
-        """
-        for process in self._processes_to_run:
-            if self.all_inputs_built(process):
-                return process
-        # No more process to pick
-        return None
+        self._processes = [p for p in workflow.iter_processes()]
+        self._successors = {p: [] for p in self._processes}
+        self._nb_predecessors = {}
+        for process in self._processes:
+            predecessors = {in_res.creator_process for in_res in process.iter_inputs() if in_res.creator_process}
+            self._nb_predecessors[process] = len(predecessors)
+            for predecessor in predecessors:
+                self._successors[predecessor].append(process)
+        self._processes_to_run = set(self._processes)
 
     def iter_processes(self):
-        # The idea is to remove the resource from the list as we simulate execution of _processes
-        p = self.pick_a_process()
-        while p:
-            for r in p.iter_outputs():
-                self._resources_to_build.remove(r)
+        # Kahn's algorithm : a process is yielded when all the processes it depends on have been yielded
+        nb_predecessors = dict(self._nb_predecessors)
+        ready = deque(p for p in self._processes if nb_predecessors[p] == 0)
+        while ready:
+            p = ready.popleft()
             self._processes_to_run.remove(p)
             yield p
-            p = self.pick_a_process()
+            for successor in self._successors[p]:
+                nb_predecessors[successor] -= 1
+                if nb_predecessors[successor] == 0:
+                    ready.append(successor)
 
     def remaining(self):
         return self._processes_to_run
 
+    def circular_groups(self):
+        """ Groups of processes that depend on one another among the processes that could not be iterated, ie the
+        strongly connected components of the dependency graph with a cycle (Tarjan's algorithm, without recursion)
+        :return: a list of groups of processes, every group being ordered as in the workflow
+        """
+        rank = {p: i for i, p in enumerate(self._processes)}
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        groups = []
+        for root in sorted(self._processes_to_run, key=rank.get):
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            call_stack = [(root, iter(self._successors[root]))]
+            while call_stack:
+                process, successors = call_stack[-1]
+                pushed = False
+                for successor in successors:
+                    if successor not in self._processes_to_run:
+                        continue
+                    if successor not in index:
+                        index[successor] = lowlink[successor] = len(index)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        call_stack.append((successor, iter(self._successors[successor])))
+                        pushed = True
+                        break
+                    elif successor in on_stack:
+                        lowlink[process] = min(lowlink[process], index[successor])
+                if pushed:
+                    continue
+                call_stack.pop()
+                if call_stack:
+                    parent = call_stack[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[process])
+                if lowlink[process] == index[process]:
+                    group = []
+                    member = None
+                    while member is not process:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        group.append(member)
+                    if len(group) > 1 or process in self._successors[process]:
+                        groups.append(sorted(group, key=rank.get))
+        groups.sort(key=lambda group: rank[group[0]])
+        return groups
+
 
 class Workflow:
     """ A workflow is a dependency tree of processes
@@ -56,6 +105,10 @@ class Workflow:
         self._preprocesses = []
         self._resources = resources
         self._signatures = {}
+        self._missing_inputs = None
+        # Processes and urls of resources the run is restricted to. None means the whole workflow
+        self._selected_processes = None
+        self._selected_urls = None
         self.tuttle_version = version
 
     def add_process(self, process):
@@ -76,6 +129,59 @@ class Workflow:
         for process in self._processes:
             yield process
 
+    def select(self, urls):
+        """ Restricts the run to the processes needed to build the resources of urls, ie the processes that create
+        them and all their ancestors. Only the inputs and outputs of these processes will be discovered,
+        invalidated and computed
+        :param urls: the urls of the resources to build. They must belong to the workflow
+        :return: None
+        """
+        selected = set()
+        selected_urls = set(urls)
+        to_visit = [self.find_process_that_creates(url) for url in urls]
+        while to_visit:
+            process = to_visit.pop()
+            if process is None or process in selected:
+                continue
+            selected.add(process)
+            selected_urls.update(process.input_urls())
+            selected_urls.update(process.output_urls())
+            to_visit.extend(in_res.creator_process for in_res in process.iter_inputs())
+        self._selected_processes = selected
+        self._selected_urls = selected_urls
+
+    def select_processes(self, processes):
+        """ Restricts the run to processes, eg the processes of a shard (see sharding.py), without their ancestors.
+        Unlike select(), the resources have already been discovered
+        :param processes: the processes to run. None means the whole workflow
+        :return: None
+        """
+        if processes is None:
+            self._selected_processes = None
+            self._selected_urls = None
+            return
+        self._selected_processes = set(processes)
+        self._selected_urls = set()
+        for process in self._selected_processes:
+            self._selected_urls.update(process.input_urls())
+            self._selected_urls.update(process.output_urls())
+
+    def is_selected(self, process):
+        return self._selected_processes is None or process in self._selected_processes
+
+    def is_url_selected(self, url):
+        return self._selected_urls is None or url in self._selected_urls
+
+    def iter_selected_processes(self):
+        for process in self._processes:
+            if self.is_selected(process):
+                yield process
+
+    def iter_selected_resources(self):
+        for resource in self._resources.itervalues():
+            if self.is_url_selected(resource.url):
+                yield resource
+
     def iter_preprocesses(self):
         for preprocess in self._preprocesses:
             yield preprocess
@@ -98,7 +204,7 @@ class Workflow:
         :rtype: list
         """
         missing = []
-        for resource in self._resources.itervalues():
+        for resource in self.iter_selected_resources():
             if resource.is_primary():
                 if not self.resource_available(resource.url):
                     missing.append(resource)
@@ -107,7 +213,8 @@ class Workflow:
     def circular_references(self):
         """ Return a list of processes that won't be able to run according to to dependency graph, because
         of circular references, ie when A is produced by B... And B produced by A.
-        :return: a list of process that won't be able to run. No special indication about circular groups
+        :return: a list of process that won't be able to run. No special indication about circular groups : see
+        circular_groups()
         :rtype: list
         """
         process_iterator = ProcessDependencyIterator(self)
@@ -116,6 +223,18 @@ class Workflow:
 
         return process_iterator.remaining()
 
+    def circular_groups(self):
+        """ Return the groups of processes that reference one another in a circular way. Processes that can't run
+        only because they depend on such a group don't belong to any group
+        :return: a list of groups (lists) of processes
+        :rtype: list
+        """
+        process_iterator = ProcessDependencyIterator(self)
+        for _ in process_iterator.iter_processes():
+            pass
+
+        return process_iterator.circular_groups()
+
     def static_check_processes(self):
         """ Runs a pre-check for every process, in order to catch early obvious errors, even before invalidation
         :return: None
@@ -182,11 +301,21 @@ class Workflow:
         create_dot_report(self, TuttleDirectories.tuttle_dir("report.dot"))
 
     def dump(self):
-        """ Pickles the workflow and writes it to last_workflow.pickle
+        """ Pickles the workflow and writes it to last_workflow.pickle, as a new snapshot that replaces the former
+        snapshot and its journal (see journal.py). The file is written aside, then renamed, so that it is never
+        torn if tuttle is killed
         :return: None
         """
-        with open(TuttleDirectories.tuttle_dir("last_workflow.pickle"), "w") as f:
+        path = TuttleDirectories.tuttle_dir("last_workflow.pickle")
+        with open(path + ".tmp", "w") as f:
             dump(self, f)
+        try:
+            rename(path + ".tmp", path)
+        except OSError:
+            # Windows can't rename over an existing file
+            remove(path)
+            rename(path + ".tmp", path)
+        remove_journal(journal_path(path))
 
     def export(self):
         """ Export the workflow for external use : a dump for running tuttle later and a report for human users
@@ -195,14 +324,33 @@ class Workflow:
         self.dump()
         self.create_reports()
 
+    def export_progress(self, processes, reports=True):
+        """ Exports the workflow while it runs : the execution info of the processes that have started or ended
+        since the last export is appended to the journal of last_workflow.pickle instead of pickling the whole
+        workflow, and the reports are written
+        :param processes: the processes that have started or ended
+        :param reports: False if the reports don't have to be written, eg because a report server shows the
+        workflow in memory
+        :return: None
+        """
+        records = [process_record(self, process) for process in processes]
+        append_records(journal_path(TuttleDirectories.tuttle_dir("last_workflow.pickle")), records)
+        if reports:
+            self.create_reports()
 
     @staticmethod
-    def load():
+    def load(path=None):
+        """ :param path: the dump to load. Default is last_workflow.pickle in the tuttle directory """
+        if path is None:
+            path = TuttleDirectories.tuttle_dir("last_workflow.pickle")
         try:
-            with open(TuttleDirectories.tuttle_dir("last_workflow.pickle"), "r") as f:
-                return load(f)
+            with open(path, "r") as f:
+                workflow = load(f)
         except:
             return None
+        # What has happened after the snapshot
+        replay(workflow, journal_path(path))
+        return workflow
 
     def get_extensions(self):
         return TuttleDirectories.list_extensions()
@@ -238,14 +386,17 @@ class Workflow:
 
     def retrieve_signatures(self, previous):
         """ Retrieve the signatures from the former workflow. Useful to detect what has changed.
+            Resources out of the selection have not been discovered : they keep the signatures of the former workflow
             Returns True if some resources where in previous and no longer exist in self
         """
         for url, signature in previous.iter_available_signatures():
             if (url in self._signatures) and (self._signatures[url] == "DISCOVERED"):
                 self._signatures[url] = signature
+            elif url in self._resources and not self.is_url_selected(url):
+                self._signatures[url] = signature
 
     def pick_a_failing_process(self):
-        for process in self.iter_processes():
+        for process in self.iter_selected_processes():
             if process.end is not None and process.success is False:
                 return process
         return None
@@ -267,36 +418,62 @@ class Workflow:
                 return False
         return True
 
+    def init_missing_inputs(self):
+        """ Computes the urls of the missing inputs of every process, so that completion of a process only needs to
+        update its direct successors
+        :return: None
+        """
+        self.compute_dependencies()
+        self._missing_inputs = {}
+        for process in self.iter_processes():
+            self._missing_inputs[process] = {in_res.url for in_res in process.iter_inputs()
+                                             if not self.resource_available(in_res.url)}
+
     def runnable_processes(self):
         """ List processes that can be run (because they have all inputs)
         :return:
         """
+        self.init_missing_inputs()
         res = set()
-        for process in self.iter_processes():
-            if process.start is None and self.all_inputs_available(process):
+        for process in self.iter_selected_processes():
+            if process.start is None and not self._missing_inputs[process]:
                 res.add(process)
         return res
 
     def discover_runnable_processes(self, complete_process):
-        """ List processes that can be run (because they have all inputs)
+        """ List processes that can be run (because they have all inputs) among the ones that depend on
+        complete_process
         :return:
         """
-        res = set()
+        urls = [resource.url for resource in complete_process.iter_outputs() if self.resource_available(resource.url)]
+        return self.discover_processes_using(urls)
 
-        for process in self.iter_processes():
-            if process.start is None:
-                if process.depends_on_process(complete_process):
-                    if self.all_inputs_available(process):
-                        res.add(process)
+    def discover_processes_using(self, urls):
+        """ List processes that can be run (because they have all inputs) among the ones that use the resources of
+        urls, which have just become available
+        :return:
+        """
+        if self._missing_inputs is None:
+            self.init_missing_inputs()
+        res = set()
+        for url in urls:
+            resource = self._resources[url]
+            for process in resource.dependant_processes:
+                missing = self._missing_inputs[process]
+                missing.discard(resource.url)
+                if process.start is None and not missing and self.is_selected(process):
+                    res.add(process)
         return res
 
     def discover_resources(self):
-        for resource in self._resources.itervalues():
+        primary_resources = []
+        for resource in self.iter_selected_resources():
             if resource.exists():
                 if resource.is_primary():
-                    self._signatures[resource.url] = resource.signature()
+                    primary_resources.append(resource)
                 else:
                     self._signatures[resource.url] = "DISCOVERED"
+        self._signatures.update(compute_signatures(primary_resources))
 
     def signature(self, url):
         # TODO simplier with __get__ ?
@@ -314,12 +491,12 @@ class Workflow:
                 del self._signatures[url]
 
     def fill_missing_availability(self):
+        resources = []
         for url, signature in self.iter_available_signatures():
             if signature is True:
                 print("Filling availability for {}".format(url))
-                resource = self.find_resource(url)
-                new_signature = resource.signature()
-                self._signatures[url] = new_signature
+                resources.append(self.find_resource(url))
+        self._signatures.update(compute_signatures(resources))
 
     def similar_process(self, process_from_other_workflow):
         output_resource = process_from_other_workflow.pick_an_output()
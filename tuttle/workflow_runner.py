@@ -5,16 +5,27 @@ Utility methods for use in running workflows.
 This module is responsible for the inner structure of the .tuttle directory
 """
 from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
 import multiprocessing
 from os.path import abspath
-from traceback import format_exception
+import os
+from traceback import format_exception, format_exc
 
 from psutil import NoSuchProcess
 
 from tuttle.error import TuttleError
-from tuttle.utils import EnvVar
+from tuttle.exporter import BackgroundExporter
+from tuttle.figures_formating import nice_size
+from tuttle.jobserver import JobServer
+from tuttle.utils import EnvVar, terminate_processes, system_load, DescendantsCpu
 from tuttle.log_follower import LogsFollower
-from time import sleep
+from tuttle.process import ProcessTask
+from tuttle.resource import compute_signatures
+from tuttle.remote import RemoteWorkers
+from tuttle.scheduling import estimated_durations, remaining_critical_paths, RunnableProcesses
+from tuttle.tuttle_directories import TuttleDirectories
+from threading import Condition
+from time import time
 import sys
 import logging
 import psutil
@@ -35,7 +46,7 @@ def resources2list(resources):
 
 
 def output_signatures(process):
-    result = {resource.url: str(resource.signature()) for resource in process.iter_outputs()}
+    result = {url: str(signature) for url, signature in compute_signatures(process.iter_outputs()).iteritems()}
     return result
 
 
@@ -55,16 +66,63 @@ MISSING_OUTPUT = "After execution of process {process_id} : these resources " \
                  "should have been created : \n" \
                  "{missing_outputs} "
 
+CANCELLED_PROCESS = "Process has been cancelled because another process has failed\n{error_detail}"
+
 ERROR_IN_SIGNATURE = "An unexpected error have happen in tuttle while retrieving signature after " \
                      "process {process_id} has run: \n{stacktrace}\n" \
                      "Process cannot be considered complete."
 
+ERROR_IN_BUILD = "An unexpected error have happen in tuttle while preparing process {process_id} to run in a " \
+                 "worker : \n{stacktrace}\n" \
+                 "Process will not run."
+
 
 # This is a free method, because it will be serialized and passed
 # to another process, so it must not be linked to objects nor
 # capture closures
-def run_process_without_exception(process):
+def run_process_in_worker(task):
+    try:
+        process = task.build_process()
+    except Exception:
+        # The runner must get a result, otherwise it would wait for this process forever
+        msg = ERROR_IN_BUILD.format(process_id=task.process_id, stacktrace=format_exc())
+        return False, msg, None
     multiprocessing.current_process().name = process.id
+    return run_process_without_exception(process)
+
+
+def run_batch_in_worker(tasks, keep_going):
+    """ Runs several processes one after the other
+    :param keep_going: if False, the processes after a failure don't run
+    :return: the list of the results of the processes (see run_process_without_exception()), with the time they have
+    started and ended, or None for a process that has not run
+    """
+    results = []
+    failed = False
+    for task in tasks:
+        if failed and not keep_going:
+            results.append(None)
+            continue
+        start = time()
+        result = run_process_in_worker(task)
+        results.append((result, start, time()))
+        failed = failed or not result[0]
+    return results
+
+
+def terminate_pool_subprocesses(pool):
+    """ Terminates what the workers of a pool have started (eg the shell of a shell process). The workers report the
+    failure of their process and stay available """
+    sub_procs = []
+    for worker in pool._pool:
+        try:
+            sub_procs += psutil.Process(worker.pid).children(recursive=True)
+        except NoSuchProcess:
+            pass
+    terminate_processes(sub_procs)
+
+
+def run_process_without_exception(process):
     print_process_header(process, LOGGER)
     error_msg = ERROR_IN_PROCESS
     try:
@@ -97,49 +155,353 @@ def underline(st, char = '-'):
     return char * len(st)
 
 
+# Number of workers that adapts to the load of the machine (see WorkflowRunner.host_saturated())
+AUTO_WORKERS = 'auto'
+
+
 class WorkflowRunner:
 
+    # Maximum time the main loop blocks waiting for a process to complete. It does not delay the handling of
+    # completed processes : it only bounds the time before the loop checks for ^C
+    COMPLETION_WAIT_TIMEOUT = 1.0
+
+    # Processes that took less than this in the previous run are sent to the workers by batches (see pop_batch())
+    SHORT_PROCESS_DURATION = 0.1
+
+    # Maximum number of processes in a batch, and maximum of their total estimated duration
+    BATCH_SIZE = 20
+    BATCH_DURATION = 1.0
+
+    # Minimum time between two measures of the load and of the free memory of the machine
+    HOST_SAMPLE_INTERVAL = 1.0
+
+    # With an automatic number of workers, no process starts when the free memory is under this share of the memory
+    AUTO_MIN_FREE_MEM_RATIO = 0.05
+
+    # Default minimum time between two exports of the reports and of the journal while the workflow runs
+    EXPORT_INTERVAL = 1.0
+
     @staticmethod
     def resources2list(resources):
         res = "\n".join(("* {}".format(resource.url) for resource in resources))
         return res
 
-    def __init__(self, nb_workers):
+    def __init__(self, nb_workers, max_mem=None, limits=None, nb_io_workers=None, max_load=None, min_free_mem=None,
+                 jobserver=False, listen=None, authkey=None, export_interval=None, report_server=None):
+        """
+        :param nb_workers: number of processes that can run at the same time. -1 means half of the cpus.
+        AUTO_WORKERS means as many as the cpus, as long as the machine is not saturated (see host_saturated())
+        :param max_mem: the memory, in bytes, the processes can use together according to their mem option.
+        Default is the memory of the machine
+        :param limits: maximum number of processes that can run at the same time, indexed by processor name
+        or by target of the processor (eg a database or a host, see concurrency_keys())
+        :param nb_io_workers: number of threads for the processes of I/O bound processors (see is_io_bound()).
+        Default is the same as nb_workers
+        :param max_load: no process starts while the load of the machine is over max_load, unless nothing is running.
+        Default is no limit, or the number of cpus with AUTO_WORKERS
+        :param min_free_mem: no process starts while the free memory of the machine, in bytes, is under min_free_mem,
+        unless nothing is running. Default is no limit, or a small share of the memory with AUTO_WORKERS
+        :param jobserver: if True, the workers are shared with the programs the processes run (eg make -j) through a
+        GNU make jobserver. Anyway, tuttle joins the jobserver of the make that runs it, if any (see init_workers())
+        :param listen: host and port where worker agents on other machines can connect to run processes
+        (see remote.py). Default is to run processes only on this machine
+        :param authkey: the secret key the worker agents must know
+        :param export_interval: minimum time in seconds between two exports of the running workflow, which happen in
+        the background (see exporter.py). Default is EXPORT_INTERVAL
+        :param report_server: the server that shows the running workflow (see report/report_server.py), if any. It
+        is notified of every process that starts or ends, and the report files are only written at the end
+        """
         self._lt = LogsFollower()
         self._logger = WorkflowRunner.get_logger()
         self._pool = None
         if nb_workers == -1:
             self._nb_workers = int((cpu_count() + 1) / 2)
+        elif nb_workers == AUTO_WORKERS:
+            self._nb_workers = cpu_count()
+            if max_load is None:
+                max_load = cpu_count()
+            if min_free_mem is None:
+                min_free_mem = int(psutil.virtual_memory().total * self.AUTO_MIN_FREE_MEM_RATIO)
         else:
             self._nb_workers = nb_workers
         self._free_workers = None
+        self._io_pool = None
+        if nb_io_workers is None:
+            self._nb_io_workers = self._nb_workers
+        else:
+            self._nb_io_workers = nb_io_workers
+        self._free_io_workers = None
+        if max_mem is None:
+            self._max_mem = psutil.virtual_memory().total
+        else:
+            self._max_mem = max_mem
+        self._free_mem = None
+        self._limits = limits or {}
+        self._running_per_key = {}
+        self._concurrency_keys = {}
         self._completed_processes = []
+        # Processes that have started or ended since the last export of the workflow
+        self._progress = []
+        if export_interval is None:
+            self._export_interval = self.EXPORT_INTERVAL
+        else:
+            self._export_interval = export_interval
+        self._report_server = report_server
+        self._cancelled = False
+        self._max_load = max_load
+        self._min_free_mem = min_free_mem
+        self._descendants_cpu = DescendantsCpu() if max_load is not None else None
+        self._host_sample = None
+        self._holding_back = False
+        self._create_jobserver = jobserver
+        self._durations = {}
+        self._keep_going = False
+        self._cross_shard_inputs = None
+        self._jobserver = None
+        self._job_tokens = set()
+        self._former_makeflags = None
+        self._listen = listen
+        self._authkey = authkey
+        self._remote = None
+        # Processes sent to remote workers : they don't use the resources of this machine
+        self._remote_processes = set()
+        # Notified by the pool's callbacks each time a process completes
+        self._completion = Condition()
 
     def start_process_in_background(self, process):
-        self.acquire_worker()
+        self.acquire_worker(process)
+        self.account_for_start(process)
 
         def process_run_callback(result):
             success, error_msg, signatures = result
+            if not success and self._cancelled:
+                error_msg = CANCELLED_PROCESS.format(error_detail=error_msg)
             process.set_end(success, error_msg)
-            self.release_worker()
-            self._completed_processes.append((process, signatures))
+            with self._completion:
+                self.release_job_token(process)
+                self.release_worker(process)
+                self._remote_processes.discard(process)
+                self._completed_processes.append((process, signatures))
+                self._completion.notify()
 
         process.set_start()
-        resp = self._pool.apply_async(run_process_without_exception, [process], callback = process_run_callback)
+        self._progress.append(process)
+        if process in self._remote_processes:
+            self._remote.run(ProcessTask(process), process.option('cpu'), process_run_callback)
+        elif self.is_io_bound(process):
+            # Runs in a thread of this process : no need to serialize the process nor to fork
+            self._io_pool.apply_async(run_process_without_exception, [process], callback=process_run_callback)
+        else:
+            self._pool.apply_async(run_process_in_worker, [ProcessTask(process)], callback=process_run_callback)
+
+    def start_batch_in_background(self, batch):
+        """ Runs several short processes one after the other on a single worker, in order to pay the cost of the
+        dispatch only once. Each process keeps its own logs, status and signatures
+        :param batch: processes that can run in a batch (see batchable()). The batch occupies the worker of the first
+        one
+        """
+        if len(batch) == 1:
+            return self.start_process_in_background(batch[0])
+        head = batch[0]
+        self.acquire_worker(head)
+        self.account_for_start(head)
+
+        def batch_run_callback(results):
+            with self._completion:
+                for process, result in zip(batch, results):
+                    if result is None:
+                        # A previous process of the batch has failed
+                        process.cancel_start()
+                        self._progress.append(process)
+                        continue
+                    (success, error_msg, signatures), start, end = result
+                    if not success and self._cancelled:
+                        error_msg = CANCELLED_PROCESS.format(error_detail=error_msg)
+                    process.set_start(start)
+                    process.set_end(success, error_msg, end)
+                    self._completed_processes.append((process, signatures))
+                self.release_job_token(head)
+                self.release_worker(head)
+                self._completion.notify()
+
+        for process in batch:
+            process.set_start()
+        self._progress.extend(batch)
+        tasks = [ProcessTask(process) for process in batch]
+        self._pool.apply_async(run_batch_in_worker, [tasks, self._keep_going], callback=batch_run_callback)
+
+    def batchable(self, process):
+        """ A process can join a batch if it was short in the previous run and if it only needs a worker """
+        duration = self._durations.get(process)
+        return duration is not None and duration < self.SHORT_PROCESS_DURATION and \
+            not self.is_io_bound(process) and self.weights(process) == (1, 0, 0) and \
+            not self.concurrency_keys(process)
+
+    def pop_batch(self, runnables):
+        """ Pops from the runnables the processes that can join a batch. Batches are small enough for the runnables
+        to spread over all the free workers. Only a few processes that can't join are looked at, so that it stays
+        cheap when short processes are rare
+        :return: a list of processes that can run in a batch
+        """
+        size = min(self.BATCH_SIZE, len(runnables) // max(self._free_workers, 1))
+        batch, others = [], []
+        total_duration = 0
+        while runnables and len(batch) < size and len(others) < self.BATCH_SIZE \
+                and total_duration < self.BATCH_DURATION:
+            process = runnables.pop()
+            if self.batchable(process):
+                batch.append(process)
+                total_duration += self._durations[process]
+            else:
+                others.append(process)
+        runnables.update(others)
+        return batch
+
+    def admit_processes(self, runnables):
+        """ Yields the runnable processes by order of priority, as long as their weights fit in the free resources.
+        A process that is too heavy for now, or that has reached a limit, is skipped in favour of other ones,
+        except an exclusive process : no other process starts until it can run alone.
+        The caller must acquire the workers of a process before asking for the next one
+        """
+        postponed = []
+        try:
+            while (self.workers_available() or self.io_workers_available() or self.remote_workers_available()) \
+                    and runnables:
+                process = runnables.pop()
+                if self.fits(process):
+                    yield process
+                elif self.fits_remotely(process):
+                    self._remote_processes.add(process)
+                    yield process
+                else:
+                    postponed.append(process)
+                    if process.option('exclusive'):
+                        break
+        finally:
+            # Also when the caller stops the admission
+            runnables.update(postponed)
 
     def start_processes_on_available_workers(self, runnables):
+        """ Starts the runnable processes that fit in the free resources (see admit_processes()), as long as the
+        machine is not saturated (see host_saturated())
+        :return: True if at least one process has started
+        """
         started_a_process = False
-        while self.workers_available() and runnables:
-            # No error
-            process = runnables.pop()
-            self.start_process_in_background(process)
-            started_a_process = True
+        if self.host_saturated():
+            return False
+        admitted = self.admit_processes(runnables)
+        try:
+            for process in admitted:
+                if not self.acquire_job_token(process):
+                    # The jobs of the programs run by the processes (or by the make tuttle belongs to) use all the
+                    # tokens. We'll try again when the main loop wakes up
+                    runnables.update([process])
+                    break
+                if self.batchable(process) and process not in self._remote_processes:
+                    self.start_batch_in_background([process] + self.pop_batch(runnables))
+                else:
+                    self.start_process_in_background(process)
+                started_a_process = True
+                if self.host_saturated():
+                    break
+        finally:
+            admitted.close()
         return started_a_process
 
+    def acquire_job_token(self, process):
+        """ Takes a token from the jobserver, if any, for a process that runs in a worker process
+        :return: True if the process can start
+        """
+        if self._jobserver is None or self.is_io_bound(process) or process in self._remote_processes:
+            return True
+        with self._completion:
+            if self._jobserver.try_acquire():
+                self._job_tokens.add(process)
+                return True
+        return False
+
+    def release_job_token(self, process):
+        if process in self._job_tokens:
+            self._job_tokens.remove(process)
+            self._jobserver.release()
+
+    def sample_host(self):
+        """ :return: the load of the machine and its available memory in bytes. The load is at least the number of
+        cpus our own processes have used since the previous sample, which shows the saturation they cause before the
+        load of the system does (eg the load average outside of Linux)
+        """
+        load = system_load()
+        if self._descendants_cpu is not None:
+            load = max(load, self._descendants_cpu.measure())
+        return load, psutil.virtual_memory().available
+
+    def account_for_start(self, process):
+        """ The processes started since the last measure don't show yet in the load nor in the memory, so we count
+        them on top of it """
+        if self._host_sample is not None:
+            workers, io_workers, mem = self.weights(process)
+            self._host_sample['load'] += workers
+            self._host_sample['available_mem'] -= mem
+
+    def host_saturated(self):
+        """ Tells whether new processes should wait because the load of the machine is over max_load or because the
+        memory is about to swap. The machine is measured again every HOST_SAMPLE_INTERVAL, while the main loop
+        waits for processes to complete. When nothing runs, a process can always start, so that the workflow goes on
+        :return: True if no process should start for now
+        """
+        if self._max_load is None and self._min_free_mem is None:
+            return False
+        if not self.active_workers():
+            return False
+        now = time()
+        if self._host_sample is None or now - self._host_sample['time'] >= self.HOST_SAMPLE_INTERVAL:
+            load, available_mem = self.sample_host()
+            self._host_sample = {'time': now, 'load': load, 'available_mem': available_mem}
+        load = self._host_sample['load']
+        available_mem = self._host_sample['available_mem']
+        saturated = (self._max_load is not None and load >= self._max_load) or \
+                    (self._min_free_mem is not None and available_mem < self._min_free_mem)
+        if saturated and not self._holding_back:
+            self._logger.info("The machine is busy (load {}, {} of free memory) : waiting before starting new "
+                              "processes".format(load, nice_size(max(available_mem, 0))))
+        self._holding_back = saturated
+        return saturated
+
+    def wait_for_completed_processes(self):
+        """ Blocks until at least one of the running processes has completed. Returns immediately if
+        a completed process is waiting to be handled.
+        :return: True if there are completed processes to handle
+        """
+        with self._completion:
+            if not self._completed_processes and (self.active_workers() or self.awaiting_inputs()):
+                self._completion.wait(self.COMPLETION_WAIT_TIMEOUT)
+            return len(self._completed_processes) > 0
+
+    def pop_completed_process(self):
+        with self._completion:
+            if self._completed_processes:
+                return self._completed_processes.pop(0)
+        return None, None
+
+    def pop_progress(self):
+        """ :return: the processes that have started or ended since the last call """
+        with self._completion:
+            progress, self._progress = self._progress, []
+        return progress
+
+    def export_progress(self, exporter):
+        """ Exports the processes that have started or ended since the last export, and shows them in the report
+        server """
+        progress = self.pop_progress()
+        exporter.notify(progress)
+        if self._report_server is not None:
+            self._report_server.notify(progress)
+
     def handle_completed_process(self, workflow, runnables, success_processes, failure_processes):
         handled_completed_process = False
-        while self._completed_processes:
-            completed_process, signatures = self._completed_processes.pop()
+        completed_process, signatures = self.pop_completed_process()
+        while completed_process:
+            self._progress.append(completed_process)
             if completed_process.success:
                 success_processes.append(completed_process)
                 workflow.update_signatures(signatures)
@@ -148,89 +510,276 @@ class WorkflowRunner:
             else:
                 failure_processes.append(completed_process)
             handled_completed_process = True
+            completed_process, signatures = self.pop_completed_process()
         return handled_completed_process
 
-    def run_parallel_workflow(self, workflow, keep_going=False):
-        """ Runs a workflow by running every process in the right order
+    def awaiting_inputs(self):
+        """ :return: True if processes wait for inputs created by other shards """
+        return self._cross_shard_inputs is not None and self._cross_shard_inputs.pending()
+
+    def handle_created_inputs(self, workflow, runnables, failure_processes):
+        """ Makes runnable the processes whose inputs have been created by other shards, and fails the ones whose
+        inputs will not be created
+        :return: True if some inputs have been created or have failed
+        """
+        if self._cross_shard_inputs is None:
+            return False
+        signatures, errors = self._cross_shard_inputs.poll()
+        if signatures:
+            workflow.update_signatures(signatures)
+            runnables.update(workflow.discover_processes_using(signatures.keys()))
+        for url, error_msg in errors.iteritems():
+            for process in workflow.find_resource(url).dependant_processes:
+                if workflow.is_selected(process) and process.start is None:
+                    process.set_start()
+                    process.set_end(False, error_msg)
+                    failure_processes.append(process)
+                    self._progress.append(process)
+        return len(signatures) > 0 or len(errors) > 0
+
+    def run_parallel_workflow(self, workflow, keep_going=False, durations=None, fail_fast=False,
+                              cross_shard_inputs=None):
+        """ Runs a workflow by running every process in the right order. When several processes can run, the one
+        at the head of the longest chain of processes to run starts first
+        :param fail_fast: when a process fails, stop the processes already running instead of waiting for them
+        :param durations: the durations of the processes in a previous run, if any (see scheduling.past_durations())
+        :param cross_shard_inputs: when the workflow is a shard, the inputs created by other shards
+        (see sharding.CrossShardInputs). The run goes on until they are all created or failed
         :return: success_processes, failure_processes :
         list of processes ended with success, list of processes ended with failure
         """
-        for process in workflow.iter_processes():
+        for process in workflow.iter_selected_processes():
             if process.start is None:
                 # Don't display logs if the process has already run
                 self._lt.follow_process(process.log_stdout, process.log_stderr, process.id)
 
         failure_processes, success_processes = [], []
+        self._durations = durations or {}
+        self._keep_going = keep_going
+        self._cross_shard_inputs = cross_shard_inputs
+        if self.awaiting_inputs():
+            self._logger.info("Waiting for {} resource(s) created by other shards :\n{}".format(
+                len(cross_shard_inputs.urls()), "\n".join("* {}".format(url) for url in cross_shard_inputs.urls())))
         with self._lt.trace_in_background():
-            runnables = workflow.runnable_processes()
+            estimations = estimated_durations(workflow, durations or {})
+            runnables = RunnableProcesses(remaining_critical_paths(workflow, estimations))
+            runnables.update(workflow.runnable_processes())
             self.init_workers()
+            exporter = BackgroundExporter(workflow, self._export_interval, reports=self._report_server is None)
             try:
                 while (keep_going or not failure_processes) and \
-                        (self.active_workers() or self._completed_processes or runnables):
-                    started_a_process = self.start_processes_on_available_workers(runnables)
+                        (self.active_workers() or self._completed_processes or runnables or self.awaiting_inputs()):
+                    # Handle completed processes first, so the processes they unlock can compete for the workers
                     handled_completed_process = self.handle_completed_process(workflow, runnables,
                                                                               success_processes, failure_processes)
-                    if handled_completed_process or started_a_process:
-                        workflow.export()
+                    handled_inputs = self.handle_created_inputs(workflow, runnables, failure_processes)
+                    started_a_process = False
+                    if keep_going or not failure_processes:
+                        started_a_process = self.start_processes_on_available_workers(runnables)
+                    if handled_completed_process or handled_inputs or started_a_process:
+                        self.export_progress(exporter)
                     else:
-                        sleep(0.1)
+                        self.wait_for_completed_processes()
                 if failure_processes and not keep_going:
                     self._logger.error("Process {} has failled".format(failure_processes[0].id))
-                    self._logger.warn("Waiting for all processes already started to complete")
+                    if fail_fast:
+                        self._logger.warn("Stopping all processes already started")
+                        self.cancel_running_processes()
+                    else:
+                        self._logger.warn("Waiting for all processes already started to complete")
                 while self.active_workers() or self._completed_processes:
                     if self.handle_completed_process(workflow, runnables, success_processes, failure_processes):
-                        workflow.export()
+                        self.export_progress(exporter)
                     else:
-                        sleep(0.1)
+                        self.wait_for_completed_processes()
             finally:
                 self.terminate_workers_and_clean_subprocesses()
-                self.mark_unfinished_processes_as_failure(workflow)
+                try:
+                    self.export_progress(exporter)
+                    exporter.close()
+                finally:
+                    self.mark_unfinished_processes_as_failure(workflow)
 
         return success_processes, failure_processes
 
+    def init_jobserver(self):
+        """ Creates a jobserver if asked, or joins the one of the make that runs tuttle. The programs run by the
+        processes inherit it from the MAKEFLAGS environment variable, which must be set before the workers start
+        """
+        if self._create_jobserver:
+            self._jobserver = JobServer.create(self._nb_workers)
+        else:
+            self._jobserver = JobServer.join(os.environ.get('MAKEFLAGS'))
+        self._job_tokens = set()
+        if self._jobserver is not None and self._jobserver.makeflags is not None:
+            self._former_makeflags = os.environ.get('MAKEFLAGS')
+            os.environ['MAKEFLAGS'] = self._jobserver.makeflags
+
+    def close_jobserver(self):
+        if self._jobserver is None:
+            return
+        self._jobserver.close()
+        if self._jobserver.makeflags is not None:
+            if self._former_makeflags is None:
+                del os.environ['MAKEFLAGS']
+            else:
+                os.environ['MAKEFLAGS'] = self._former_makeflags
+        self._jobserver = None
+        self._job_tokens = set()
+
     def init_workers(self):
+        self.init_jobserver()
         self._pool = Pool(self._nb_workers)
+        if self._listen is not None:
+            self._remote = RemoteWorkers(self._listen, self._authkey, self._completion, self._logger)
+            self._logger.info("Waiting for worker agents on {}:{}".format(*self._remote.address))
+        self._io_pool = ThreadPool(self._nb_io_workers)
+        self.free_all_resources()
+
+    def free_all_resources(self):
         self._free_workers = self._nb_workers
+        self._free_io_workers = self._nb_io_workers
+        self._free_mem = self._max_mem
+        self._running_per_key = {}
+        self._remote_processes = set()
+        self._cancelled = False
+        self._host_sample = None
+        self._holding_back = False
+
+    def cancel_running_processes(self):
+        """ Stops the processes running in the worker processes, by terminating what the workers have started
+        (eg the shell of a shell process). The workers report the failure of their process and stay available.
+        Processes running in threads (see is_io_bound()) can't be interrupted : they run to the end
+        """
+        self._cancelled = True
+        terminate_pool_subprocesses(self._pool)
+        if self._remote is not None:
+            self._remote.cancel()
 
     def terminate_workers_and_clean_subprocesses(self):
         direct_procs = set(psutil.Process().children())
         all_procs = set(psutil.Process().children(recursive=True))
         sub_procs = all_procs - direct_procs
 
+        if self._remote is not None:
+            self._remote.close()
+            self._remote = None
         # Terminate cleanly direct procs instanciated by multiprocess
         self._pool.terminate()
         self._pool.join()
+        # Threads can't be killed. They are daemons, so we only wait for them if they have nothing left to do
+        self._io_pool.close()
+        if self._free_io_workers == self._nb_io_workers:
+            self._io_pool.join()
 
         # Then terminate subprocesses that have not been terminated
-        for p in sub_procs:
-            try:
-                p.terminate()
-            except NoSuchProcess:
-                pass
-        gone, still_alive = psutil.wait_procs(sub_procs, timeout=2)
-        for p in still_alive:
-            p.kill()
-
-    def acquire_worker(self):
-        assert self._free_workers > 0
-        self._free_workers -= 1
+        terminate_processes(sub_procs)
+        self.close_jobserver()
 
-    def release_worker(self):
-        self._free_workers += 1
+    @staticmethod
+    def is_io_bound(process):
+        """ Processes of processors that spend their time waiting (eg for a database or for the network) run in
+        threads instead of worker processes. An exclusive process always runs in a worker process """
+        return getattr(process.processor, 'io_bound', False) and not process.option('exclusive')
+
+    def weights(self, process):
+        """ The share of the workers, of the I/O workers and of the memory a process needs to run. Weights are capped
+        to the capacity, so that any process can run eventually. An exclusive process takes everything
+        :return: number of workers, number of I/O workers, memory in bytes
+        """
+        if process is None:
+            return 1, 0, 0
+        if process in self._remote_processes:
+            return 0, 0, 0
+        if process.option('exclusive'):
+            return self._nb_workers, self._nb_io_workers, self._max_mem
+        mem = min(process.option('mem'), self._max_mem)
+        if self.is_io_bound(process):
+            return 0, 1, mem
+        return min(process.option('cpu'), self._nb_workers), 0, mem
+
+    def concurrency_keys(self, process):
+        """ The keys of the limits that apply to a process : the name of its processor, and the target of the
+        processor if it has one (the database or the host it connects to)
+        :return: the list of the keys that have a limit
+        """
+        if process is None:
+            return []
+        if process not in self._concurrency_keys:
+            keys = [process.processor.name]
+            if hasattr(process.processor, 'concurrency_target'):
+                target = process.processor.concurrency_target(process)
+                if target:
+                    keys.append(target)
+            self._concurrency_keys[process] = [key for key in keys if key in self._limits]
+        return self._concurrency_keys[process]
+
+    def fits(self, process):
+        workers, io_workers, mem = self.weights(process)
+        if workers > self._free_workers or io_workers > self._free_io_workers or mem > self._free_mem:
+            return False
+        for key in self.concurrency_keys(process):
+            if self._running_per_key.get(key, 0) >= self._limits[key]:
+                return False
+        return True
+
+    def fits_remotely(self, process):
+        """ Processes that can run on a remote worker : the ones that need neither to run alone, nor to run in a
+        thread of this process (see is_io_bound()) """
+        if self._remote is None or process.option('exclusive') or self.is_io_bound(process):
+            return False
+        if not self._remote.available(process.option('cpu')):
+            return False
+        for key in self.concurrency_keys(process):
+            if self._running_per_key.get(key, 0) >= self._limits[key]:
+                return False
+        return True
+
+    def acquire_worker(self, process=None):
+        workers, io_workers, mem = self.weights(process)
+        keys = self.concurrency_keys(process)
+        with self._completion:
+            assert self._free_workers >= workers and self._free_io_workers >= io_workers and self._free_mem >= mem
+            self._free_workers -= workers
+            self._free_io_workers -= io_workers
+            self._free_mem -= mem
+            for key in keys:
+                self._running_per_key[key] = self._running_per_key.get(key, 0) + 1
+
+    def release_worker(self, process=None):
+        workers, io_workers, mem = self.weights(process)
+        keys = self.concurrency_keys(process)
+        with self._completion:
+            self._free_workers += workers
+            self._free_io_workers += io_workers
+            self._free_mem += mem
+            for key in keys:
+                self._running_per_key[key] -= 1
+
+    def nb_workers(self):
+        return self._nb_workers
 
     def workers_available(self):
         return self._free_workers
 
+    def io_workers_available(self):
+        return self._free_io_workers
+
+    def remote_workers_available(self):
+        return self._remote is not None and self._remote.available()
+
     def active_workers(self):
-        return self._free_workers != self._nb_workers
+        return self._free_workers != self._nb_workers or self._free_io_workers != self._nb_io_workers or \
+            (self._remote is not None and self._remote.nb_running() > 0)
 
     @staticmethod
-    def mark_unfinished_processes_as_failure(workflow):
+    def mark_unfinished_processes_as_failure(workflow, export=True):
         for process in workflow.iter_processes():
             if process.start and not process.end:
                 error_msg = "This process was aborted"
                 process.set_end(False, error_msg)
-        workflow.export()
+        if export:
+            workflow.export()
 
     @staticmethod
     def print_preprocess_header(process, logger):
@@ -267,5 +816,5 @@ class TuttleEnv(EnvVar):
     Adds the 'TUTTLE_ENV' environment variable so subprocesses can find the .tuttle directory.
     """
     def __init__(self):
-        directory = abspath('.tuttle')
+        directory = abspath(TuttleDirectories.tuttle_dir())
         super(TuttleEnv, self).__init__('TUTTLE_ENV', directory)